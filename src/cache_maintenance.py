@@ -0,0 +1,191 @@
+# --- キャッシュの整理 ---
+# 共有サムネイルキャッシュと生画素タイルキャッシュから不要なデータを削除し、ファイルを圧縮する
+# - 設定違い: 現在のサムネイルサイズ・形式・品質と一致しないエントリ（二度と読まれない）
+# - 孤立: ライブラリのフォルダ・指定フォルダのどのファイルのハッシュとも一致せず、
+#   CACHE_ORPHAN_GRACE_DAYS 日以上使われていないエントリ
+# - 上限超過: 共有キャッシュの上限サイズを超えた分を最終アクセスの古い順に削除
+# - タイルファイル: 長く使われていないもの・合計の上限を超えた分を古い順に削除
+# 削除は少しずつ行い、圧縮は incremental_vacuum を使うため、アプリの表示を止めずに実行できる
+# アプリの「キャッシュ整理」ボタン、またはコマンドラインから実行する:
+#   python src/cache_maintenance.py [--dry-run] [--vacuum] [フォルダ ...]
+
+import os
+import json
+import time
+import constants
+import media_fs
+import thumbnail_cache
+from thumbnail_cache import SharedThumbnailCache
+from library_catalog import LibraryCatalog
+
+_DAY = 24 * 60 * 60
+
+
+class MaintenanceReport:
+    """
+    キャッシュ整理の結果
+    """
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.scanned = 0  # 確認した共有キャッシュのエントリ数
+        self.stale = 0  # 設定違いのエントリ数
+        self.orphaned = 0  # 孤立したエントリ数
+        self.entry_bytes = 0  # 削除したエントリのデータサイズ
+        self.evicted_bytes = 0  # 上限超過で削除したデータサイズ
+        self.compacted_bytes = 0  # 圧縮で縮んだDBファイルのサイズ
+        self.tile_files = 0  # 削除したタイルファイル数
+        self.tile_bytes = 0  # 削除したタイルファイルのサイズ
+        self.orphan_check_skipped = []  # タグJSONを読めず、孤立判定をしなかったフォルダ
+
+    @property
+    def reclaimed_bytes(self):
+        """ディスクから解放したバイト数（DBの圧縮分 + タイルファイル）"""
+        return self.compacted_bytes + self.tile_bytes
+
+    def format(self):
+        """結果を複数行の文字列にする"""
+        mb = 1024 * 1024
+        action = "削除対象" if self.dry_run else "削除"
+        lines = [
+            f"共有キャッシュ: {self.scanned} 件中 設定違い {self.stale} 件・孤立 {self.orphaned} 件を{action}"
+            f"（{self.entry_bytes / mb:.1f} MB）",
+            f"上限超過による{action}: {self.evicted_bytes / mb:.1f} MB",
+            f"タイルファイル: {self.tile_files} 件を{action}（{self.tile_bytes / mb:.1f} MB）",
+        ]
+        if not self.dry_run:
+            lines.append(f"解放したディスク容量: {self.reclaimed_bytes / mb:.1f} MB")
+        if self.orphan_check_skipped:
+            lines.append("タグJSONを読めないため孤立判定をしなかったフォルダ: " + ", ".join(self.orphan_check_skipped))
+        return "\n".join(lines)
+
+
+def run_maintenance(folders=(), dry_run=False, full_vacuum=False):
+    """
+    キャッシュを整理する
+
+    Args:
+        folders: 参照を確認するフォルダ（ライブラリに登録済みのフォルダは自動で含める）
+        dry_run: True の場合は削除せず、削除対象を数えるだけ
+        full_vacuum: 増分圧縮に対応していない既存のDBを VACUUM で作り直す（他のインスタンスの書き込みが待たされる）
+
+    Returns:
+        MaintenanceReport: 整理の結果
+    """
+    report = MaintenanceReport(dry_run)
+    shared_cache = thumbnail_cache.get_shared_cache()
+    if shared_cache is not None:
+        referenced = _referenced_hashes(_known_folders(folders), report)
+        _collect_shared_cache(shared_cache, referenced, report, full_vacuum)
+    _collect_tile_files(report)
+    return report
+
+
+# ===============================
+# 内部関数（プライベート）
+# ===============================
+
+def _known_folders(folders):
+    """指定フォルダとライブラリに登録済みのフォルダ"""
+    result = [os.path.abspath(f) for f in folders if f]
+    for root in LibraryCatalog().roots:
+        if root not in result:
+            result.append(root)
+    return result
+
+
+def _referenced_hashes(folders, report):
+    """
+    フォルダのタグJSONに記録されたファイルハッシュ（16進文字列）の集合
+    1つでも読めないフォルダがあれば、誤って削除しないよう孤立判定をしない（Noneを返す）
+    """
+    referenced = set()
+    for folder in folders:
+        try:
+            with open(media_fs.tags_json_path(folder), "r", encoding="utf-8") as f:
+                tag_map = json.load(f)
+        except (OSError, ValueError):
+            report.orphan_check_skipped.append(folder)
+            continue
+        referenced.update(entry["file_hash"] for entry in tag_map.values() if entry.get("file_hash"))
+    return None if report.orphan_check_skipped else referenced
+
+
+def _collect_shared_cache(shared_cache, referenced, report, full_vacuum):
+    """共有キャッシュの設定違い・孤立エントリを削除し、上限を適用して圧縮"""
+    # キーは「フィンガープリント:サムネイル設定[:storyboardN]」、フィンガープリントは「ハッシュ-ファイルサイズ」
+    current_suffixes = {
+        SharedThumbnailCache.make_key(""),
+        SharedThumbnailCache.make_storyboard_key(""),
+    }
+    orphan_before = time.time() - constants.CACHE_ORPHAN_GRACE_DAYS * _DAY
+
+    doomed = []
+    for key, size, last_access in shared_cache.entries():
+        report.scanned += 1
+        fingerprint, sep, settings = key.partition(":")
+        if sep + settings not in current_suffixes:
+            report.stale += 1
+        elif referenced is not None and last_access < orphan_before \
+                and fingerprint.rsplit("-", 1)[0] not in referenced:
+            report.orphaned += 1
+        else:
+            continue
+        doomed.append(key)
+        report.entry_bytes += size
+
+    if report.dry_run:
+        # evict と同じ基準で、削除後に残る分が上限を超えるかを見積もる
+        remaining = shared_cache.total_bytes() - report.entry_bytes
+        if remaining > shared_cache.max_bytes:
+            report.evicted_bytes = remaining - int(shared_cache.max_bytes * constants.SHARED_THUMBNAIL_CACHE_EVICT_RATIO)
+        return
+
+    shared_cache.delete(doomed)
+    report.evicted_bytes = shared_cache.evict()
+    report.compacted_bytes = shared_cache.compact(full=full_vacuum)
+
+
+def _collect_tile_files(report):
+    """長く使われていないタイルファイルと、合計の上限を超えた分を使われていない順に削除"""
+    tile_dir = os.path.join(thumbnail_cache.get_user_cache_dir(), constants.RAW_TILE_CACHE_DIR)
+    try:
+        names = [n for n in os.listdir(tile_dir) if n.endswith(".tiles")]
+    except OSError:
+        return
+
+    files = []
+    for name in names:
+        path = os.path.join(tile_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+    files.sort()  # 使われていない順
+
+    expire_before = time.time() - constants.RAW_TILE_CACHE_MAX_AGE_DAYS * _DAY
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if mtime >= expire_before and total <= constants.RAW_TILE_CACHE_MAX_BYTES:
+            break
+        if not report.dry_run:
+            try:
+                os.remove(path)
+            except OSError as e:
+                # 表示中のフォルダのファイルは削除できない場合がある（Windows）
+                print(f"タイルファイルを削除できません: {path}: {e}")
+                continue
+        total -= size
+        report.tile_files += 1
+        report.tile_bytes += size
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="サムネイルキャッシュを整理する")
+    parser.add_argument("folders", nargs="*", help="参照を確認するフォルダ（ライブラリ登録済みのフォルダは自動で含める）")
+    parser.add_argument("--dry-run", action="store_true", help="削除せずに削除対象を表示する")
+    parser.add_argument("--vacuum", action="store_true", help="増分圧縮に対応していない既存のDBを作り直す")
+    args = parser.parse_args()
+    print(run_maintenance(args.folders, dry_run=args.dry_run, full_vacuum=args.vacuum).format())
@@ -18,7 +18,7 @@ class DateRangeManager:
         
         Args:
             parent_frame: 日付コントロールを配置するフレーム
-            image_tag_map: 画像タグマップ辞書（指定時は自動で日付範囲を設定）
+            image_tag_map: 画像タグマップ（MediaStore、指定時は自動で日付範囲を設定）
             on_date_change_callback: 日付変更時のコールバック関数
         """
         self.parent_frame = parent_frame
@@ -173,16 +173,10 @@ class DateRangeManager:
         画像タグマップから日付範囲を自動設定
         
         Args:
-            image_tag_map: 画像タグマップ辞書
+            image_tag_map: 画像タグマップ（MediaStore）
         """
-        import datetime
-        
-        createday_list = [
-            datetime.datetime.strptime(image_tag_map[f]["createday"], "%Y-%m-%d %H:%M:%S")
-            for f in image_tag_map
-            if "createday" in image_tag_map[f]
-        ]
-        self.set_date_range_from_data(createday_list)
+        bounds = image_tag_map.date_bounds()
+        self.set_date_range_from_data(list(bounds) if bounds else [])
     
     def get_from_date(self):
         """開始日を取得"""
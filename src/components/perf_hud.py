@@ -0,0 +1,179 @@
+# --- パフォーマンスHUD ---
+# サムネイル一覧の右上に、metrics に集められた計測値を重ねて表示するパネル
+# - 絞り込み・描画時間、ウィジェット数、メモリキャッシュのサイズとヒット率、読み込み待ちの件数、
+#   スキャンの速度、プロセスのメモリ使用量（RSS）
+# - 表示中だけ PERF_HUD_INTERVAL_MS ごとに更新する（非表示の間は計測値を読み出さない）
+# - 「書き出し」で計測値をJSONファイルに保存し、不具合報告に添付できる
+
+import datetime
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+import constants
+import metrics
+
+
+class PerfHud:
+    """
+    計測値のオーバーレイパネル
+    """
+
+    def __init__(self, parent, visible=False):
+        """
+        初期化
+
+        Args:
+            parent: パネルを重ねて表示するフレーム（右上に配置）
+            visible: 最初から表示するか
+        """
+        self.parent = parent
+        self.visible = False
+        self._job = None
+        root = parent.winfo_toplevel()
+        # ウィンドウ全体のウィジェット数（HUDの更新時にだけ数える）
+        metrics.set_gauge("ui.widgets", lambda: _count_widgets(root))
+
+        self.frame = tk.Frame(parent, background=constants.PERF_HUD_BACKGROUND_COLOR, padx=8, pady=6)
+        self.text_var = tk.StringVar()
+        tk.Label(
+            self.frame, textvariable=self.text_var, justify="left", font="TkFixedFont",
+            background=constants.PERF_HUD_BACKGROUND_COLOR, foreground=constants.PERF_HUD_FOREGROUND_COLOR,
+        ).pack(side="top", anchor="w")
+        buttons = tk.Frame(self.frame, background=constants.PERF_HUD_BACKGROUND_COLOR)
+        buttons.pack(side="top", anchor="e", pady=(4, 0))
+        ttk.Button(buttons, text="リセット", command=lambda: self.reset()).pack(side="left", padx=2)
+        ttk.Button(buttons, text="書き出し", command=lambda: self.export()).pack(side="left", padx=2)
+
+        if visible:
+            self.show()
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def show(self):
+        """パネルを表示して定期更新を開始"""
+        self.visible = True
+        self.frame.place(relx=1.0, x=-24, y=8, anchor="ne")
+        self.frame.lift()
+        self._refresh()
+
+    def hide(self):
+        """パネルを隠して定期更新を停止"""
+        self.visible = False
+        self.frame.place_forget()
+        if self._job is not None:
+            self.frame.after_cancel(self._job)
+            self._job = None
+
+    def toggle(self):
+        """
+        表示・非表示を切り替え
+
+        Returns:
+            bool: 切り替え後に表示しているか
+        """
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+        return self.visible
+
+    def reset(self):
+        """累計の計測値（ヒット率・平均時間など）を初期化"""
+        metrics.reset()
+        self._refresh()
+
+    def export(self):
+        """計測値を保存先を選んでJSONファイルに書き出す"""
+        path = filedialog.asksaveasfilename(
+            title="計測値の書き出し",
+            defaultextension=".json",
+            initialfile=f"perf_metrics_{datetime.datetime.now():%Y%m%d_%H%M%S}.json",
+            filetypes=[("JSON", "*.json")],
+        )
+        if not path:
+            return
+        if metrics.export(path):
+            messagebox.showinfo(messagebox.INFO, f"計測値を書き出しました: {path}")
+        else:
+            messagebox.showerror(messagebox.ERROR, "計測値の書き出しに失敗しました。")
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _refresh(self):
+        """計測値を読み出して表示を更新（表示中は定期的に呼ばれる）"""
+        self._job = None
+        if not self.visible or not self.frame.winfo_exists():
+            return
+        self.text_var.set("\n".join(format_lines(metrics.snapshot())))
+        self._job = self.frame.after(constants.PERF_HUD_INTERVAL_MS, self._refresh)
+
+
+def format_lines(snapshot):
+    """
+    計測値をHUDの表示行に整形
+
+    Args:
+        snapshot: metrics.snapshot() の戻り値
+
+    Returns:
+        list: 表示する文字列のリスト
+    """
+    gauges = snapshot["gauges"]
+    timers = snapshot["timers"]
+
+    def timing(name):
+        stats = timers.get(name)
+        if stats is None:
+            return "-"
+        return f"{stats['last_ms']:.1f} ms（平均 {stats['avg_ms']:.1f}, {stats['count']}回）"
+
+    def number(name):
+        value = gauges.get(name)
+        return "-" if value is None else f"{value:,}"
+
+    lines = [
+        f"絞り込み      {timing('view.filter')}",
+        f"描画          {timing('view.render')}",
+        f"ウィジェット  {number('ui.widgets')}（セル {number('view.cells')}, 画像 {number('view.photo_images')}）",
+    ]
+
+    hit_rate = metrics.hit_rate(snapshot["counters"], "thumbnail_cache")
+    cache_bytes = gauges.get("thumbnail_cache.bytes")
+    max_bytes = gauges.get("thumbnail_cache.max_bytes")
+    cache_text = "-" if cache_bytes is None else f"{_mb(cache_bytes)} / {_mb(max_bytes)} MB"
+    lines.append(
+        f"メモリキャッシュ {cache_text}  {number('thumbnail_cache.entries')}件  "
+        f"ヒット率 {'-' if hit_rate is None else f'{hit_rate * 100:.1f}%'}"
+    )
+    lines.append(f"読み込み待ち  サムネイル {number('thumbnail.pending')}  "
+                 f"ストーリーボード {number('storyboard.pending')}")
+    lines.append(f"読み込み      {timing('thumbnail.load')}")
+    lines.append(f"生成          {timing('thumbnail.generate')}")
+
+    rate = gauges.get("scan.rate")
+    scan_text = "-" if rate is None else (
+        f"{rate:.0f} 件/秒（{number('scan.done')}/{number('scan.total')}）"
+    )
+    lines.append(f"スキャン      {scan_text}")
+    rss = snapshot["rss_bytes"]
+    lines.append(f"RSS           {'-' if rss is None else _mb(rss) + ' MB'}")
+    return lines
+
+
+def _mb(size):
+    """バイト数をMB単位の文字列にする"""
+    return "-" if size is None else f"{size / 2**20:.1f}"
+
+
+def _count_widgets(widget):
+    """ウィジェットとその子孫の数"""
+    count = 0
+    pending = [widget]
+    while pending:
+        current = pending.pop()
+        count += 1
+        pending.extend(current.winfo_children())
+    return count
@@ -0,0 +1,201 @@
+# --- プレビューウィンドウ ---
+# 画像をアプリ内で大きく表示する。左右キーで絞り込み結果の順に前後の画像へ移動
+# - まずJPEGのドラフトモードで粗くデコードして即座に表示し、フル品質のデコード完了後に差し替える
+# - 前後の画像はバックグラウンドで先読みし、デコード済み画像はLRUキャッシュに保持する
+
+import os
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageTk
+import constants
+import logic
+
+
+class PreviewWindow(tk.Toplevel):
+    """
+    フルサイズのプレビューを表示するウィンドウ
+    """
+
+    def __init__(self, master, paths, index, image_cache, on_close=None):
+        """
+        初期化
+
+        Args:
+            master: 親ウィジェット
+            paths: 表示順のファイルパスのリスト（絞り込み結果の順）
+            index: 最初に表示する位置
+            image_cache: デコード済み画像のキャッシュ（MemoryThumbnailCache、ウィンドウを閉じても保持）
+            on_close: ウィンドウを閉じた時のコールバック
+        """
+        super().__init__(master)
+        self.geometry(constants.PREVIEW_WINDOW_SIZE)
+        self.configure(background=constants.PREVIEW_BACKGROUND_COLOR)
+        self.on_close = on_close
+
+        self.paths = list(paths)
+        self.index = index
+        self.image_cache = image_cache
+        # デコードは画面サイズを上限にする（ウィンドウを最大化してもフル品質で表示できる）
+        self.max_size = (self.winfo_screenwidth(), self.winfo_screenheight())
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=constants.PREVIEW_WORKERS, thread_name_prefix="preview-decoder"
+        )
+        self._futures = {}  # ファイルパス: デコード中のFuture
+        self._shown = None  # 表示中の (ファイルパス, フル品質かどうか)
+        self._photo = None  # 表示中のPhotoImage（参照保持用）
+        self._resize_job = None
+        self._closed = False
+
+        self.label = tk.Label(self, background=constants.PREVIEW_BACKGROUND_COLOR,
+                              foreground="#ffffff")
+        self.label.pack(fill="both", expand=True)
+
+        self.bind("<Left>", lambda e: self.show_relative(-1))
+        self.bind("<Right>", lambda e: self.show_relative(1))
+        self.bind("<Escape>", lambda e: self.close())
+        self.bind("<Configure>", self._on_configure)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.after(constants.PREVIEW_POLL_INTERVAL_MS, self._poll_decoded)
+        self.show(index)
+        self.focus_set()
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def set_paths(self, paths, index):
+        """表示順のリストを差し替えて指定位置を表示（ウィンドウ表示中に再度ダブルクリックされた場合）"""
+        self.paths = list(paths)
+        self.show(index)
+        self.lift()
+        self.focus_set()
+
+    def show(self, index):
+        """
+        指定位置の画像を表示
+        - キャッシュにあれば即座にフル品質で表示
+        - なければドラフトを表示し、フル品質のデコードをバックグラウンドで開始
+        - 前後の画像の先読みを開始し、不要になった先読みは取り消す
+        """
+        if not self.paths:
+            return
+        self.index = max(0, min(index, len(self.paths) - 1))
+        path = self.paths[self.index]
+        self.title(f"{os.path.basename(path)} ({self.index + 1}/{len(self.paths)})")
+
+        if path in self.image_cache:
+            self._display(path, self.image_cache[path], full=True)
+        else:
+            draft = logic.load_preview_image(path, self._target_size(), draft=True)
+            if draft is not None:
+                self._display(path, draft, full=False)
+            else:
+                self._display_message(path, "読み込み中...")
+            self._request_decode(path)
+
+        self._prefetch_neighbors()
+
+    def show_relative(self, offset):
+        """現在の位置から offset 件移動して表示"""
+        self.show(self.index + offset)
+
+    def close(self):
+        """ウィンドウを閉じる（未開始のデコードは取り消す）"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
+        if self.on_close:
+            self.on_close()
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _target_size(self):
+        """画像を表示する領域のサイズ"""
+        width = self.label.winfo_width()
+        height = self.label.winfo_height()
+        if width <= 1 or height <= 1:
+            # 初回表示前はジオメトリ指定のサイズ
+            width, height = (int(v) for v in constants.PREVIEW_WINDOW_SIZE.split("x"))
+        return width, height
+
+    def _request_decode(self, path):
+        """フル品質のデコードをバックグラウンドで開始（デコード中・キャッシュ済みなら何もしない）"""
+        if path in self.image_cache or path in self._futures:
+            return
+        self._futures[path] = self._executor.submit(logic.load_preview_image, path, self.max_size)
+
+    def _prefetch_neighbors(self):
+        """前後の画像を先読みし、先読み範囲から外れた未開始のデコードを取り消す"""
+        radius = constants.PREVIEW_PREFETCH_RADIUS
+        wanted = {self.paths[self.index]}
+        for offset in range(1, radius + 1):
+            for idx in (self.index + offset, self.index - offset):
+                if 0 <= idx < len(self.paths):
+                    wanted.add(self.paths[idx])
+                    self._request_decode(self.paths[idx])
+
+        for path in [p for p in self._futures if p not in wanted]:
+            if self._futures[path].cancel():
+                del self._futures[path]
+
+    def _poll_decoded(self):
+        """デコードが完了した画像をキャッシュに入れ、表示中の画像であればフル品質に差し替え"""
+        if self._closed:
+            return
+        for path in [p for p, f in self._futures.items() if f.done()]:
+            future = self._futures.pop(path)
+            if future.cancelled():
+                continue
+            img = future.result()
+            if img is None:
+                if path == self.paths[self.index]:
+                    self._display_message(path, "表示できないファイルです")
+                continue
+            self.image_cache[path] = img
+            if path == self.paths[self.index]:
+                self._display(path, img, full=True)
+        self.after(constants.PREVIEW_POLL_INTERVAL_MS, self._poll_decoded)
+
+    def _display(self, path, img, full):
+        """画像を表示領域に収まるよう縮小して表示"""
+        width, height = self._target_size()
+        scale = min(width / img.width, height / img.height, 1.0 if full else float("inf"))
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        if size != img.size:
+            # ドラフトは拡大されるので軽い補間、フル品質は縮小時の画質を優先
+            resample = Image.Resampling.LANCZOS if full else Image.Resampling.BILINEAR
+            img = img.resize(size, resample, reducing_gap=2.0 if full else None)
+        self._photo = ImageTk.PhotoImage(img)
+        self.label.configure(image=self._photo, text="")
+        self._shown = (path, full)
+
+    def _display_message(self, path, text):
+        """画像の代わりにメッセージを表示"""
+        self._photo = None
+        self.label.configure(image="", text=text)
+        self._shown = (path, False)
+
+    def _on_configure(self, event):
+        """ウィンドウサイズの変更時、少し待ってから表示サイズに合わせて再描画"""
+        if event.widget is not self or self._closed:
+            return
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(constants.PREVIEW_RESIZE_DELAY_MS, self._redraw)
+
+    def _redraw(self):
+        """キャッシュ済みの画像を現在のサイズで再描画"""
+        self._resize_job = None
+        if self._shown is None:
+            return
+        path, full = self._shown
+        if full and path in self.image_cache:
+            self._display(path, self.image_cache[path], full=True)
@@ -24,6 +24,9 @@ class TagButtonManager:
         self.all_tags = all_tags
         self.on_tag_toggle_callback = on_tag_toggle_callback
         self.check_vars = {}
+        self.tag_buttons = {}  # タグ名: Checkbutton
+        self.none_tag_button = None  # 「タグなし」のCheckbutton
+        self._button_texts = {}  # タグ名: 表示中のラベル（変更のないボタンは再設定しない）
         self.create_tag_buttons()
 
     def create_tag_buttons(self):
@@ -35,6 +38,8 @@ class TagButtonManager:
         
         # タグフレームの初期化 
         self.check_vars = {}
+        self.tag_buttons = {}
+        self._button_texts = {}
         
         # タグフレームの最初の行に「タグなし」のボタンを配置
         self._create_none_tag_button()
@@ -61,21 +66,39 @@ class TagButtonManager:
         )
         btn.grid(row=0, column=0, padx=5, pady=2, sticky="w")
         self.check_vars[constants.NONE_TAG_TEXT] = var
+        self.none_tag_button = btn
     
     def _create_tag_buttons(self):
         """各タグのボタンを作成"""
         col = 1
         for tag, cnt in self.all_tags.items():
-            var = tk.BooleanVar()
-            btn = ttk.Checkbutton(
-                self.tag_frame, 
-                text=f"{tag} ({cnt})", 
-                variable=var, 
-                command=lambda t=tag: self._on_tag_toggle(t)
-            )
-            btn.grid(row=0, column=col, padx=5, pady=2, sticky="w")
-            self.check_vars[tag] = var
+            self._create_tag_button(tag, cnt, col)
             col += 1
+
+    def _create_tag_button(self, tag, cnt, col):
+        """
+        1件分のタグボタンを作成して配置
+        
+        Args:
+            tag: タグ名
+            cnt: タグの件数
+            col: 配置する列
+        """
+        var = tk.BooleanVar()
+        btn = ttk.Checkbutton(
+            self.tag_frame, 
+            text=f"{tag} ({cnt})", 
+            variable=var, 
+            command=lambda t=tag: self._on_tag_toggle(t)
+        )
+        btn.grid(row=0, column=col, padx=5, pady=2, sticky="w")
+        self.check_vars[tag] = var
+        self.tag_buttons[tag] = btn
+
+    def _regrid_tag_buttons(self):
+        """タグボタンを現在の並び順で配置し直す"""
+        for col, btn in enumerate(self.tag_buttons.values(), start=1):
+            btn.grid_configure(row=0, column=col)
     
     def _on_tag_toggle(self, tag=None):
         """
@@ -140,3 +163,55 @@ class TagButtonManager:
         """
         self.all_tags = new_all_tags
         self.create_tag_buttons()
+
+    def apply_tag_count_changes(self, changed_tags):
+        """
+        件数が変わったタグのボタンだけを更新（選択状態は保持）
+        - 件数が変わったタグはラベルを書き換え
+        - 新しく出現したタグはボタンを追加
+        - 件数が0になったタグはボタンを削除
+        
+        Args:
+            changed_tags: 件数が変わった可能性のあるタグ名の集合
+        """
+        layout_changed = False
+        for tag in changed_tags:
+            cnt = self.all_tags.get(tag, 0)
+            btn = self.tag_buttons.get(tag)
+            if cnt > 0 and btn is not None:
+                self._set_button_text(tag, btn, f"{tag} ({cnt})")
+            elif cnt > 0:
+                self._create_tag_button(tag, cnt, len(self.tag_buttons) + 1)
+            elif btn is not None:
+                btn.destroy()
+                del self.tag_buttons[tag]
+                del self.check_vars[tag]
+                self._button_texts.pop(tag, None)
+                layout_changed = True
+
+        if layout_changed:
+            self._regrid_tag_buttons()
+        self.tag_frame.update_idletasks()
+
+    def update_facet_counts(self, facet_counts):
+        """
+        現在の絞り込み結果に対するファセット件数でボタンのラベルを更新
+        - 各タグの件数は「そのタグをさらに選択した場合に残る件数」
+        - ラベルが変わるボタンだけを再設定
+        
+        Args:
+            facet_counts: タグ名: 件数 の辞書（TagQueryIndex.facet_counts の戻り値）
+        """
+        for tag, btn in self.tag_buttons.items():
+            self._set_button_text(tag, btn, f"{tag} ({facet_counts.get(tag, 0)})")
+        if self.none_tag_button is not None:
+            none_count = facet_counts.get(constants.NONE_TAG_TEXT, 0)
+            self._set_button_text(
+                constants.NONE_TAG_TEXT, self.none_tag_button, f"{constants.NONE_TAG_TEXT} ({none_count})"
+            )
+
+    def _set_button_text(self, tag, btn, text):
+        """ラベルが変わる場合のみボタンのテキストを設定"""
+        if self._button_texts.get(tag) != text:
+            btn.configure(text=text)
+            self._button_texts[tag] = text
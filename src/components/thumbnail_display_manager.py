@@ -2,15 +2,43 @@
 # サムネイルの表示・フィルタリング・選択状態の管理を担当
 
 import os
-import pandas as pd
+import bisect
+import collections
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 import constants
 import logic
+import media_fs
+import metrics
+import tag_query
+from thumbnail_scheduler import ThumbnailScheduler
+from scroll_prefetcher import ScrollPrefetcher
+from selection_model import RangeSelection, contains_position
+from thumbnail_cache import MemoryThumbnailCache, open_tile_cache
+from components.preview_window import PreviewWindow
 from tkinter import messagebox
 
 
+class TimelineSection:
+    """
+    タイムライン表示の1区間（日または月）
+    - 折りたたまれた区間・先読み範囲から離れた区間はセルを作らず、同じ高さの空のフレームで場所だけ確保する
+    """
+
+    __slots__ = ("key", "label", "records", "start", "frame", "header", "body", "materialized")
+
+    def __init__(self, key, label, records):
+        self.key = key  # 区間の開始日（datetime.date）
+        self.label = label  # 見出しの文字列
+        self.records = records  # 区間内のレコード（作成日時順）
+        self.start = 0  # 先頭のレコードの表示順の位置
+        self.frame = None  # 見出しとセル部分をまとめるフレーム
+        self.header = None  # 見出し（クリックで折りたたみ）
+        self.body = None  # セル部分（未作成の間は空のフレーム）
+        self.materialized = False  # セルのウィジェットを作成済みか
+
+
 class ThumbnailDisplayManager:
     """
     サムネイル表示と管理を行うクラス
@@ -19,30 +47,97 @@ class ThumbnailDisplayManager:
     def __init__(self, parent_frame, 
                  select_folder, 
                  thumbnail_cache, 
-                 on_right_click_callback=None):
+                 on_right_click_callback=None,
+                 viewport_canvas=None,
+                 on_similar_callback=None,
+                 on_selection_change_callback=None):
         """
         初期化
         
         Args:
             parent_frame: サムネイルを表示するフレーム
             select_folder: 選択されたフォルダパス
-            thumbnail_cache: サムネイルキャッシュ辞書
+            thumbnail_cache: デコード済みサムネイルのメモリキャッシュ（MemoryThumbnailCache）
             on_right_click_callback: 右クリック時のコールバック
+            viewport_canvas: parent_frame をスクロール表示しているCanvas（表示範囲の判定に使用）
+            on_similar_callback: 右クリックメニューで類似検索を選んだ時のコールバック（ファイル名を渡す）
+            on_selection_change_callback: 選択件数が変わった時のコールバック（件数を渡す）
         """
         self.parent_frame = parent_frame
+        self.viewport_canvas = viewport_canvas
         self.select_folder = select_folder
         self.thumbnail_cache = thumbnail_cache
+        # 生画素タイルキャッシュ（RAW_TILE_CACHE_ENABLED の場合のみ。メモリキャッシュに入っていない時のJPEGデコードを省く）
+        self.tile_cache = open_tile_cache(select_folder)
         
         # コールバック関数
         self.on_right_click_callback = on_right_click_callback
+        self.on_similar_callback = on_similar_callback
+        self.on_selection_change_callback = on_selection_change_callback
         
         # 表示管理
-        self.thumbnails = []  # 参照保持用
+        self.thumbnails = {}  # ファイル名: PhotoImage（参照保持用）
         self.thumbnail_labels = {}  # サムネイルラベル保持
-        self.selected_items = set()  # 選択中のファイル
+        self.thumbnail_frames = {}  # ファイル名: サムネイルフレーム
+        self.cell_positions = {}  # ファイル名: グリッド上の位置 (row, column)
+        self.displayed_files = []  # 表示中のファイル（表示順）
+        self.displayed_records = []  # 表示中のレコード（表示順）
+        self._index_of = {}  # ファイル名: 表示順の位置
+        self.selection = RangeSelection()  # 選択中のファイル（表示順の位置の範囲）
+        self._selection_anchor = None  # Shiftクリックでの範囲選択の起点のファイル
+        self._carried_selection = None  # 表示形式の切り替えで表示順を作り直すまで保持する、選択中のファイル
+        self.last_filter = None  # 直近の表示条件 (date_range, 検索式の構文木, ファイル名の検索文字列)
+        self.last_result_bits = 0  # 直近の絞り込み結果のビットセット
         self.min_thumb_width = constants.THUMBNAIL_SIZE[0] + 20  # サムネイル1件分の最小幅
         self.current_columns = 1  # 画面に表示されるカラム数
+
+        # タイムライン表示（作成日時の日・月ごとの区間に分け、見える区間のセルだけを作成）
+        self.timeline = None  # 区切り（constants.TIMELINE_*、None は一覧表示）
+        self.sections = []  # 表示中の区間（古い順）
+        self.collapsed = set()  # 折りたたんだ区間の開始日
+        self._expanded = []  # 展開中の区間（表示順）
+        self._expanded_starts = []  # 展開中の区間の先頭の表示順の位置
+        self._materialized = set()  # セルを作成済みの区間
+        self._section_tops = None  # 展開中の区間のセル部分の上端y（配置が変わったら破棄）
+        self._timeline_columns = None  # 区間のセルを配置した時の列数
+        self.parent_frame.bind("<Configure>", self._on_frame_configure, add="+")
+
+        # サムネイルの読み込みは表示範囲に近いものから順にワーカースレッドで行う
+        self.scheduler = ThumbnailScheduler()
+        self._placeholder = ImageTk.PhotoImage(
+            Image.new("RGB", constants.THUMBNAIL_SIZE, constants.PLACEHOLDER_COLOR)
+        )
+        self._closed = False
+
+        # スクロール先読み（先読み範囲内のセルだけ画像を保持・読み込みする）
+        self.prefetcher = ScrollPrefetcher()
+        self.prefetch_window = (0, -1)  # 現在の先読み範囲 (先頭位置, 末尾位置)
+        self._photo_queue = collections.deque()  # アイドル時にPhotoImageを作成するファイル
+        self._photo_job = None
+        self.parent_frame.after(constants.THUMBNAIL_POLL_INTERVAL_MS, self._poll_loaded_thumbnails)
+
+        # 動画のストーリーボード（サムネイルの読み込みが終わってから別のワーカーで生成）
+        self.storyboard_scheduler = ThumbnailScheduler(constants.STORYBOARD_WORKERS)
+        self.storyboards = MemoryThumbnailCache(constants.STORYBOARD_CACHE_MAX_BYTES)
+        self._storyboard_requested = set()  # 生成を依頼済みのファイル
+        self._storyboard_dirty = False  # 先読み範囲が変わり、依頼の見直しが必要か
+        self._hover = None  # ホバー中の (ファイル名, 表示中のフレーム番号)
+        self._hover_photo = None  # ホバー中に表示しているPhotoImage（参照保持用）
+        self._hover_job = None
+
+        # アプリ内プレビュー（デコード済み画像はウィンドウを閉じても保持）
+        self.preview_window = None
+        self.preview_cache = MemoryThumbnailCache(constants.PREVIEW_CACHE_MAX_BYTES)
         
+        # パフォーマンスHUD向けの計測値（読み出す時に現在の値を求める）
+        metrics.set_gauge("view.cells", lambda: len(self.thumbnail_frames))
+        metrics.set_gauge("view.photo_images", lambda: len(self.thumbnails))
+        metrics.set_gauge("thumbnail.pending", self.scheduler.pending_count)
+        metrics.set_gauge("storyboard.pending", self.storyboard_scheduler.pending_count)
+        metrics.set_gauge("thumbnail_cache.bytes", lambda: self.thumbnail_cache.total_bytes)
+        metrics.set_gauge("thumbnail_cache.max_bytes", self.thumbnail_cache.max_bytes)
+        metrics.set_gauge("thumbnail_cache.entries", lambda: len(self.thumbnail_cache))
+
         # スタイル設定
         self._setup_styles()
     
@@ -60,101 +155,580 @@ class ThumbnailDisplayManager:
     # 公開メソッド（外部インターフェース）
     # ===============================
     
-    def show_thumbnails(self, image_tag_map, date_range, selected_tags, frame_width):
+    def show_thumbnails(self, image_tag_map, date_range, selected_tags, frame_width, query_text="", name_text="",
+                        similar_to=None):
         """
         サムネイルを表示
+        - 前回の表示結果との差分だけを反映（残ったセルと選択状態は維持）
+        - similar_to を指定した場合は、絞り込み結果のうち見た目が似ている上位 VISUAL_SEARCH_LIMIT 件を
+          類似度の高い順に一覧表示する（タイムライン表示は解除）
         
         Args:
-            image_tag_map: 画像タグマップ
+            image_tag_map: 画像タグマップ（MediaStore）
             date_range: 日付範囲 (from_date, to_date)
             selected_tags: 選択されたタグリスト
             frame_width: フレームの幅
+            query_text: タグ検索式（選択タグとANDで結合）
+            name_text: ファイル名に含まれる文字列（タグ・日付の条件とANDで結合）
+            similar_to: 類似検索の基準のファイル名（省略時は通し番号順に表示）
+            
+        Raises:
+            tag_query.TagQueryError: 検索式が正しくない場合（表示は変更しない）
         """
+        # 選択タグと検索式を1つの構文木にまとめる
+        query = tag_query.combine_and(
+            tag_query.selection_to_query(selected_tags),
+            tag_query.parse_query(query_text),
+        )
 
-        # 既存の選択状態をクリア
-        self._clear_selection()
+        self.last_filter = (date_range, query, name_text)
 
-        # 既存のサムネイルをクリア
-        self._clear_thumbnails()
-
-        # データフレーム作成
-        df = pd.DataFrame(image_tag_map).T
-        df["createday"] = pd.to_datetime(df["createday"])
-
-        # 日付範囲でファイルをフィルタリング
-        from_date, to_date = date_range
-        df = df[(df["createday"].dt.date >= from_date) & (df["createday"].dt.date <= to_date)]
-
-        # タグでフィルタリング
-        if selected_tags == [constants.NONE_TAG_TEXT]:
-            df = df[df['tags'].apply(lambda x: len(x) == 0)]
-        elif selected_tags:
-            df = df[df['tags'].apply(lambda x: set(selected_tags).issubset(set(x)))]
+        # 日付範囲・検索式・ファイル名でフィルタリング（ビットセット演算）
+        with metrics.timer("view.filter"):
+            index = image_tag_map.query_index()
+            self.last_result_bits = index.evaluate(query, date_range, name_text)
 
         # 列数を計算
         columns = self._calculate_columns(frame_width)
 
-        # サムネイルを表示
-        idx = 0
-        for file, row in df.iterrows():
-            self._create_thumbnail_widget(file, row, idx, columns)
-            idx += 1
+        if similar_to is not None and similar_to in image_tag_map:
+            self.set_timeline(None)
+            with metrics.timer("view.similar"):
+                ordinals, _ = image_tag_map.visual_index().similar(
+                    image_tag_map[similar_to].ordinal, candidates=index.ordinals(self.last_result_bits)
+                )
+            self.last_result_bits = index.bits(ordinals)
+            with metrics.timer("view.render"):
+                self._render_diff([image_tag_map.record_at(o) for o in ordinals.tolist()], columns)
+            return
+
+        # ウィジェットの作成・再配置までの時間（Tkの描画はアイドル時に行われるため含まない）
+        with metrics.timer("view.render"):
+            if self.timeline is not None:
+                self._render_timeline(index, self.last_result_bits, columns)
+            else:
+                # 前回の表示との差分だけを反映
+                self._render_diff(index.records(self.last_result_bits), columns)
     
     
+    def refresh_items(self, image_tag_map, files):
+        """
+        タグが変更されたファイルのセルだけを更新
+        - 現在の表示条件に合致しなくなったセルを削除
+        - 位置が変わったセルだけを再配置
+        - 残ったセルの選択状態は保持
+        
+        Args:
+            image_tag_map: 画像タグマップ（MediaStore）
+            files: タグが変更されたファイル名の集合
+        """
+        if self.last_filter is None:
+            return
+        date_range, query, name_text = self.last_filter
+        index = image_tag_map.query_index()
+        previous = self.last_result_bits
+        matched = index.evaluate(query, date_range, name_text)
+        self.last_result_bits = matched
+
+        if self.timeline is not None:
+            # 区間の件数が変わるため、結果から外れたファイルがあれば区間を作り直す（変わらない区間のセルは再利用）
+            if previous & ~matched:
+                self._render_timeline(index, matched, self.current_columns)
+            return
+
+        removed = {
+            file for file in files
+            if file in self.thumbnail_frames and not (matched >> image_tag_map[file].ordinal) & 1
+        }
+        if not removed:
+            return
+
+        records = [image_tag_map[f] for f in self.displayed_files if f not in removed]
+        self._render_diff(records, self.current_columns)
+
     def add_to_selection(self, file):
         """ファイルを選択状態に追加"""
-        self.selected_items.add(file)
-        self._update_selection_style(file, True)
+        idx = self._index_of.get(file)
+        if idx is not None:
+            self._apply_selection_change(self.selection.add_range(idx, idx + 1))
     
     def remove_from_selection(self, file):
         """ファイルを選択状態から削除"""
-        self.selected_items.discard(file)
-        self._update_selection_style(file, False)
+        idx = self._index_of.get(file)
+        if idx is not None:
+            self._apply_selection_change(self.selection.remove_range(idx, idx + 1))
 
-    
     def get_selected_items(self):
         """選択中のファイル一覧を取得"""
-        return self.selected_items.copy()
+        files = self.displayed_files
+        selected = set()
+        for start, end in self.selection.ranges():
+            selected.update(files[start:end])
+        return selected
+
+    def selection_count(self):
+        """選択中のファイル数（ファイル名の一覧は作らない）"""
+        return len(self.selection)
     
     def is_selected(self, file):
         """ファイルが選択されているかチェック"""
-        return file in self.selected_items
+        idx = self._index_of.get(file)
+        return idx is not None and idx in self.selection
     
     def toggle_selection(self, file):
-        """ファイルの選択状態を切り替え"""
-        if self.is_selected(file):
-            self.remove_from_selection(file)
+        """ファイルの選択状態を切り替え（Shiftクリックでの範囲選択の起点にする）"""
+        idx = self._index_of.get(file)
+        if idx is None:
+            return
+        self._selection_anchor = file
+        self._apply_selection_change(self.selection.toggle(idx))
+
+    def select_range_to(self, file):
+        """
+        範囲選択の起点（直前にクリックしたファイル）から file までを表示順で選択に加える
+        （セルを作成していない区間のファイルも含む。起点がない場合は選択状態の切り替え）
+        """
+        idx = self._index_of.get(file)
+        anchor = self._index_of.get(self._selection_anchor)
+        if idx is None:
+            return
+        if anchor is None:
+            self.toggle_selection(file)
+            return
+        self._apply_selection_change(self.selection.add_range(min(anchor, idx), max(anchor, idx) + 1))
+
+    def select_all(self):
+        """絞り込み結果のファイルをすべて選択（折りたたんだ区間は除く）"""
+        self._apply_selection_change(self.selection.select_all(len(self.displayed_files)))
+
+    def invert_selection(self):
+        """絞り込み結果のファイルの選択状態を反転（折りたたんだ区間は除く）"""
+        self._apply_selection_change(self.selection.invert(len(self.displayed_files)))
+
+    def clear_selection(self):
+        """全ての選択状態をクリア"""
+        self._apply_selection_change(self.selection.clear())
+    
+    def open_preview(self, file):
+        """
+        ファイルをアプリ内のプレビューウィンドウで開く
+        - 左右キーで表示中の絞り込み結果の順に前後のファイルへ移動できる
+        - プレビューウィンドウが開いていれば、そのウィンドウで表示
+        """
+        index = self._index_of.get(file)
+        if index is None:
+            return
+        paths = [os.path.join(self.select_folder, f) for f in self.displayed_files]
+        if self.preview_window is not None:
+            self.preview_window.set_paths(paths, index)
         else:
-            self.add_to_selection(file)
+            self.preview_window = PreviewWindow(
+                self.parent_frame.winfo_toplevel(), paths, index, self.preview_cache,
+                on_close=self._on_preview_close,
+            )
     
-    def open_with_default_app(self, path, file):
+    def update_viewport(self):
         """
-        ファイルをデフォルトアプリケーションで開く処理
-        - 指定されたパスのファイルを開く
-        - ダブルクリック時はサムネイルの選択を解除
-        - エラー発生時はエラーメッセージを表示
+        Canvasの表示範囲とスクロール速度から先読み範囲を決め、画像の読み込み・解放を行う
+        - スクロールやリサイズのたびに呼ばれる
+        - 表示中のセルでメモリキャッシュにあるものは即座に表示
+        - 先読み範囲のセルはアイドル時にPhotoImageを作成、キャッシュにないものはスケジューラに登録
+        - 先読み範囲から外れたジョブは取り消し、十分に離れたセルの画像は解放
         """
-        try:
-            os.startfile(path)
-            self.remove_from_selection(file)
-        except Exception as e:
-            print(f"{path} のオープンに失敗: {e}")
+        if not self.displayed_files:
+            self.prefetch_window = (0, -1)
+            return
+        total = len(self.displayed_files)
+        if self.viewport_canvas is None:
+            first, last = 0, total - 1
+        else:
+            top = self.viewport_canvas.canvasy(0)
+            bottom = self.viewport_canvas.canvasy(self.viewport_canvas.winfo_height())
+            if self.timeline is not None:
+                first, last = self._timeline_visible_range(top, bottom)
+            else:
+                row_height = self._row_height()
+                columns = self.current_columns
+                first = min(total - 1, int(top // row_height) * columns)
+                last = min(total - 1, (int(bottom // row_height) + 1) * columns - 1)
+
+        self.prefetcher.update(first)
+        win_first, win_last = self.prefetcher.window(first, last, total)
+        self.prefetch_window = (win_first, win_last)
+        if self.timeline is not None:
+            self._materialize_window(win_first, win_last)
+
+        # 十分に離れたセルの画像を解放（PhotoImageのメモリを抑える）
+        keep = (last - first + 1) * constants.PREFETCH_KEEP_SCREENS
+        for file in list(self.thumbnails):
+            idx = self._index_of.get(file)
+            if idx is None or idx < win_first - keep or idx > win_last + keep:
+                lbl = self.thumbnail_labels.get(file)
+                if lbl is not None:
+                    lbl.configure(image=self._placeholder)
+                del self.thumbnails[file]
+
+        # 先読み範囲から外れた読み込みジョブを取り消し
+        window_files = self.displayed_files[win_first:win_last + 1]
+        window_set = set(window_files)
+        self.scheduler.retain(window_set)
+        self.scheduler.set_viewport(win_first, win_last, self.prefetcher.direction)
+
+        # 先読み範囲から外れたストーリーボードの生成を取り消し（依頼はサムネイル読み込み完了後）
+        self.storyboard_scheduler.retain(window_set)
+        self.storyboard_scheduler.set_viewport(win_first, win_last, self.prefetcher.direction)
+        self._storyboard_requested &= window_set
+        self._storyboard_dirty = True
+
+        hits = misses = 0
+        for offset, file in enumerate(window_files):
+            if file in self.thumbnails:
+                continue
+            idx = win_first + offset
+            cache_key = self._cache_key(file)
+            if cache_key in self.thumbnail_cache:
+                hits += 1
+                if first <= idx <= last:
+                    self._set_cell_image(file, self.thumbnail_cache[cache_key])
+                else:
+                    self._photo_queue.append(file)
+            else:
+                misses += 1
+                record = self.displayed_records[idx]
+                file_path = os.path.join(self.select_folder, file)
+                self.scheduler.submit(
+                    file, lambda r=record, p=file_path: self._load_thumbnail_image(r, p), idx
+                )
+        if hits:
+            metrics.increment("thumbnail_cache.hits", hits)
+        if misses:
+            metrics.increment("thumbnail_cache.misses", misses)
+
+        if self._photo_queue and self._photo_job is None:
+            self._photo_job = self.parent_frame.after_idle(self._prepare_photo_images)
+
+    def set_timeline(self, granularity):
+        """
+        表示形式を切り替える（表示中のセルは破棄し、選択状態は維持。呼び出し側で show_thumbnails を呼ぶ）
+
+        Args:
+            granularity: constants.TIMELINE_DAY / constants.TIMELINE_MONTH（None は一覧表示）
+        """
+        if granularity == self.timeline:
+            return
+        self._on_video_leave(None)
+        self._carried_selection = self.get_selected_items()
+        self.selection = RangeSelection()
+        for frame in self.thumbnail_frames.values():
+            frame.destroy()
+        for section in self.sections:
+            section.frame.destroy()
+        self.thumbnail_frames.clear()
+        self.thumbnail_labels.clear()
+        self.thumbnails.clear()
+        self.cell_positions.clear()
+        self.displayed_files = []
+        self.displayed_records = []
+        self._index_of = {}
+        self.sections = []
+        self._expanded = []
+        self._expanded_starts = []
+        self._materialized.clear()
+        self._section_tops = None
+        self._timeline_columns = None
+        self.collapsed.clear()
+        self.timeline = granularity
+
+    def timeline_sections(self):
+        """
+        タイムライン表示の区間一覧
+
+        Returns:
+            list: (区間の開始日, 見出しの文字列, 件数) の古い順のリスト（一覧表示では空）
+        """
+        return [(section.key, section.label, len(section.records)) for section in self.sections]
+
+    def jump_to_section(self, key):
+        """
+        区間の先頭までスクロール（折りたたまれていれば展開）
+        セルを作っていない区間も高さは確保しているため、位置はすぐに決まる
+
+        Args:
+            key: 区間の開始日
+        """
+        section = next((s for s in self.sections if s.key == key), None)
+        if section is None or self.viewport_canvas is None:
+            return
+        if key in self.collapsed:
+            self._toggle_section(key)
+        self.parent_frame.update_idletasks()
+        self.viewport_canvas.configure(scrollregion=self.viewport_canvas.bbox("all"))
+        height = self.parent_frame.winfo_height()
+        if height > 1:
+            self.viewport_canvas.yview_moveto(section.frame.winfo_y() / height)
+
+    def invalidate_records(self, records):
+        """
+        内容が変わったファイルのセルを更新（選択状態と位置は維持）
+        - 日付の表示を書き換え
+        - メモリキャッシュの画像とストーリーボードを破棄し、先読み範囲内であれば読み直す
+
+        Args:
+            records: 内容が変わったファイルのレコード（MediaRecord）
+        """
+        for record in records:
+            file = record.name
+            self.thumbnail_cache.pop(self._cache_key(file))
+            self.storyboards.pop(file, None)
+            self._storyboard_requested.discard(file)
+            self.thumbnails.pop(file, None)
+            lbl = self.thumbnail_labels.get(file)
+            if lbl is not None:
+                date_str = record.created_datetime.strftime("%Y-%m-%d")
+                lbl.configure(image=self._placeholder, text=f"{os.path.basename(file)}\n{date_str}")
+        self.update_viewport()
+
+    def shutdown(self):
+        """ワーカースレッドと定期処理を停止"""
+        self._closed = True
+        for name in ("view.cells", "view.photo_images", "thumbnail.pending", "storyboard.pending",
+                     "thumbnail_cache.bytes", "thumbnail_cache.max_bytes", "thumbnail_cache.entries"):
+            metrics.remove_gauge(name)
+        self.scheduler.shutdown()
+        self.storyboard_scheduler.shutdown()
+        if self.preview_window is not None:
+            self.preview_window.close()
+        if self.tile_cache is not None:
+            self.tile_cache.close()
+            self.tile_cache = None
     
     # ===============================
     # 内部メソッド（プライベート）
     # ===============================
         
-    def _clear_thumbnails(self):
-        """表示中のサムネイルを全てクリア"""
-        for widget in self.parent_frame.winfo_children():
-            widget.destroy()
-        self.thumbnails.clear()
-        self.thumbnail_labels.clear()
+    def _render_diff(self, records, columns):
+        """
+        前回の表示結果と新しい表示結果の差分だけをウィジェットに反映
+        - 結果から外れたセルだけを削除（選択状態も解除）
+        - 新しく結果に入ったセルだけを作成
+        - 残ったセルは再利用し、位置が変わったものだけを再配置
+        
+        Args:
+            records: 表示するレコードのリスト（表示順）
+            columns: 列数
+        """
+        new_files = {record.name for record in records}
 
-    def _clear_selection(self):
-        """全ての選択状態をクリア"""
-        for file in list(self.selected_items):
-            self.remove_from_selection(file)
+        # 結果から外れたセルを削除
+        for file in self.displayed_files:
+            if file not in new_files:
+                self._destroy_thumbnail_widget(file)
+
+        # 残ったセルの再配置と、新しいセルの作成
+        displayed_records = []
+        for record in records:
+            file = record.name
+            idx = len(displayed_records)
+            position = (idx // columns, idx % columns)
+            if file in self.thumbnail_frames:
+                if self.cell_positions.get(file) != position:
+                    self.thumbnail_frames[file].grid_configure(row=position[0], column=position[1])
+                    self.cell_positions[file] = position
+            else:
+                self._create_thumbnail_widget(file, record, idx, columns)
+                if file not in self.thumbnail_frames:
+                    continue  # 作成に失敗したセルは詰めて表示
+            displayed_records.append(record)
+        self._set_display_order(displayed_records)
+
+        # 未読み込みのサムネイルの優先順位を新しい並びと表示範囲に合わせる
+        self.scheduler.update_positions(self._index_of)
+        self.update_viewport()
+
+    def _destroy_thumbnail_widget(self, file):
+        """1件分のサムネイルウィジェットを削除"""
+        # 読み込み待ちであれば後回しにする（読み込み結果はメモリキャッシュにだけ保存）
+        self.scheduler.deprioritize(file)
+        self.thumbnail_labels.pop(file, None)
+        self.thumbnails.pop(file, None)
+        self.cell_positions.pop(file, None)
+        frame = self.thumbnail_frames.pop(file, None)
+        if frame is not None:
+            frame.destroy()
+
+    def _render_timeline(self, index, bits, columns):
+        """
+        絞り込み結果を作成日時の区間に分けて表示
+        - 前回と同じ開始日・同じファイルの区間はウィジェットを再利用
+        - 内容が変わった区間と、列数が変わった場合の全区間はセルを破棄（見えていれば update_viewport で作り直す）
+
+        Args:
+            index: TagQueryIndex
+            bits: 絞り込み結果のビットセット
+            columns: 列数
+        """
+        record_at = index.store.record_at
+        groups = index.date_buckets().groups(index.ordinals(bits), self.timeline)
+        relayout = columns != self._timeline_columns
+        self._timeline_columns = columns
+
+        old_sections = {section.key: section for section in self.sections}
+        sections = []
+        for row, (key, ordinals) in enumerate(groups):
+            records = [record_at(ordinal) for ordinal in ordinals.tolist()]
+            section = old_sections.pop(key, None)
+            if section is None:
+                section = TimelineSection(key, self._section_label(key), records)
+                self._create_section(section)
+            elif relayout or section.records != records:
+                self._release_section(section)
+                section.records = records
+            section.frame.grid(row=row, column=0, sticky="w")
+            sections.append(section)
+        for section in old_sections.values():
+            self._release_section(section)
+            section.frame.destroy()
+        self.sections = sections
+
+        self._layout_timeline()
+        self.update_viewport()
+
+    def _section_label(self, key):
+        """区間の見出しの文字列"""
+        if self.timeline == constants.TIMELINE_MONTH:
+            return f"{key.year}年{key.month}月"
+        return f"{key.year}年{key.month}月{key.day}日"
+
+    def _create_section(self, section):
+        """区間の見出しと、空のセル部分を作成"""
+        section.frame = ttk.Frame(self.parent_frame)
+        section.header = ttk.Label(section.frame, cursor="hand2")
+        section.header.pack(anchor="w", padx=10, pady=(10, 0))
+        section.header.bind("<Button-1>", lambda e, k=section.key: self._toggle_section(k))
+        section.body = tk.Frame(section.frame)
+
+    def _layout_timeline(self):
+        """
+        見出し・セル部分の大きさ・区間の表示順の位置を更新し、表示順のファイル一覧を作り直す
+        （折りたたんだ区間のファイルは表示順に含めず、選択も解除する）
+        """
+        columns = self.current_columns
+        row_height = self._row_height()
+        displayed_records = []
+        expanded = []
+        for section in self.sections:
+            collapsed = section.key in self.collapsed
+            mark = "▶" if collapsed else "▼"
+            section.header.configure(text=f"{mark} {section.label}（{len(section.records)}件）")
+            section.start = len(displayed_records)
+            if collapsed:
+                section.body.pack_forget()
+                continue
+            if not section.materialized:
+                rows = -(-len(section.records) // columns)
+                section.body.configure(height=rows * row_height, width=columns * self.min_thumb_width)
+            section.body.pack(anchor="w")
+            expanded.append(section)
+            displayed_records.extend(section.records)
+
+        self._set_display_order(displayed_records)
+        self._expanded = expanded
+        self._expanded_starts = [section.start for section in expanded]
+        self._section_tops = None
+        self.scheduler.update_positions(self._index_of)
+
+    def _toggle_section(self, key):
+        """区間の折りたたみ・展開を切り替え（折りたたむ区間のセルは破棄）"""
+        if key in self.collapsed:
+            self.collapsed.discard(key)
+        else:
+            self.collapsed.add(key)
+            for section in self.sections:
+                if section.key == key:
+                    self._release_section(section)
+        self._layout_timeline()
+        self.update_viewport()
+
+    def _materialize_window(self, win_first, win_last):
+        """
+        先読み範囲に掛かる区間のセルを作成し、先読み範囲から TIMELINE_KEEP_SECTIONS 区間以上離れた区間のセルを破棄
+        """
+        if not self._expanded:
+            return
+        lo = max(0, bisect.bisect_right(self._expanded_starts, win_first) - 1)
+        hi = max(0, bisect.bisect_right(self._expanded_starts, win_last) - 1)
+        for section in self._expanded[lo:hi + 1]:
+            if not section.materialized:
+                for idx, record in enumerate(section.records):
+                    self._create_thumbnail_widget(record.name, record, idx, self.current_columns, section.body)
+                section.materialized = True
+                self._materialized.add(section)
+                self._section_tops = None
+
+        keep = constants.TIMELINE_KEEP_SECTIONS
+        keep_first = self._expanded_starts[max(0, lo - keep)]
+        keep_last = self._expanded_starts[min(len(self._expanded) - 1, hi + keep)]
+        for section in list(self._materialized):
+            if not keep_first <= section.start <= keep_last:
+                self._release_section(section)
+                section.body.pack(anchor="w")
+
+    def _release_section(self, section):
+        """区間のセルを破棄し、同じ高さの空のフレームに置き換える（選択状態は維持）"""
+        self._materialized.discard(section)
+        if not section.materialized:
+            return
+        for record in section.records:
+            file = record.name
+            self.thumbnail_labels.pop(file, None)
+            self.thumbnails.pop(file, None)
+            self.cell_positions.pop(file, None)
+            self.thumbnail_frames.pop(file, None)
+        height = section.body.winfo_height()
+        section.body.destroy()
+        section.body = tk.Frame(section.frame, height=height, width=self.current_columns * self.min_thumb_width)
+        section.materialized = False
+        self._section_tops = None
+
+    def _timeline_visible_range(self, top, bottom):
+        """
+        タイムライン表示で、Canvasの表示範囲に入っているセルの表示順の位置を求める
+
+        Args:
+            top: 表示範囲の上端y
+            bottom: 表示範囲の下端y
+
+        Returns:
+            tuple: (先頭位置, 末尾位置)
+        """
+        if self._section_tops is None:
+            self._section_tops = [
+                section.frame.winfo_y() + section.body.winfo_y() for section in self._expanded
+            ]
+        tops = self._section_tops
+        if len(tops) > 1 and tops[-1] <= tops[0]:
+            return 0, 0  # 配置前（位置が未確定）は先頭の区間から
+
+        row_height = self._row_height()
+        columns = self.current_columns
+        i = max(0, bisect.bisect_right(tops, top) - 1)
+        first = last = None
+        for section, body_top in zip(self._expanded[i:], tops[i:]):
+            if body_top > bottom:
+                break
+            count = len(section.records)
+            lo = max(0, int((top - body_top) // row_height)) * columns
+            if lo >= count:
+                continue
+            hi = min(count - 1, (int((bottom - body_top) // row_height) + 1) * columns - 1)
+            if first is None:
+                first = section.start + lo
+            last = section.start + hi
+        if first is None:
+            # 見出しと折りたたんだ区間だけが見えている場合は、直後の区間の先頭
+            section = self._expanded[min(i + 1, len(self._expanded) - 1)]
+            first = last = section.start
+        return first, last
 
     def _calculate_columns(self, frame_width):
         """
@@ -170,63 +744,42 @@ class ThumbnailDisplayManager:
         self.current_columns = columns
         return columns
     
-    def _create_thumbnail_widget(self, file, row, idx, columns):
+    def _create_thumbnail_widget(self, file, row, idx, columns, parent=None):
         """
         個別のサムネイルウィジェットを作成
         
         Args:
             file: ファイル名
-            row: データフレームの行
-            idx: インデックス
+            row: ファイルのレコード（MediaRecord）
+            idx: インデックス（タイムライン表示では区間内の位置）
             columns: 列数
+            parent: セルを配置するフレーム（省略時は parent_frame、タイムライン表示では区間のセル部分）
         """
         try:
-            # サムネイルキャッシュキーを生成
-            cache_key = f"{file}_{constants.THUMBNAIL_SIZE[0]}_{constants.THUMBNAIL_SIZE[1]}"
             file_path = os.path.join(self.select_folder, file)
 
-            # まずメモリキャッシュから取得を試行（最高速）
-            if cache_key in self.thumbnail_cache:
-                img = self.thumbnail_cache[cache_key]
-            else:
-                # メモリキャッシュにない場合、JSONキャッシュから取得
-                img = logic.get_thumbnail_from_cache(row.to_dict() if hasattr(row, 'to_dict') else row)
-                
-                if img is None:
-                    # JSONキャッシュからの取得に失敗した場合のフォールバック
-                    print(f"警告: {file} のJSONキャッシュが見つかりません。新規生成します。")
-                    img = self._generate_thumbnail(file_path)
-                
-                # メモリキャッシュに保存して次回の高速化
-                self.thumbnail_cache[cache_key] = img
+            # まずは仮画像で表示し、先読み範囲に入ったら画像を読み込む（update_viewport）
+            tk_img = self._placeholder
 
             # サムネイルを表示
-            tk_img = ImageTk.PhotoImage(img)
-            thumb_frame = ttk.Frame(self.parent_frame)
+            thumb_frame = ttk.Frame(parent or self.parent_frame)
             thumb_frame.grid(row=idx // columns, column=idx % columns, padx=10, pady=10)
+            self.cell_positions[file] = (idx // columns, idx % columns)
 
             # 選択状態に応じてスタイルを設定
-            style_name = "Selected.TLabel" if file in self.selected_items else "TLabel"
+            style_name = "Selected.TLabel" if self.is_selected(file) else "TLabel"
             
             # ファイル名と日付を表示
-            date_str = row.createday.strftime("%Y-%m-%d") if hasattr(row, 'createday') else row.get('createday', '')
-            if isinstance(date_str, str) and date_str:
-                try:
-                    from datetime import datetime
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                    date_str = date_obj.strftime("%Y-%m-%d")
-                except:
-                    date_str = date_str[:10]  # 最初の10文字（YYYY-MM-DD）を取得
-            
+            date_str = row.created_datetime.strftime("%Y-%m-%d")
             lbl_text = f"{os.path.basename(file)}\n{date_str}"
             lbl = ttk.Label(thumb_frame, image=tk_img, text=lbl_text, compound="top", style=style_name)
             lbl.pack()
             
             self.thumbnail_labels[file] = lbl
+            self.thumbnail_frames[file] = thumb_frame
 
             # イベントハンドラを設定
             self._bind_events(thumb_frame, lbl, file, file_path)
-            self.thumbnails.append(tk_img)
             
         except Exception as e:
             print(f"{file} の読み込みに失敗: {e}")
@@ -249,11 +802,182 @@ class ThumbnailDisplayManager:
             # クリック - 内部メソッドを直接呼び出し
             widget.bind("<Button-1>", 
                        lambda e, f=file: self._on_thumbnail_click(e, f))
+            # Shiftクリックで範囲選択、Ctrlクリックで選択の切り替え
+            widget.bind("<Shift-Button-1>",
+                       lambda e, f=file: self._on_thumbnail_shift_click(e, f))
+            widget.bind("<Control-Button-1>",
+                       lambda e, f=file: self._on_thumbnail_click(e, f))
             
             # 右クリック
             widget.bind("<Button-3>", 
-                       lambda e, f=file: self._on_thumbnail_right_click(e))
+                       lambda e, f=file: self._on_thumbnail_right_click(e, f))
+
+        # 動画はホバー中にストーリーボードをコマ送り表示
+        if constants.STORYBOARD_ENABLED and os.path.splitext(file)[1].lower() in constants.VIDEO_EXTS:
+            lbl.bind("<Enter>", lambda e, f=file: self._on_video_enter(f))
+            lbl.bind("<Leave>", lambda e, f=file: self._on_video_leave(f))
     
+    @staticmethod
+    def _cache_key(file):
+        """メモリキャッシュのキーを生成"""
+        return f"{file}_{constants.THUMBNAIL_SIZE[0]}_{constants.THUMBNAIL_SIZE[1]}"
+
+    def _load_thumbnail_image(self, row, file_path):
+        """
+        サムネイル画像を読み込む（ワーカースレッドで実行）
+        
+        Args:
+            row: ファイルのレコード（MediaRecord）
+            file_path: ファイルパス
+            
+        Returns:
+            PIL.Image: デコード済みのサムネイル画像
+        """
+        with metrics.timer("thumbnail.load"):
+            return self._read_thumbnail_image(row, file_path)
+
+    def _read_thumbnail_image(self, row, file_path):
+        """サムネイル画像をタイルキャッシュ・JSONキャッシュ・生成の順に取得してデコード"""
+        # 生画素タイルがあればデコード不要
+        tile_cache = self.tile_cache
+        if tile_cache is not None:
+            img = tile_cache.get(row.ordinal, row.file_hash)
+            if img is not None:
+                return img
+
+        # JSONキャッシュから取得
+        img = logic.get_thumbnail_from_cache(row)
+        
+        if img is None and row.file_hash:
+            # ライブラリ表示はサムネイルを持たないが、記録済みのハッシュ・サイズで共有キャッシュを直接引ける
+            size = media_fs.signature_size(row.stat_signature) if row.stat_signature else None
+            img = logic.load_thumbnail_image(file_path, row.file_hash_hex, size)
+        elif img is None:
+            # JSONキャッシュからの取得に失敗した場合のフォールバック
+            print(f"警告: {os.path.basename(file_path)} のJSONキャッシュが見つかりません。共有キャッシュから取得または新規生成します。")
+            img = logic.load_thumbnail_image(file_path)
+        if img is None:
+            img = self._generate_thumbnail(file_path)
+
+        # デコードまでワーカースレッドで済ませる
+        img.load()
+        if tile_cache is not None and row.thumbnail:
+            tile_cache.put(row.ordinal, row.file_hash, img)
+        return img
+
+    def _poll_loaded_thumbnails(self):
+        """
+        ワーカースレッドで読み込まれたサムネイルを画面に反映（メインスレッドで定期実行）
+        """
+        if self._closed or not self.parent_frame.winfo_exists():
+            return
+
+        for file, img, error in self.scheduler.poll_results():
+            if error is not None:
+                print(f"{file} の読み込みに失敗: {error}")
+                continue
+
+            # メモリキャッシュに保存して次回の高速化
+            self.thumbnail_cache[self._cache_key(file)] = img
+
+            # 先読み範囲内のセルであれば表示（範囲外はキャッシュのみ）
+            if self._in_window(file):
+                self._set_cell_image(file, img)
+
+        for file, sheet, error in self.storyboard_scheduler.poll_results():
+            if error is not None:
+                print(f"{file} のストーリーボード生成に失敗: {error}")
+            elif sheet is not None:
+                self.storyboards[file] = sheet
+
+        # サムネイルの読み込みがすべて終わってから、ストーリーボードの生成を依頼する
+        if self._storyboard_dirty and self.scheduler.pending_count() == 0:
+            self._request_storyboards()
+
+        self.parent_frame.after(constants.THUMBNAIL_POLL_INTERVAL_MS, self._poll_loaded_thumbnails)
+
+    def _request_storyboards(self):
+        """先読み範囲内の動画のうち、ストーリーボードが未生成のものを生成ワーカーに登録"""
+        self._storyboard_dirty = False
+        if not constants.STORYBOARD_ENABLED:
+            return
+        win_first, win_last = self.prefetch_window
+        for idx in range(win_first, win_last + 1):
+            file = self.displayed_files[idx]
+            if (file in self._storyboard_requested or file in self.storyboards
+                    or os.path.splitext(file)[1].lower() not in constants.VIDEO_EXTS):
+                continue
+            file_path = os.path.join(self.select_folder, file)
+            self.storyboard_scheduler.submit(
+                file, lambda p=file_path: logic.load_video_storyboard(p), idx
+            )
+            self._storyboard_requested.add(file)
+
+    def _show_next_storyboard_frame(self):
+        """ホバー中の動画のストーリーボードを次のフレームに切り替え（生成前なら待機）"""
+        self._hover_job = None
+        if self._hover is None or self._closed:
+            return
+        file, frame = self._hover
+        lbl = self.thumbnail_labels.get(file)
+        if lbl is None:
+            self._hover = None
+            return
+        sheet = self.storyboards.get(file)
+        if sheet is not None:
+            self._hover_photo = ImageTk.PhotoImage(logic.storyboard_frame(sheet, frame))
+            lbl.configure(image=self._hover_photo)
+            self._hover = (file, frame + 1)
+        self._hover_job = self.parent_frame.after(
+            constants.STORYBOARD_HOVER_INTERVAL_MS, self._show_next_storyboard_frame
+        )
+
+    def _in_window(self, file):
+        """ファイルのセルが先読み範囲内かどうか"""
+        idx = self._index_of.get(file)
+        return idx is not None and self.prefetch_window[0] <= idx <= self.prefetch_window[1]
+
+    def _set_cell_image(self, file, img):
+        """セルにサムネイル画像を設定"""
+        lbl = self.thumbnail_labels.get(file)
+        if lbl is not None:
+            tk_img = ImageTk.PhotoImage(img)
+            lbl.configure(image=tk_img)
+            self.thumbnails[file] = tk_img
+
+    def _prepare_photo_images(self):
+        """
+        先読み範囲のセルのPhotoImageをアイドル時に少しずつ作成
+        - 範囲外になったセルやキャッシュから破棄された画像はスキップ
+        """
+        self._photo_job = None
+        if self._closed or not self.parent_frame.winfo_exists():
+            return
+
+        done = 0
+        while self._photo_queue and done < constants.PREFETCH_PHOTO_BATCH:
+            file = self._photo_queue.popleft()
+            if file in self.thumbnails or not self._in_window(file):
+                continue
+            img = self.thumbnail_cache.get(self._cache_key(file))
+            if img is not None:
+                self._set_cell_image(file, img)
+                done += 1
+
+        if self._photo_queue:
+            # 入力イベントを処理できるよう、続きは次のアイドル時に回す
+            self._photo_job = self.parent_frame.after(1, self._prepare_photo_images)
+
+    def _row_height(self):
+        """1行分の高さ（表示済みのセルから実測、未表示の場合は推定値）"""
+        # タイムライン表示では先頭のセルが未作成の場合があるため、作成済みのセルで測る
+        for frame in self.thumbnail_frames.values():
+            height = frame.winfo_height()
+            if height > 1:
+                return height + 20  # pady=10 の上下分
+            break
+        return constants.THUMBNAIL_SIZE[1] + 60
+
     def _generate_thumbnail(self, file_path):
         """
         ファイルからサムネイルを生成
@@ -268,8 +992,9 @@ class ThumbnailDisplayManager:
         if ext in constants.VIDEO_EXTS:
             return self._get_video_thumbnail(file_path)
         else:
-            img = Image.open(file_path)
-            img.thumbnail(constants.THUMBNAIL_SIZE)
+            with media_fs.open_media(file_path) as f:
+                img = Image.open(f)
+                img.thumbnail(constants.THUMBNAIL_SIZE)
             return img
     
     def _get_video_thumbnail(self, filepath):
@@ -296,17 +1021,60 @@ class ThumbnailDisplayManager:
             print(f"{filepath} の動画サムネイル生成に失敗: {e}")
         return Image.new('RGB', constants.THUMBNAIL_SIZE, (128, 128, 128))
     
-    def _update_selection_style(self, file, is_selected):
+    def _set_display_order(self, records):
         """
-        ファイルの選択状態に応じてスタイルを更新
-        
+        表示順のファイル一覧を更新し、選択範囲を新しい表示順に付け替える
+        （表示順から外れたファイルは選択を解除。残ったセルは選択状態が変わらないため再描画しない）
+
         Args:
-            file: ファイル名
-            is_selected: 選択状態
+            records: 表示するレコードのリスト（表示順）
+        """
+        selected = self._carried_selection
+        if selected is None:
+            selected = self.get_selected_items() if self.selection else ()
+        self._carried_selection = None
+
+        self.displayed_records = records
+        self.displayed_files = [record.name for record in records]
+        self._index_of = {file: idx for idx, file in enumerate(self.displayed_files)}
+        if selected or self.selection:
+            index_of = self._index_of
+            self.selection = RangeSelection.from_positions(index_of[f] for f in selected if f in index_of)
+            self._notify_selection_change()
+
+    def _apply_selection_change(self, changed):
         """
-        if file in self.thumbnail_labels:
-            style_name = "Selected.TLabel" if is_selected else "TLabel"
+        選択範囲の変更を画面に反映
+        - 状態が変わった範囲のうち、セルを作成済みのものだけスタイルを更新
+          （変わった件数とセル数の少ない方を走査する）
+
+        Args:
+            changed: RangeSelection の変更操作が返した (開始, 終了) の範囲のリスト
+        """
+        if not changed:
+            return
+        changed_count = sum(end - start for start, end in changed)
+        if changed_count <= len(self.thumbnail_labels):
+            targets = (
+                (file, idx) for start, end in changed
+                for idx, file in enumerate(self.displayed_files[start:end], start)
+                if file in self.thumbnail_labels
+            )
+        else:
+            index_of = self._index_of
+            targets = (
+                (file, index_of[file]) for file in self.thumbnail_labels
+                if file in index_of and contains_position(changed, index_of[file])
+            )
+        for file, idx in list(targets):
+            style_name = "Selected.TLabel" if idx in self.selection else "TLabel"
             self.thumbnail_labels[file].configure(style=style_name)
+        self._notify_selection_change()
+
+    def _notify_selection_change(self):
+        """選択件数の変更をコールバックで通知"""
+        if self.on_selection_change_callback:
+            self.on_selection_change_callback(len(self.selection))
     
     # ===============================
     # イベントハンドラメソッド
@@ -321,23 +1089,72 @@ class ThumbnailDisplayManager:
         """
         self.toggle_selection(file)
 
+    def _on_thumbnail_shift_click(self, event, file):
+        """
+        Shiftキーを押しながらクリックされた時の処理
+        - 直前にクリックしたファイルからこのファイルまでを表示順で選択に加える
+        """
+        self.select_range_to(file)
+
     def _on_thumbnail_double_click(self,event, path, file):
         """
         ダブルクリック時の処理
-        - ファイルをデフォルトアプリケーションで開く
+        - ファイルをプレビューウィンドウで開く
         - 選択状態を解除
         """
-        self.open_with_default_app(path, file)
+        self.open_preview(file)
         self.remove_from_selection(file)
+
+    def _on_video_enter(self, file):
+        """動画のサムネイルにマウスが乗った時の処理（ストーリーボードのコマ送りを開始）"""
+        self._on_video_leave(None)
+        self._hover = (file, 0)
+        self._show_next_storyboard_frame()
+
+    def _on_video_leave(self, file):
+        """動画のサムネイルからマウスが離れた時の処理（通常のサムネイルに戻す）"""
+        if self._hover_job is not None:
+            self.parent_frame.after_cancel(self._hover_job)
+            self._hover_job = None
+        if self._hover is not None:
+            hovered = self._hover[0]
+            self._hover = None
+            self._hover_photo = None
+            lbl = self.thumbnail_labels.get(hovered)
+            if lbl is not None:
+                lbl.configure(image=self.thumbnails.get(hovered, self._placeholder))
+
+    def _on_frame_configure(self, event):
+        """表示フレームの大きさが変わった時の処理（タイムラインの区間の位置を測り直す）"""
+        self._section_tops = None
+
+    def _on_preview_close(self):
+        """プレビューウィンドウが閉じられた時の処理"""
+        self.preview_window = None
     
-    def _on_thumbnail_right_click(self, event):
+    def _on_thumbnail_right_click(self, event, file):
         """
         右クリック時の処理
-        - 右クリックメニューを表示
-        - メニュー項目は ThumbnailDisplayManager で管理
+        - 類似検索が使える場合は「タグを編集」「似た画像を検索」のメニューを表示
+        - 使えない場合はタグ編集メニューを直接表示
+        """
+        if self.on_similar_callback is None:
+            self._open_tag_menu(event)
+            return
+        menu = tk.Menu(self.parent_frame, tearoff=0)
+        menu.add_command(label="タグを編集...", command=lambda: self._open_tag_menu(event))
+        menu.add_command(label="似た画像を検索", command=lambda: self.on_similar_callback(file))
+        try:
+            menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            menu.grab_release()
+
+    def _open_tag_menu(self, event):
+        """
+        タグ編集メニューを表示（選択中のファイルがない場合は案内のみ）
+        - メニューの表示はコールバック先で行う
         """
-        selected_items = self.get_selected_items()
-        if not selected_items:
+        if not self.selection_count():
             messagebox.showinfo(messagebox.INFO, "選択されているファイルがありません")
             return
         
@@ -1,16 +1,21 @@
 import tkinter as tk
 from tkinter import messagebox
+import constants
+from tag_index import TagCompletionIndex, normalize_tag
 
 class SubMenu(tk.Toplevel):
 
-    def __init__(self, master, x, y, all_tags, on_close=None):
+    def __init__(self, master, x, y, all_tags, on_close=None, tag_index=None):
         super().__init__(master)
         self.title("タグ更新メニュー")
-        self.geometry(f"200x300+{x}+{y}")
-        self.all_tags = all_tags.copy()
+        self.geometry(f"200x360+{x}+{y}")
         self.on_close = on_close
+        # タグの検索インデックス（呼び出し元が保持していれば使い回し、開くたびに作り直さない）
+        self.tag_index = tag_index if tag_index is not None else TagCompletionIndex(all_tags)
 
-        self.selected_tags = set() #写真を更新するタグ
+        self.selected_tags = set() #写真を更新するタグ（絞り込みで非表示になっても選択を保持）
+        self.new_tags = []  # このメニューで追加した新規タグ（追加順の逆、先頭に表示）
+        self.visible_tags = []  # リストボックスに表示中のタグ（行の順）
 
         label = tk.Label(self, text="新規タグを入力し追加してください")
         label.pack(pady=5)
@@ -35,6 +40,15 @@ class SubMenu(tk.Toplevel):
         self.listbox = tk.Listbox(frame, selectmode="multiple")
         self.listbox.pack(side="left", fill="both", expand=True)
 
+        # 一括編集モード（追加・削除・置換）
+        self.mode_var = tk.StringVar(value=constants.TAG_EDIT_REPLACE)
+        mode_frame = tk.Frame(self)
+        mode_frame.pack(anchor="center", pady=(0, 5))
+        for text, mode in (("追加", constants.TAG_EDIT_ADD),
+                           ("削除", constants.TAG_EDIT_REMOVE),
+                           ("置換", constants.TAG_EDIT_REPLACE)):
+            tk.Radiobutton(mode_frame, text=text, variable=self.mode_var, value=mode).pack(side="left")
+
         frame_btn = tk.Frame(self)
         frame_btn.pack(anchor="center")
         
@@ -50,8 +64,7 @@ class SubMenu(tk.Toplevel):
         scrollbar = tk.Scrollbar(frame, orient="vertical", command=self.listbox.yview)
         scrollbar.pack(side="right", fill="y")
         
-        for item in self.all_tags:
-            self.listbox.insert(tk.END, item)
+        self._filter_listbox()
 
         self.listbox.configure(yscrollcommand=scrollbar.set)
         
@@ -60,46 +73,72 @@ class SubMenu(tk.Toplevel):
 
     def add_tag(self):
         new_tag = self.tag_entry.get().strip()
-        # リストボックス内での重複もチェック
-        existing_tags = [self.listbox.get(i) for i in range(self.listbox.size())]
-        
-        # リストボックスにも含まれていないタグを追加
-        if new_tag in self.all_tags or new_tag in existing_tags:
+        # 既存のタグ・このメニューで追加済みのタグとの重複をチェック
+        if new_tag in self.tag_index or new_tag in self.new_tags:
             messagebox.showwarning(messagebox.WARNING, "既に存在するタグです。")
             return
-        self.listbox.insert(0, new_tag)
+        self.new_tags.insert(0, new_tag)
+        self.selected_tags.add(new_tag)
         self.tag_entry.delete(0, tk.END)
-        self.listbox.selection_set(0)
+        # 入力が空になったので全件表示に戻す（追加したタグは先頭に選択状態で表示）
+        self._filter_listbox()
         # 新しいタグが選択されたのでOKボタンを有効化
         self.btn_ok.config(state="normal")
         # テキストボックスが空になったので追加ボタンを無効化
         self.add_btn.config(state="disabled")
 
     def save_tags(self):
-        selected_indices = self.listbox.curselection()
-        selected_tags = [self.listbox.get(i) for i in selected_indices]
+        # 新規タグ（追加順）→ 既存タグ（名前順）
+        selected_tags = [tag for tag in reversed(self.new_tags) if tag in self.selected_tags]
+        selected_tags += sorted(tag for tag in self.selected_tags if tag not in self.new_tags)
 
         if self.on_close:
-            self.on_close(selected_tags)
+            self.on_close(selected_tags, self.mode_var.get())
             self.on_close = None
         super().destroy()
 
     def on_selection_change(self, event):
-        """リストボックスの選択状態が変更された時の処理"""
-        selected_indices = self.listbox.curselection()
-        if selected_indices:
+        """リストボックスの選択状態が変更された時の処理（表示中の行の選択だけを反映）"""
+        selected_indices = set(self.listbox.curselection())
+        for idx, tag in enumerate(self.visible_tags):
+            if idx in selected_indices:
+                self.selected_tags.add(tag)
+            else:
+                self.selected_tags.discard(tag)
+        if self.selected_tags:
             self.btn_ok.config(state="normal")
         else:
             self.btn_ok.config(state="disabled")
 
     def on_entry_change(self, event):
-        """テキストボックスの内容が変更された時の処理"""
+        """テキストボックスの内容が変更された時の処理（入力に一致するタグに絞り込む）"""
         text = self.tag_entry.get().strip()
         if text:
             self.add_btn.config(state="normal")
         else:
             self.add_btn.config(state="disabled")
-
+        self._filter_listbox()
+
+    def _filter_listbox(self):
+        """
+        入力中の文字列に一致するタグだけをリストボックスに表示
+        - 表示は TAG_COMPLETION_LIMIT 件まで（前方一致 → 部分一致の順）
+        - 行の削除・追加は1回ずつの呼び出しでまとめて行い、選択状態を復元する
+        """
+        text = self.tag_entry.get().strip()
+        query = normalize_tag(text)
+        limit = constants.TAG_COMPLETION_LIMIT
+        rows = [tag for tag in self.new_tags if query in normalize_tag(tag)][:limit]
+        if len(rows) < limit:
+            rows += self.tag_index.search(text, limit=limit - len(rows))
+
+        self.visible_tags = rows
+        self.listbox.delete(0, tk.END)
+        if rows:
+            self.listbox.insert(tk.END, *rows)
+        for idx, tag in enumerate(rows):
+            if tag in self.selected_tags:
+                self.listbox.selection_set(idx)
 
 # if __name__ == "__main__":
 #     root = tk.Tk()
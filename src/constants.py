@@ -5,12 +5,77 @@ NONE_TAG_TEXT = "タグなし"
 
 # ファイル名
 PICTURE_TAGS_JSON = "image_tag_map.json"
+PICTURE_TAGS_JOURNAL = "image_tag_map.journal.jsonl"  # タグ更新の差分ジャーナル
+ARCHIVE_EXTS = ('.zip',)  # 仮想フォルダとして開けるアーカイブ（タグJSONは「アーカイブ名.image_tag_map.json」）
+
+# ユーザー設定・ライブラリ
+APP_DIR_NAME = "tk-photo-app"  # ユーザー設定ディレクトリ名
+LIBRARY_CATALOG_JSON = "library_catalog.json"  # 複数フォルダのカタログファイル
+LIBRARY_ENTRIES_DIR = "library_entries"  # ルートフォルダごとのメディア情報のスナップショットの保存先（カタログと同じディレクトリ内）
+LIBRARY_LOAD_WORKERS = 2  # ライブラリをバックグラウンドで読み込むスレッド数
+
+# タグ一括編集モード
+TAG_EDIT_ADD = "add"          # 選択タグを追加
+TAG_EDIT_REMOVE = "remove"    # 選択タグを削除
+TAG_EDIT_REPLACE = "replace"  # 選択タグで置き換え
+
+# タグ編集メニューの入力補完
+TAG_COMPLETION_LIMIT = 200  # 絞り込み結果としてリストボックスに表示するタグの最大数
+
+# タイムライン表示（作成日時の日・月ごとに区切って表示）
+TIMELINE_DAY = "day"      # 日ごと
+TIMELINE_MONTH = "month"  # 月ごと
+TIMELINE_KEEP_SECTIONS = 2  # 先読み範囲の外側でウィジェットを破棄せずに保持する区間数
+
+# ファイル名検索
+NAME_SEARCH_DELAY_MS = 150  # 入力が止まってから検索するまでの待ち時間
+
+# セッションのスナップショット（前回の表示状態から即座に再開）
+SESSION_SNAPSHOT_ENABLED = True  # False でスナップショットを保存・使用しない
+SESSION_SNAPSHOT_DIR = "sessions"  # ユーザーキャッシュディレクトリ内の保存先
+SESSION_SAMPLE_FILES = 16  # 復元前にサイズ・更新日時を確認するファイル数（等間隔に抽出）
+SESSION_RECONCILE_POLL_MS = 200  # バックグラウンドの再スキャンの完了を確認する間隔
+SESSION_SCROLL_RETRY_MS = 50  # スクロール位置の復元をサムネイルの配置まで待つ間隔
+SESSION_SCROLL_RETRIES = 40  # スクロール位置の復元を再試行する回数
+
+# 類似画像の検索（サムネイルから計算した色ヒストグラムと縮小グレースケールの特徴量で比較）
+VISUAL_SEARCH_LIMIT = 100  # 類似度の高い順に表示する最大件数
+VISUAL_COLOR_WEIGHT = 0.5  # 類似度に占める色の割合（残りは構図）
+
+# パフォーマンスHUD（計測値のオーバーレイ表示）
+PERF_HUD_VISIBLE = False  # 起動時に表示するか
+PERF_HUD_KEY = "<F12>"  # 表示・非表示を切り替えるキー
+PERF_HUD_INTERVAL_MS = 500  # 表示を更新する間隔
+PERF_HUD_BACKGROUND_COLOR = "#202020"
+PERF_HUD_FOREGROUND_COLOR = "#e0e0e0"
+
+# 作成日時の取得元
+DATE_SOURCE_CAPTURE = "capture"  # Exif / 動画コンテナの撮影日時
+DATE_SOURCE_MTIME = "mtime"  # ファイル更新日時（撮影日時がない場合）
+SCAN_WORKERS = 4  # スキャン時にハッシュ計算・サムネイル生成・撮影日時読み取りを行うスレッド数
+SCAN_PROGRESS_INTERVAL_SEC = 0.25  # スキャンの進捗イベントを送る間隔
+SCAN_STREAM_POLL_MS = 100  # 初回スキャン中に、見つかったファイル・更新結果を画面に反映する間隔
+SCAN_STREAM_RENDER_INTERVAL_MS = 1000  # 初回スキャン中に、日付の更新を反映して一覧を並べ直す最短の間隔
+HASH_READ_BYTES = 1024 * 1024  # 変更検知のハッシュに使うファイル先頭のバイト数
+
+# 高遅延ファイルシステム（ネットワークドライブ）
+HIGH_LATENCY_FS_MODE = "auto"  # True / False で固定、"auto" はstatの待ち時間から判定
+NETWORK_LATENCY_THRESHOLD_MS = 5.0  # statにこれ以上かかるフォルダを高遅延とみなす
+NETWORK_IO_MAX_WORKERS = 32  # 高遅延モードで並列に実行するI/Oの上限
+NETWORK_LISTING_TTL_SEC = 30.0  # フォルダ一覧のキャッシュの有効期間
 
 # サムネイルキャッシュ設定
 THUMBNAIL_CACHE_DIR = "thumbnail_cache"  # サムネイルキャッシュディレクトリ名
 THUMBNAIL_FORMAT = "JPEG"  # サムネイル保存形式
 THUMBNAIL_QUALITY = 85  # JPEG品質
 
+# 共有サムネイルキャッシュ設定（全フォルダ共通、内容のフィンガープリントで引く）
+SHARED_THUMBNAIL_CACHE_ENABLED = True  # False で共有キャッシュを使用しない
+SHARED_THUMBNAIL_CACHE_DB = "thumbnails.sqlite3"  # ユーザーキャッシュディレクトリ内のファイル名
+SHARED_THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 共有キャッシュの上限サイズ
+SHARED_THUMBNAIL_CACHE_EVICT_RATIO = 0.9  # 上限超過時にこの割合まで古い順に削除
+CACHE_ORPHAN_GRACE_DAYS = 30  # どのフォルダからも参照されないサムネイルを、この日数使われなければ削除
+
 # ファイル拡張子
 VIDEO_EXTS = ('.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv')
 IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
@@ -19,6 +84,40 @@ VIDEO_AND_IMAGE_EXTS = IMAGE_EXTS + VIDEO_EXTS
 # サムネイル設定
 THUMBNAIL_SIZE = (128, 128)
 MIN_THUMB_WIDTH = 148  # サムネイル1件分の最小幅（パディング込み）
+THUMBNAIL_WORKERS = 2  # サムネイルのデコード・生成を行うワーカースレッド数
+THUMBNAIL_POLL_INTERVAL_MS = 30  # ワーカーの処理結果を画面に反映する間隔
+PLACEHOLDER_COLOR = (224, 224, 224)  # 読み込み中のサムネイルの色
+
+# スクロール先読み設定
+MEMORY_THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024  # デコード済みサムネイルのメモリキャッシュ上限
+RAW_TILE_CACHE_ENABLED = False  # True でサムネイルを生画素のタイルとしても保存し、表示時のJPEGデコードを省く
+RAW_TILE_CACHE_DIR = "tiles"  # ユーザーキャッシュディレクトリ内のタイルファイルの保存先
+RAW_TILE_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # タイルファイルの合計の上限（超えたら使われていない順に削除）
+RAW_TILE_CACHE_MAX_AGE_DAYS = 90  # この日数使われていないタイルファイルは削除
+PREFETCH_LOOKAHEAD_SEC = 1.0  # スクロール速度から何秒先までを先読みするか
+PREFETCH_MAX_SCREENS = 4  # 先読みする最大画面数
+PREFETCH_BEHIND_SCREENS = 1  # スクロール方向の逆側に保持する画面数
+PREFETCH_KEEP_SCREENS = 2  # 先読み範囲の外側で画像を解放せずに保持する画面数
+PREFETCH_PHOTO_BATCH = 8  # アイドル時に1回で作成するPhotoImageの数
+
+# 動画のストーリーボード（ホバー時にコマ送り表示する複数フレームのサムネイル）
+STORYBOARD_ENABLED = True  # False でストーリーボードを生成しない
+STORYBOARD_FRAMES = 8  # 1動画あたりのフレーム数（等間隔に抽出）
+STORYBOARD_WORKERS = 1  # ストーリーボードを生成するスレッド数
+STORYBOARD_TIME_LIMIT_SEC = 5.0  # 1動画あたりの生成時間の上限（超えたら抽出済みのフレームだけで作成）
+STORYBOARD_HOVER_INTERVAL_MS = 400  # ホバー中にフレームを切り替える間隔
+STORYBOARD_CACHE_MAX_BYTES = 64 * 1024 * 1024  # デコード済みストーリーボードのメモリキャッシュ上限
+STORYBOARD_BACKGROUND_COLOR = (0, 0, 0)  # フレームの余白の色
+
+# プレビューウィンドウ
+PREVIEW_WINDOW_SIZE = "1024x768"
+PREVIEW_BACKGROUND_COLOR = "#000000"
+PREVIEW_DRAFT_SCALE = 4  # ドラフト表示でのJPEGの縮小率（最終表示サイズに対する比）
+PREVIEW_WORKERS = 2  # フル品質のデコードと前後の先読みを行うスレッド数
+PREVIEW_PREFETCH_RADIUS = 1  # 前後何件を先読みするか
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024  # デコード済みプレビュー画像のメモリキャッシュ上限
+PREVIEW_POLL_INTERVAL_MS = 20  # デコード結果を画面に反映する間隔
+PREVIEW_RESIZE_DELAY_MS = 100  # ウィンドウサイズ変更後に再描画するまでの待ち時間
 
 # UI設定
 WINDOW_SIZE = "900x700"
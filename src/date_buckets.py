@@ -0,0 +1,101 @@
+# --- 日付の区間インデックス ---
+# タイムライン表示（日ごと・月ごとの区間に分けた表示）のため、ファイルを作成日時の区間に振り分ける
+# - 構築時に、全ファイルを作成日時順に並べた通し番号の配列と、各ファイルが属する日の番号を求めておく
+#   （日の境界は最古〜最新の各日のローカル時刻の0時。夏時間でも date_range の判定と一致する）
+# - 月の番号は日の番号から引くため、日ごと・月ごとの切り替えで再計算しない
+# - 絞り込み結果の区間分けは、作成日時順の配列からの抽出と隣り合う番号の比較だけで済む（並べ替え不要、NumPy）
+
+import datetime
+import numpy as np
+import constants
+
+
+class DateBucketIndex:
+    """
+    通し番号ごとの作成日時から作る、日・月の区間インデックス
+    """
+
+    def __init__(self, created, live):
+        """
+        初期化
+
+        Args:
+            created: 通し番号ごとの作成日時（UNIX時刻）の配列
+            live: 通し番号ごとの有効フラグ（削除済みはFalse）の配列
+        """
+        ordinals = np.flatnonzero(live)
+        # 作成日時順（同時刻は通し番号順）
+        order = ordinals[np.argsort(created[ordinals], kind="stable")]
+        self._order = order
+
+        self._days = []  # 日の番号: datetime.date
+        self._day_of = np.zeros(len(created), dtype=np.int64)  # 通し番号: 日の番号
+        if len(order):
+            first = datetime.date.fromtimestamp(created[order[0]])
+            last = datetime.date.fromtimestamp(created[order[-1]])
+            self._days = [first + datetime.timedelta(days=i) for i in range((last - first).days + 1)]
+            day_starts = np.array([
+                datetime.datetime.combine(day, datetime.time.min).timestamp() for day in self._days
+            ])
+            self._day_of[ordinals] = np.searchsorted(day_starts, created[ordinals], side="right") - 1
+        # 日の番号: 月の番号（年 * 12 + 月 - 1）
+        self._month_of_day = np.array([day.year * 12 + day.month - 1 for day in self._days], dtype=np.int64)
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def groups(self, ordinals, granularity):
+        """
+        通し番号を作成日時順に並べ、日または月ごとの区間に分ける
+
+        Args:
+            ordinals: 通し番号の配列（絞り込み結果）
+            granularity: constants.TIMELINE_DAY / constants.TIMELINE_MONTH
+
+        Returns:
+            list: (区間の開始日 datetime.date, 区間内の通し番号の配列（作成日時順）) の古い順のリスト
+        """
+        if not len(ordinals):
+            return []
+        mask = np.zeros(len(self._day_of), dtype=bool)
+        mask[ordinals] = True
+        ordinals = self._order[mask[self._order]]
+        day = self._day_of[ordinals]
+        keys = self._month_of_day[day] if granularity == constants.TIMELINE_MONTH else day
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        ends = np.append(starts[1:], len(ordinals))
+
+        result = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            key_date = self._days[day[start]]
+            if granularity == constants.TIMELINE_MONTH:
+                key_date = key_date.replace(day=1)
+            result.append((key_date, ordinals[start:end]))
+        return result
+
+
+def _benchmark(count=1_000_000, years=10):
+    """years 年分・count 件での構築時間と、全件の区間分けの時間を計測"""
+    import time
+
+    rng = np.random.default_rng(0)
+    begin = datetime.datetime(2015, 1, 1).timestamp()
+    created = (begin + rng.random(count) * years * 365 * 24 * 3600).astype(np.int64)
+    live = np.ones(count, dtype=bool)
+
+    start = time.perf_counter()
+    index = DateBucketIndex(created, live)
+    print(f"構築: {(time.perf_counter() - start) * 1000:.1f} ms ({count} 件, {years} 年)")
+
+    ordinals = np.flatnonzero(live)
+    for granularity in (constants.TIMELINE_MONTH, constants.TIMELINE_DAY):
+        start = time.perf_counter()
+        groups = index.groups(ordinals, granularity)
+        print(f"{granularity:>5}: {(time.perf_counter() - start) * 1000:7.1f} ms ({len(groups)} 区間)")
+
+
+if __name__ == "__main__":
+    # 使い方: python src/date_buckets.py [件数]
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,102 @@
+# --- 並列I/Oプール ---
+# ネットワークドライブのように1回のI/Oの待ち時間が長い環境で、stat・読み込みを並列に実行する
+# 同時実行数はスループット（1秒あたりの完了件数）を見ながら増減させる
+
+import time
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AdaptiveIOPool:
+    """
+    同時実行数を自動調整するスレッドプール
+    - 一定件数（window）ごとにスループットを測り、上がれば同時実行数を増やし、下がれば減らす
+    - 同時実行数は min_workers 〜 max_workers の範囲に収める
+    - min_workers == max_workers の場合は固定数のスレッドプールと同じ
+    """
+
+    # スループットがこの割合以上変化したら同時実行数を変える
+    _TOLERANCE = 0.1
+
+    def __init__(self, min_workers, max_workers, window=16):
+        """
+        初期化
+
+        Args:
+            min_workers: 同時実行数の下限（初期値）
+            max_workers: 同時実行数の上限（スレッド数）
+            window: スループットを測る完了件数の単位
+        """
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.window = window
+        self.limit = self.min_workers  # 現在の同時実行数
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="io-pool")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def map(self, func, items):
+        """
+        各要素に func を並列に適用し、結果を入力順に返すジェネレータ
+        例外は該当する結果を取り出した時点で送出される
+        """
+        items = iter(items)
+        pending = collections.deque()
+        exhausted = False
+        completed = 0
+        window_start = time.monotonic()
+        last_rate = None
+
+        while True:
+            # 同時実行数まで投入
+            while not exhausted and len(pending) < self.limit:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append(self._executor.submit(func, item))
+            if not pending:
+                return
+
+            result = pending.popleft().result()
+            completed += 1
+            if completed % self.window == 0:
+                now = time.monotonic()
+                rate = self.window / max(now - window_start, 1e-9)
+                last_rate = self._adjust(rate, last_rate)
+                window_start = now
+            yield result
+
+    def shutdown(self):
+        """スレッドを停止（未開始の処理は取り消す）"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _adjust(self, rate, last_rate):
+        """
+        直前の区間とスループットを比べて同時実行数を調整
+
+        Returns:
+            float: 次の比較に使うスループット
+        """
+        if last_rate is None:
+            # 初回は上限に余裕があれば増やして様子を見る
+            self.limit = min(self.limit + 1, self.max_workers)
+        elif rate > last_rate * (1 + self._TOLERANCE):
+            self.limit = min(self.limit * 2, self.max_workers)
+        elif rate < last_rate * (1 - self._TOLERANCE):
+            self.limit = max(self.limit - 1, self.min_workers)
+        return rate
@@ -0,0 +1,385 @@
+# --- ライブラリカタログ ---
+# 複数のルートフォルダを1つのカタログに登録し、ルートごとのスキャン状態とメディア情報のスナップショットを管理する
+# - カタログファイルにはルートごとの状態・シグネチャ・件数だけを保存し、
+#   メディア情報はルートごとのファイル（LIBRARY_ENTRIES_DIR）に分けて、読み込んだルートの分だけ書き直す
+# - ライブラリ表示中のタグ変更はルートごとのジャーナルに書き、スナップショットは終了時にまとめて書き直す
+# - フォルダ横断の検索は、全ルートをまとめた1つの MediaStore の TagQueryIndex（ビットセット）で行う
+#   まとめたストアは最初に1回だけ作り、以降はルートの読み込み・登録解除のたびにそのルートの差分だけを反映する
+
+import os
+import json
+import hashlib
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import constants
+import logic
+import media_fs
+from media_store import MediaStore
+
+
+# ルートフォルダのスキャン状態
+ROOT_PENDING = "pending"  # 未読み込み
+ROOT_LOADING = "loading"  # バックグラウンドで読み込み中
+ROOT_READY = "ready"      # インデックス反映済み
+ROOT_ERROR = "error"      # 読み込み失敗
+
+
+def _root_signature(root):
+    """
+    ルートフォルダの変更検知用シグネチャを返す
+    フォルダ（またはZIPアーカイブ）自体とタグJSON・ジャーナルの更新時刻を組み合わせる（ファイルの中身は読まない）
+    """
+    signature = []
+    for path in (root, media_fs.tags_json_path(root), media_fs.tag_journal_path(root)):
+        try:
+            signature.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            signature.append(0)
+    return signature
+
+
+class LibraryCatalog:
+    """
+    複数フォルダを横断するライブラリカタログ
+    - ルートフォルダごとのスキャン状態とタグ・日付のスナップショットを保持
+    - 変更のないルートは再スキャンせず、スナップショットから即座に復元
+    """
+
+    def __init__(self, catalog_path=None):
+        """
+        初期化
+
+        Args:
+            catalog_path: カタログファイルのパス（省略時はユーザー設定ディレクトリ）
+        """
+        self.catalog_path = catalog_path or os.path.join(
+            logic.get_user_config_dir(), constants.LIBRARY_CATALOG_JSON
+        )
+        # ルートパス: {"state", "signature", "file_count", "entries", "dirty"}
+        # dirty: タグ変更がスナップショットのファイルに未反映（終了時に書き直す）
+        self.roots = {}
+        self._lock = threading.RLock()
+        self._executor = None
+
+        self._key_root = {}  # ファイルの絶対パス: ルートパス（タグ変更をルートごとのジャーナルへ振り分ける）
+
+        # 全ルートをまとめたストアとタグ集計（merged_map の初回呼び出しで作成し、メインスレッドだけで更新）
+        self._merged = None
+        self._merged_tags = None
+        # まとめたストアに未反映のルート: (ストアに反映済みのメディア情報, 最新のメディア情報)
+        self._pending_merge = {}
+
+        self._load_catalog()
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def add_root(self, root):
+        """
+        ルートフォルダをカタログに登録（読み込みはバックグラウンドで行う）
+
+        Returns:
+            bool: 新規に登録された場合True
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            if root in self.roots:
+                return False
+            self.roots[root] = {
+                "state": ROOT_PENDING, "signature": None, "file_count": 0, "entries": {}, "dirty": False,
+            }
+            self._save_catalog()
+        return True
+
+    def remove_root(self, root):
+        """ルートフォルダをカタログから削除"""
+        root = os.path.abspath(root)
+        with self._lock:
+            info = self.roots.pop(root, None)
+            if info is None:
+                return
+            self._unindex_root(root, info["entries"])
+            self._queue_merge(root, info["entries"], {})
+            self._save_catalog()
+        try:
+            os.remove(self._entries_path(root))
+        except OSError:
+            pass
+
+    def get_root_states(self):
+        """ルートフォルダごとのスキャン状態を取得"""
+        with self._lock:
+            return {root: info["state"] for root, info in self.roots.items()}
+
+    def start_background_load(self, on_root_loaded=None):
+        """
+        変更のあったルートだけをバックグラウンドで再スキャンする
+
+        Args:
+            on_root_loaded: ルート読み込み完了時のコールバック（ワーカースレッドから root を引数に呼ばれる）
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=constants.LIBRARY_LOAD_WORKERS,
+                    thread_name_prefix="library-load",
+                )
+            targets = []
+            for root, info in self.roots.items():
+                if info["state"] == ROOT_LOADING:
+                    continue
+                if info["state"] == ROOT_READY and info["signature"] == _root_signature(root):
+                    continue
+                info["state"] = ROOT_LOADING
+                targets.append(root)
+
+        for root in targets:
+            self._executor.submit(self._load_root, root, on_root_loaded)
+
+    def shutdown(self):
+        """バックグラウンド読み込みを停止し、タグ変更を反映していないスナップショットを書き直す"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            dirty = [root for root, info in self.roots.items() if info["dirty"]]
+            for root in dirty:
+                info = self.roots[root]
+                if self._save_entries(root, info["entries"]):
+                    info["dirty"] = False
+            if dirty:
+                self._save_catalog()
+
+    def merged_map(self):
+        """
+        全ルートを絶対パスキーでまとめた画像タグマップを取得（メインスレッドから呼ぶ）
+        - 初回は全ルートから作成し、以降は読み込み・登録解除されたルートの差分だけを反映する
+          （構築済みの検索インデックスも差分反映し、他のルートは走査しない）
+        - 毎回同じオブジェクトを返す。タグ編集は呼び出し側がこのストアとタグ集計を直接更新する
+
+        Returns:
+            tuple: (image_tag_map(MediaStore), all_tags)
+        """
+        with self._lock:
+            pending, self._pending_merge = self._pending_merge, {}
+            if self._merged is None:
+                entries = [
+                    (os.path.join(root, fname), entry)
+                    for root, info in self.roots.items()
+                    for fname, entry in info["entries"].items()
+                ]
+        if self._merged is None:
+            self._merged = MediaStore()
+            for name, entry in entries:
+                self._merged.add_json_entry(name, entry)
+            self._merged_tags = self._merged.tag_counts()
+            return self._merged, self._merged_tags
+
+        for root, (old_entries, new_entries) in pending.items():
+            self._merge_root(root, old_entries, new_entries)
+        return self._merged, self._merged_tags
+
+    def apply_tag_changes(self, changes):
+        """
+        ライブラリ表示中のタグ変更をルートごとのジャーナルとインデックスに反映
+
+        Args:
+            changes: logic.bulk_update_tags の戻り値（キーは絶対パス）
+
+        Returns:
+            dict: 保存できなかった変更（キーは絶対パス。すべて保存できた場合は空）
+        """
+        by_root = collections.defaultdict(dict)
+        failed = {}
+        with self._lock:
+            for key, change in changes.items():
+                root = self._key_root.get(key)
+                if root is not None:
+                    by_root[root][os.path.relpath(key, root)] = change
+                else:
+                    failed[key] = change
+
+        for root, root_changes in by_root.items():
+            if not logic.append_tag_journal(root, root_changes):
+                failed.update((os.path.join(root, fname), change) for fname, change in root_changes.items())
+                continue
+            with self._lock:
+                info = self.roots.get(root)
+                if info is None:
+                    continue
+                for fname, (_, new_tags) in root_changes.items():
+                    info["entries"][fname]["tags"] = list(new_tags)
+                # 自分で書いたジャーナルでは再スキャンしない（スナップショットのファイルは終了時に書き直す）
+                info["signature"] = _root_signature(root)
+                info["dirty"] = True
+
+        with self._lock:
+            self._save_catalog()
+        return failed
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _load_root(self, root, on_root_loaded):
+        """ルートフォルダをスキャンし、スナップショットとインデックスを更新（ワーカースレッド）"""
+        try:
+            image_tag_map, _ = logic.scan_tags(root)
+            # ハッシュとサイズ・更新日時も残し、ライブラリ表示のサムネイルを共有キャッシュから直接引けるようにする
+            entries = {
+                fname: {
+                    "createday": record.createday,
+                    "tags": list(record.tags),
+                    "file_hash": record.file_hash_hex,
+                    "stat": record.stat_signature,
+                }
+                for fname, record in image_tag_map.items()
+            }
+            state = ROOT_READY
+        except Exception as e:
+            print(f"ライブラリの読み込みに失敗 {root}: {e}")
+            entries = None
+            state = ROOT_ERROR
+
+        with self._lock:
+            info = self.roots.get(root)
+            if info is None:
+                return  # 読み込み中に登録解除された
+            if entries is not None:
+                self._unindex_root(root, info["entries"])
+                self._queue_merge(root, info["entries"], entries)
+                info["entries"] = entries
+                info["file_count"] = len(entries)
+                info["signature"] = _root_signature(root)
+                info["dirty"] = not self._save_entries(root, entries)
+                self._index_root(root, entries)
+            info["state"] = state
+            self._save_catalog()
+
+        if on_root_loaded:
+            on_root_loaded(root)
+
+    def _queue_merge(self, root, old_entries, new_entries):
+        """ルートのメディア情報の変更を、まとめたストアへの反映待ちに登録（ロック内で呼ぶ）"""
+        if self._merged is None:
+            return  # まだ作成していなければ、初回作成時に最新の情報が使われる
+        if root in self._pending_merge:
+            old_entries = self._pending_merge[root][0]
+        self._pending_merge[root] = (old_entries, new_entries)
+
+    def _merge_root(self, root, old_entries, new_entries):
+        """ルート1件分の差分を、まとめたストアとタグ集計に反映（メインスレッド）"""
+        store = self._merged
+        removed = [os.path.join(root, fname) for fname in old_entries if fname not in new_entries]
+        changed = [
+            (os.path.join(root, fname), entry) for fname, entry in new_entries.items()
+            if old_entries.get(fname) != entry
+        ]
+        tags = self._merged_tags
+        for name in removed + [name for name, _ in changed]:
+            record = store.get(name)
+            if record is not None:
+                tags.subtract(record.tags)
+        store.merge_json_entries(removed, changed)
+        for name, _ in changed:
+            tags.update(store[name].tags)
+        for tag in [tag for tag, count in tags.items() if count <= 0]:
+            del tags[tag]
+
+    def _index_root(self, root, entries):
+        """ルート1件分のファイルを登録"""
+        for fname in entries:
+            self._key_root[os.path.join(root, fname)] = root
+
+    def _unindex_root(self, root, entries):
+        """ルート1件分のファイルの登録を削除"""
+        for fname in entries:
+            self._key_root.pop(os.path.join(root, fname), None)
+
+    def _load_catalog(self):
+        """カタログファイルを読み込み、インデックスを復元（再スキャンはしない）"""
+        if not os.path.exists(self.catalog_path):
+            return
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"{constants.LIBRARY_CATALOG_JSON} の読み込みに失敗: {e}")
+            return
+
+        for root, info in data.get("roots", {}).items():
+            # 以前の形式ではメディア情報をカタログ内に保存していた（終了時にルートごとのファイルへ移す）
+            migrated = "entries" in info
+            entries = info["entries"] if migrated else self._load_entries(root)
+            # 前回読み込み中に終了した場合・スナップショットがない場合は未読み込み扱い
+            state = info.get("state", ROOT_PENDING)
+            if state == ROOT_LOADING or (state == ROOT_READY and entries is None):
+                state = ROOT_PENDING
+            entries = entries or {}
+            self.roots[root] = {
+                "state": state,
+                "signature": info.get("signature"),
+                "file_count": info.get("file_count", len(entries)),
+                "entries": entries,
+                "dirty": migrated,
+            }
+            self._index_root(root, entries)
+
+    def _save_catalog(self):
+        """
+        カタログファイルを保存（一時ファイル経由で置き換え）
+        スナップショットにタグ変更が未反映のルートはシグネチャを保存しない（異常終了した場合は次回再スキャン）
+        """
+        roots = {
+            root: {
+                "state": info["state"],
+                "signature": None if info["dirty"] else info["signature"],
+                "file_count": info["file_count"],
+            }
+            for root, info in self.roots.items()
+        }
+        try:
+            os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+            tmp_path = self.catalog_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"roots": roots}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.catalog_path)
+        except Exception as e:
+            print(f"{constants.LIBRARY_CATALOG_JSON} の保存に失敗: {e}")
+
+    def _entries_path(self, root):
+        """ルートフォルダのメディア情報のスナップショットのパス"""
+        name = hashlib.sha1(root.encode("utf-8")).hexdigest()
+        return os.path.join(os.path.dirname(self.catalog_path), constants.LIBRARY_ENTRIES_DIR, name + ".json")
+
+    def _load_entries(self, root):
+        """ルートフォルダのスナップショットを読み込む（ない・読めない場合None）"""
+        try:
+            with open(self._entries_path(root), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"ライブラリのスナップショットの読み込みに失敗 {root}: {e}")
+            return None
+
+    def _save_entries(self, root, entries):
+        """
+        ルートフォルダのスナップショットを保存（一時ファイル経由で置き換え）
+
+        Returns:
+            bool: 保存できたかどうか
+        """
+        path = self._entries_path(root)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            print(f"ライブラリのスナップショットの保存に失敗 {root}: {e}")
+            return False
@@ -2,62 +2,186 @@
 # 例：タグスキャンやサムネイルフィルタなどのロジックをここに分離しても良い（将来的な拡張用）
 
 import os
+import io
 import json
-import datetime
-import collections
+import time
 import hashlib
 import base64
-from PIL import Image
+import datetime
+import threading
+from PIL import Image, ImageOps
 import constants  # 定数をインポート
+import thumbnail_cache
+import media_metadata
+import media_fs
+import scan_events
+import visual_index
+import metrics
+import preview_decoders
+from io_pool import AdaptiveIOPool
+from media_store import MediaStore, DATE_FORMAT
+
+
+def get_user_config_dir():
+    """ユーザー単位の設定ディレクトリ（$XDG_CONFIG_HOME / %APPDATA%）を返す"""
+    base = os.environ.get("XDG_CONFIG_HOME") or os.environ.get("APPDATA")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, constants.APP_DIR_NAME)
 
 
 def _calculate_file_hash(file_path):
     """ファイルのハッシュ値を計算してファイル変更検知に使用"""
+    return _read_hash_and_head(file_path)[0]
+
+
+def _read_hash_and_head(file_path):
+    """
+    ファイルのハッシュ値と、ハッシュ計算に読み込んだファイル先頭のバイト列を返す
+    （先頭のバイト列は撮影日時などのヘッダ解析に再利用して、読み込みを1回で済ませる）
+
+    Returns:
+        tuple: (ハッシュの16進文字列, 先頭のバイト列 or None)。読み込めない場合ハッシュは空文字
+    """
+    # アーカイブ内のファイルは中身を読まず、メンバーのCRCとサイズを使う
+    fingerprint = media_fs.archive_fingerprint(file_path)
+    if fingerprint is not None:
+        return fingerprint, None
     try:
-        with open(file_path, 'rb') as f:
-            # ファイルサイズが大きい場合は最初の1MBのみでハッシュ計算
-            content = f.read(1024 * 1024)
-            return hashlib.md5(content).hexdigest()
+        # ファイルサイズが大きい場合は最初の1MBのみでハッシュ計算
+        head = media_fs.read_head(file_path, constants.HASH_READ_BYTES)
+        return hashlib.md5(head).hexdigest(), head
     except Exception:
-        return ""
+        return "", None
 
 
-def _generate_thumbnail_base64(file_path):
-    """ファイルからサムネイルを生成しBase64エンコードして返す"""
+def _content_fingerprint(file_path, file_hash, size=None):
+    """共有キャッシュ用のファイル内容フィンガープリント（先頭1MBのハッシュ + ファイルサイズ）"""
+    try:
+        if size is None:
+            size = media_fs.stat_media(file_path)[0]
+        return f"{file_hash}-{size}"
+    except OSError:
+        return None
+
+
+def _generate_thumbnail_bytes(file_path):
+    """ファイルからサムネイルを生成しエンコード済みのバイト列で返す"""
+    with metrics.timer("thumbnail.generate"):
+        return _encode_thumbnail(file_path)
+
+
+def _encode_thumbnail(file_path):
+    """サムネイルを生成してエンコード（失敗した場合None）"""
     try:
         ext = os.path.splitext(file_path)[1].lower()
         if ext in constants.VIDEO_EXTS:
             img = _get_video_thumbnail(file_path)
         else:
-            img = Image.open(file_path)
-            img.thumbnail(constants.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+            # RAW・TIFFは埋め込みプレビューを使い、ない場合だけ画像全体をデコードする
+            img = preview_decoders.open_preview(file_path, constants.THUMBNAIL_SIZE)
+            if img is not None:
+                img.thumbnail(constants.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+            else:
+                with media_fs.open_media(file_path) as f:
+                    img = Image.open(f)
+                    img.thumbnail(constants.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
         
-        # Base64エンコード
-        import io
         buffer = io.BytesIO()
         img.save(buffer, format=constants.THUMBNAIL_FORMAT, quality=constants.THUMBNAIL_QUALITY)
-        thumbnail_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
-        return {
-            "data": thumbnail_base64,
-            "size": constants.THUMBNAIL_SIZE,
-            "format": constants.THUMBNAIL_FORMAT
-        }
+        return buffer.getvalue()
     except Exception as e:
         print(f"サムネイル生成エラー {file_path}: {e}")
-        return {}
+        return None
+
+
+def _thumbnail_from_embedded(file_path, head):
+    """
+    Exifの埋め込みサムネイルからサムネイルを作成（画像本体を読まない）
+
+    Returns:
+        bytes: エンコード済みのサムネイル画像（埋め込みサムネイルがない場合None）
+    """
+    data = media_metadata.read_embedded_thumbnail(file_path, head)
+    if data is None:
+        return None
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+        img.thumbnail(constants.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, format=constants.THUMBNAIL_FORMAT, quality=constants.THUMBNAIL_QUALITY)
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"埋め込みサムネイルの変換エラー {file_path}: {e}")
+        return None
+
+
+def _get_or_generate_thumbnail(file_path, file_hash, size=None, head=None, prefer_embedded=False):
+    """
+    共有サムネイルキャッシュを先に参照し、なければ生成して共有キャッシュにも保存する
+
+    Args:
+        file_path: ファイルパス
+        file_hash: ファイルハッシュ
+        size: ファイルサイズ（取得済みの場合。statを省略する）
+        head: 読み込み済みのファイル先頭のバイト列
+        prefer_embedded: True の場合、Exifの埋め込みサムネイルがあれば画像本体を読まずに使う（高遅延モード）
+    
+    Returns:
+        bytes: エンコード済みのサムネイル画像（生成に失敗した場合None）
+    """
+    shared_cache = thumbnail_cache.get_shared_cache()
+    key = None
+    if shared_cache is not None and file_hash:
+        fingerprint = _content_fingerprint(file_path, file_hash, size)
+        if fingerprint:
+            key = shared_cache.make_key(fingerprint)
+            data = shared_cache.get(key)
+            if data is not None:
+                return data
+
+    print(f"サムネイル生成中: {os.path.basename(file_path)}")
+    data = _thumbnail_from_embedded(file_path, head) if prefer_embedded else None
+    if data is None:
+        data = _generate_thumbnail_bytes(file_path)
+    if key is not None and data:
+        shared_cache.put(key, data)
+    return data
+
+
+def load_thumbnail_image(file_path, file_hash=None, size=None):
+    """
+    JSONキャッシュを持たないファイルのサムネイルを取得（共有キャッシュ → 生成の順）
+
+    Args:
+        file_path: ファイルパス
+        file_hash: 記録済みのファイルハッシュ（16進文字列。省略時はファイルを読んで計算）
+        size: 記録済みのファイルサイズ（省略時はstatで取得）
+
+    Returns:
+        PIL.Image: サムネイル画像（取得できない場合None）
+    """
+    if not file_hash:
+        file_hash = _calculate_file_hash(file_path)
+    return _decode_thumbnail(_get_or_generate_thumbnail(file_path, file_hash, size))
+
+
+def _read_video_frame(filepath):
+    """動画ファイルの1フレーム目を元のサイズで取得（例外は呼び出し元で処理）"""
+    import cv2
+    cap = cv2.VideoCapture(filepath)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        return None
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
 
 
 def _get_video_thumbnail(filepath):
     """動画ファイルの1フレーム目をサムネイル画像として取得"""
     try:
-        import cv2
-        cap = cv2.VideoCapture(filepath)
-        ret, frame = cap.read()
-        cap.release()
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame)
+        img = _read_video_frame(filepath)
+        if img is not None:
             img.thumbnail(constants.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
             return img
     except Exception as e:
@@ -67,55 +191,480 @@ def _get_video_thumbnail(filepath):
     return Image.new('RGB', constants.THUMBNAIL_SIZE, (128, 128, 128))
 
 
-def get_thumbnail_from_cache(file_info):
-    """JSONから保存されたサムネイル情報を取得してPIL.Imageオブジェクトを返す"""
+def _generate_storyboard_bytes(file_path):
+    """
+    動画から等間隔に STORYBOARD_FRAMES 枚のフレームをシークして抽出し、横に並べた1枚の画像として返す
+    - 生成時間が STORYBOARD_TIME_LIMIT_SEC を超えたら、抽出済みのフレームだけで作成する
+
+    Returns:
+        bytes: エンコード済みのストーリーボード画像（生成に失敗した場合None）
+    """
     try:
-        thumbnail_data = file_info.get("thumbnail", {})
-        if not thumbnail_data or "data" not in thumbnail_data:
+        import cv2
+        frames = []
+        deadline = time.monotonic() + constants.STORYBOARD_TIME_LIMIT_SEC
+        cap = cv2.VideoCapture(file_path)
+        try:
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if frame_count <= 0:
+                return None
+            count = constants.STORYBOARD_FRAMES
+            for i in range(count):
+                if time.monotonic() > deadline:
+                    break
+                # 各区間の中央のフレーム（先頭の黒いフレームを避ける）
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int((i + 0.5) * frame_count / count))
+                ret, frame = cap.read()
+                if not ret:
+                    continue
+                img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                img.thumbnail(constants.THUMBNAIL_SIZE, Image.Resampling.BILINEAR)
+                frames.append(img)
+        finally:
+            cap.release()
+        if not frames:
             return None
-        
-        # Base64デコード
-        thumbnail_bytes = base64.b64decode(thumbnail_data["data"])
-        import io
-        img = Image.open(io.BytesIO(thumbnail_bytes))
+
+        width, height = constants.THUMBNAIL_SIZE
+        sheet = Image.new("RGB", (width * len(frames), height), constants.STORYBOARD_BACKGROUND_COLOR)
+        for i, img in enumerate(frames):
+            sheet.paste(img, (i * width + (width - img.width) // 2, (height - img.height) // 2))
+        buffer = io.BytesIO()
+        sheet.save(buffer, format=constants.THUMBNAIL_FORMAT, quality=constants.THUMBNAIL_QUALITY)
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"ストーリーボード生成エラー {file_path}: {e}")
+        return None
+
+
+def load_video_storyboard(file_path):
+    """
+    動画のストーリーボードを取得（共有キャッシュ → 生成の順）
+    ワーカースレッドから呼ばれる
+
+    Returns:
+        PIL.Image: フレームを横に並べた画像（幅はサムネイル幅 × フレーム数。取得できない場合None）
+    """
+    shared_cache = thumbnail_cache.get_shared_cache()
+    key = None
+    file_hash = _calculate_file_hash(file_path) if shared_cache is not None else ""
+    if file_hash:
+        fingerprint = _content_fingerprint(file_path, file_hash)
+        if fingerprint:
+            key = shared_cache.make_storyboard_key(fingerprint)
+            data = shared_cache.get(key)
+            if data is not None:
+                return _load_decoded(data)
+
+    data = _generate_storyboard_bytes(file_path)
+    if key is not None and data:
+        shared_cache.put(key, data)
+    return _load_decoded(data)
+
+
+def storyboard_frame(sheet, index):
+    """ストーリーボード画像から index 番目のフレームを切り出す（フレーム数で循環）"""
+    width, height = constants.THUMBNAIL_SIZE
+    count = max(1, sheet.width // width)
+    left = (index % count) * width
+    return sheet.crop((left, 0, left + width, height))
+
+
+def _load_decoded(data):
+    """エンコード済み画像をデコードして返す（ワーカースレッドでデコードを済ませる）"""
+    img = _decode_thumbnail(data)
+    if img is not None:
+        img.load()
+    return img
+
+
+def load_preview_image(file_path, max_size, draft=False):
+    """
+    プレビュー表示用に画像をデコード
+
+    Args:
+        file_path: ファイルパス
+        max_size: 最大サイズ (幅, 高さ)。これより大きい画像は縮小する
+        draft: True の場合、JPEGのドラフトモード（DCTスケーリング）で粗く高速にデコード
+               （ドラフトモードに対応しない形式ではNoneを返す）
+
+    Returns:
+        PIL.Image: デコード済みのRGB画像（取得できない場合None）
+    """
+    try:
+        if os.path.splitext(file_path)[1].lower() in constants.VIDEO_EXTS:
+            if draft:
+                return None
+            img = _read_video_frame(file_path)
+            if img is None:
+                return None
+        else:
+            # RAW・TIFFは埋め込みプレビューを使い、ない場合だけ画像全体をデコードする
+            img = preview_decoders.open_preview(file_path, max_size, constants.PREVIEW_DRAFT_SCALE if draft else 1)
+            if img is None:
+                with media_fs.open_media(file_path) as f:
+                    img = Image.open(f)
+                    if draft:
+                        if img.format != "JPEG":
+                            return None
+                        # 縮小率の大きいDCTスケーリングで、最終サイズより小さく粗い画像を得る
+                        scale = constants.PREVIEW_DRAFT_SCALE
+                        img.draft("RGB", (max(1, max_size[0] // scale), max(1, max_size[1] // scale)))
+                    else:
+                        # 表示サイズ以上の解像度は保ったまま、デコードする画素数を減らす
+                        img.draft("RGB", max_size)
+                    img = ImageOps.exif_transpose(img).convert("RGB")
+        img = img.convert("RGB")
+        if not draft:
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        img.load()
         return img
+    except Exception as e:
+        print(f"プレビュー画像の読み込みに失敗 {file_path}: {e}")
+        return None
+
+
+def _decode_thumbnail(thumbnail_bytes):
+    """エンコード済みのサムネイル画像をPIL.Imageオブジェクトに変換"""
+    if not thumbnail_bytes:
+        return None
+    try:
+        return Image.open(io.BytesIO(thumbnail_bytes))
     except Exception as e:
         print(f"サムネイルキャッシュ読み込みエラー: {e}")
         return None
 
 
-def update_thumbnail_cache(folder_path, image_tag_map):
-    """サムネイルキャッシュを更新する（ファイル変更検知とサムネイル生成）"""
-    updated = False
-    
-    for filename, file_info in image_tag_map.items():
-        file_path = os.path.join(folder_path, filename)
-        
-        if not os.path.exists(file_path):
+def get_thumbnail_from_cache(record):
+    """レコードに保存されたサムネイルを取得してPIL.Imageオブジェクトを返す"""
+    return _decode_thumbnail(record.thumbnail)
+
+
+def _scan_file(file_path, record, high_latency):
+    """
+    1ファイル分のスキャン処理（ワーカースレッドで実行）
+    - ハッシュで変更を検知し、新規・変更ファイルだけサムネイル生成と撮影日時の読み取りを行う
+    - ファイルの読み込みは先頭1MBの1回だけで、ハッシュと撮影日時の解析に共用する
+    - 高遅延モードでは、サイズと更新日時が前回と同じファイルは中身を読まない。
+      サムネイルもExifの埋め込みサムネイルがあれば画像本体を読まずに作成する
+    - 類似検索の特徴量は、サムネイルを作成した場合と未計算の場合だけサムネイルから計算する
+
+    Args:
+        file_path: ファイルパス
+        record: 前回までの情報を持つレコード（読み取りのみ）
+        high_latency: 高遅延モードかどうか
+
+    Returns:
+        tuple: (ハッシュ, サムネイル or None, (作成日時, 取得元) or None, statシグネチャ, 特徴量 or None)。
+               ファイルがない場合None
+    """
+    try:
+        size, mtime = media_fs.stat_media(file_path)
+    except OSError:
+        return None
+    signature = media_fs.stat_signature(size, mtime)
+    old_hash = record.file_hash_hex
+
+    if (high_latency and signature == record.stat_signature and old_hash
+            and record.thumbnail and record.date_source):
+        descriptor = None if visual_index.has_descriptor(record) else visual_index.compute_descriptor(record.thumbnail)
+        return old_hash, None, None, signature, descriptor
+
+    current_hash, head = _read_hash_and_head(file_path)
+    changed = current_hash != old_hash
+
+    thumbnail = None
+    if changed or not record.thumbnail:
+        thumbnail = _get_or_generate_thumbnail(
+            file_path, current_hash, size, head, prefer_embedded=high_latency
+        ) or b""
+
+    descriptor = None
+    if thumbnail is not None:
+        descriptor = visual_index.compute_descriptor(thumbnail)
+    elif not visual_index.has_descriptor(record):
+        descriptor = visual_index.compute_descriptor(record.thumbnail)
+
+    created = None
+    if changed or not record.date_source:
+        # ヘッダだけを読んで撮影日時を取得、なければファイル更新日時
+        captured = media_metadata.read_capture_time(file_path, head)
+        if captured is not None:
+            created = (captured, constants.DATE_SOURCE_CAPTURE)
+        else:
+            created = (mtime, constants.DATE_SOURCE_MTIME)
+
+    return current_hash, thumbnail, created, signature, descriptor
+
+
+def _iter_file_updates(folder_path, image_tag_map, cancel_event=None):
+    """
+    レコードごとに変更検知・サムネイル生成・撮影日時読み取りを行い、結果を反映しながら返すジェネレータ
+    ファイルごとの処理はスレッドプールで並列に行い、結果の反映は呼び出し元スレッドで行う
+    - 通常は SCAN_WORKERS 個のスレッド
+    - 高遅延モードでは NETWORK_IO_MAX_WORKERS を上限に、スループットを見ながら同時実行数を増やす
+    - cancel_event がセットされたら未開始の処理を取り消して終了する
+
+    Yields:
+        tuple: (レコード, メタデータを更新したか, サムネイルを更新したか, 例外 or None)
+    """
+    records = list(image_tag_map.values())
+    high_latency = media_fs.is_high_latency(folder_path)
+    max_workers = constants.NETWORK_IO_MAX_WORKERS if high_latency else constants.SCAN_WORKERS
+
+    def scan(record):
+        try:
+            return _scan_file(os.path.join(folder_path, record.name), record, high_latency)
+        except Exception as e:
+            return e
+
+    with AdaptiveIOPool(constants.SCAN_WORKERS, max_workers) as pool:
+        for record, result in zip(records, pool.map(scan, records)):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if result is None:
+                yield record, False, False, None
+                continue
+            if isinstance(result, Exception):
+                yield record, False, False, result
+                continue
+            current_hash, thumbnail, created, signature, descriptor = result
+            metadata_changed = False
+
+            if signature != record.stat_signature:
+                record.stat_signature = signature
+                metadata_changed = True
+
+            # ファイルが変更されているか、サムネイルがない場合
+            if thumbnail is not None:
+                record.thumbnail = thumbnail
+                record.file_hash = bytes.fromhex(current_hash)
+            # 新規・変更ファイル、または撮影日時が未解析の場合
+            if created is not None:
+                image_tag_map.set_created(record.name, *created)
+                metadata_changed = True
+            # サムネイルから計算した類似検索の特徴量
+            if descriptor is not None and descriptor != record.descriptor:
+                image_tag_map.set_descriptor(record.name, descriptor)
+                metadata_changed = True
+
+            yield record, metadata_changed, thumbnail is not None, None
+
+
+def bulk_update_tags(image_tag_map, all_tags, files, tags, mode=constants.TAG_EDIT_REPLACE):
+    """
+    選択ファイルのタグを一括編集する（計算量は選択件数に比例）
+
+    Args:
+        image_tag_map: 画像タグマップ（MediaStore、その場で更新される）
+        all_tags: タグ集計用Counter（その場で更新される）
+        files: 対象ファイル名のリスト
+        tags: 追加・削除・置換に使うタグのリスト
+        mode: constants.TAG_EDIT_ADD / TAG_EDIT_REMOVE / TAG_EDIT_REPLACE
+
+    Returns:
+        dict: 実際に変更されたファイル名: (変更前タグ, 変更後タグ)
+    """
+    if mode not in (constants.TAG_EDIT_ADD, constants.TAG_EDIT_REMOVE, constants.TAG_EDIT_REPLACE):
+        raise ValueError(f"不明なタグ編集モード: {mode}")
+
+    edit_tags = list(dict.fromkeys(tags))  # 順序を保ったまま重複を除去
+    edit_set = set(edit_tags)
+    changes = {}
+
+    for fname in files:
+        record = image_tag_map.get(fname)
+        if record is None:
             continue
-            
-        # ファイルハッシュをチェックしてファイル変更を検知
-        current_hash = _calculate_file_hash(file_path)
-        cached_hash = file_info.get("file_hash", "")
-        
-        # ファイルが変更されているか、サムネイルがない場合
-        if current_hash != cached_hash or not file_info.get("thumbnail", {}):
-            print(f"サムネイル生成中: {filename}")
-            file_info["thumbnail"] = _generate_thumbnail_base64(file_path)
-            file_info["file_hash"] = current_hash
-            updated = True
-    
-    return updated
 
+        old_tags = list(record.tags)
+        if mode == constants.TAG_EDIT_ADD:
+            new_tags = old_tags + [t for t in edit_tags if t not in old_tags]
+        elif mode == constants.TAG_EDIT_REMOVE:
+            new_tags = [t for t in old_tags if t not in edit_set]
+        else:
+            new_tags = list(edit_tags)
+
+        if new_tags == old_tags:
+            continue
+
+        image_tag_map.set_tags(fname, new_tags)
+        changes[fname] = (old_tags, new_tags)
+        _update_tag_counts(all_tags, old_tags, new_tags)
+
+    return changes
 
-def scan_tags(forlder_path):
-    # フォルダ内の画像・動画ファイルをスキャンし、タグ情報を初期化・読み込みする
-    files = [f for f in os.listdir(forlder_path) if os.path.splitext(f)[1].lower() in constants.VIDEO_AND_IMAGE_EXTS]
 
-    # タグマップファイルのパス
-    tags_json_path = os.path.join(forlder_path, constants.PICTURE_TAGS_JSON)
+def revert_tag_changes(image_tag_map, all_tags, changes):
+    """
+    bulk_update_tags の変更を元に戻す（ファイルへの保存に失敗した場合）
+
+    Args:
+        image_tag_map: 画像タグマップ（MediaStore、その場で更新される）
+        all_tags: タグ集計用Counter（その場で更新される）
+        changes: 元に戻すファイル名: (変更前タグ, 変更後タグ)
+    """
+    for fname, (old_tags, new_tags) in changes.items():
+        if fname not in image_tag_map:
+            continue
+        image_tag_map.set_tags(fname, old_tags)
+        _update_tag_counts(all_tags, new_tags, old_tags)
+
+
+def _update_tag_counts(all_tags, old_tags, new_tags):
+    """タグ集計を差分で更新（件数0のタグは削除してscan_tagsの結果と揃える）"""
+    all_tags.update(new_tags)
+    all_tags.subtract(old_tags)
+    for tag in old_tags:
+        if all_tags.get(tag, 0) <= 0:
+            del all_tags[tag]
+
+
+# ジャーナルファイルのパス: 追記・読み込み・圧縮を直列化するロック
+# （スキャンのワーカースレッドによる圧縮と、メインスレッドからの追記が重なると追記分を失うため）
+_journal_locks = {}
+_journal_locks_lock = threading.Lock()
+
+
+def _journal_lock(folder_path):
+    """フォルダのタグ変更ジャーナル用のロックを取得"""
+    journal_path = media_fs.tag_journal_path(folder_path)
+    with _journal_locks_lock:
+        lock = _journal_locks.get(journal_path)
+        if lock is None:
+            lock = _journal_locks[journal_path] = threading.Lock()
+        return lock
+
+
+def append_tag_journal(folder_path, changes):
+    """
+    タグ変更の差分をジャーナルファイルへ追記する
+    image_tag_map.json 全体を書き直さず、変更されたファイル分だけを保存する
+
+    Args:
+        folder_path: 対象フォルダ
+        changes: bulk_update_tags の戻り値
+
+    Returns:
+        bool: 保存に成功したかどうか
+    """
+    if not changes:
+        return True
+
+    journal_path = media_fs.tag_journal_path(folder_path)
+    lines = [
+        json.dumps({"file": fname, "tags": new_tags}, ensure_ascii=False)
+        for fname, (_, new_tags) in changes.items()
+    ]
+    try:
+        with _journal_lock(folder_path), open(journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+    except Exception as e:
+        print(f"{constants.PICTURE_TAGS_JOURNAL} への追記に失敗: {e}")
+        return False
+
+
+def _apply_tag_journal(folder_path, tag_map):
+    """
+    ジャーナルファイルのタグ変更を既存のタグマップに反映する
+
+    Returns:
+        tuple: (ジャーナルに反映すべき変更があったかどうか, 読み込んだバイト数)
+    """
+    journal_path = media_fs.tag_journal_path(folder_path)
+    if not os.path.exists(journal_path):
+        return False, 0
+
+    applied = False
+    try:
+        # 追記途中の行を読んで、その分を圧縮で消さないよう追記と同じロックで読む
+        with _journal_lock(folder_path), open(journal_path, "rb") as f:
+            data = f.read()
+    except Exception as e:
+        print(f"{constants.PICTURE_TAGS_JOURNAL} の読み込みに失敗: {e}")
+        return False, 0
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            # 書き込み途中で終了した末尾行などは無視
+            continue
+        tag_map.setdefault(entry["file"], {})["tags"] = entry.get("tags", [])
+        applied = True
+    return applied, len(data)
+
+
+def _clear_tag_journal(folder_path, read_bytes):
+    """
+    JSON本体へ反映済みのジャーナルを削除する
+    読み込んだ後に追記された分（スキャン中のタグ編集）は次回反映するため残す
+    （末尾の読み取りから置き換えまでの間に追記されないよう、追記と同じロックを保持する）
+
+    Args:
+        folder_path: 対象フォルダ
+        read_bytes: _apply_tag_journal で読み込んだバイト数
+    """
+    journal_path = media_fs.tag_journal_path(folder_path)
+    try:
+        with _journal_lock(folder_path):
+            if not os.path.exists(journal_path):
+                return
+            with open(journal_path, "rb") as f:
+                f.seek(read_bytes)
+                tail = f.read()
+            if not tail:
+                os.remove(journal_path)
+                return
+            tmp_path = journal_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, journal_path)
+    except Exception as e:
+        print(f"{constants.PICTURE_TAGS_JOURNAL} の削除に失敗: {e}")
+
+
+def _provisional_mtime(file_path):
+    """スキャン前に表示する仮の日付（ファイル更新日時。取得できない場合0）"""
+    try:
+        return media_fs.stat_media(file_path)[1]
+    except OSError:
+        return 0
+
+
+def iter_scan(folder_path, cancel_event=None):
+    """
+    フォルダ（またはZIPアーカイブ）をスキャンし、進み具合をイベントとして順に返すジェネレータ
+    - JSONとジャーナルの既存情報を読み込んだ時点で、全ファイルの FileDiscovered を返す
+      （受け取った側はハッシュ・サムネイルの更新を待たずに表示を始められる）
+      日付が未解析のファイルはファイル更新日時を仮の日付にし、撮影日時は MetadataReady で届く
+      （前回記録した更新日時があればそれを使う。記録がない新規ファイルは、高遅延モードでは
+      statも省いて作成日時0のまま返す）
+    - ファイルごとの更新結果を MetadataReady / ThumbnailReady / ScanError で返す
+    - SCAN_PROGRESS_INTERVAL_SEC ごとに ScanProgress を返す
+    - 最後に、変更があればJSONを保存して ScanDone を返す
+      （取り消した場合も処理済みの結果は保存し、未処理のファイルは次回のスキャンで処理する）
+
+    Args:
+        folder_path: フォルダまたはZIPアーカイブのパス
+        cancel_event: セットするとスキャンを取り消す threading.Event（省略可）
+
+    Yields:
+        scan_events のイベント
+    """
+    files = media_fs.list_media(folder_path)
+
+    # タグマップファイルのパス（アーカイブの場合は隣のサイドカーファイル）
+    tags_json_path = media_fs.tags_json_path(folder_path)
     existing_tag_map = {}
-    
+
     # 1. 既存のJSONファイルが存在する場合は読み込み
     if os.path.exists(tags_json_path):
         try:
@@ -124,55 +673,149 @@ def scan_tags(forlder_path):
         except Exception as e:
             print(f"{constants.PICTURE_TAGS_JSON} の読み込みに失敗: {e}")
             existing_tag_map = {}
-    
+
+    # 未反映のタグ変更ジャーナルがあれば重ねて適用
+    journal_applied, journal_bytes = _apply_tag_journal(folder_path, existing_tag_map)
+
     # 2. 新しいimage_tag_mapを構築
-    image_tag_map = {}
-    temp_tags = []
-    all_tags = collections.Counter()  # タグ集計用のCounterオブジェクト
+    image_tag_map = MediaStore()
+    high_latency = media_fs.is_high_latency(folder_path)
     for fname in files:
-        file_path = os.path.join(forlder_path, fname)
-        mtime = os.path.getmtime(file_path)
-        mtime_str = datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-        
         # 既存のJSONにデータがある場合は既存のタグ情報を使用、ない場合は新規作成
-        if fname in existing_tag_map:
-            # 既存データの更新（日付は最新のファイル更新日時で更新、タグは既存を保持）
-            image_tag_map[fname] = {
-                "createday": mtime_str, 
-                "tags": existing_tag_map[fname].get("tags", []),
-                "thumbnail": existing_tag_map[fname].get("thumbnail", {}),
-                "file_hash": _calculate_file_hash(file_path)
-            }
+        # （ハッシュ・statシグネチャは変更検知のため前回の値を保持）
+        # 日付は解析済みならJSONの値、未解析なら手順4で撮影日時（またはファイル更新日時）を設定
+        # （それまではファイル更新日時を仮の日付にする。ファイルの中身はここでは読まない）
+        entry = existing_tag_map.get(fname, {})
+        thumbnail = entry.get("thumbnail") or {}
+        date_source = entry.get("date_source", "")
+        if date_source:
+            created = datetime.datetime.strptime(entry["createday"], DATE_FORMAT).timestamp()
+        elif entry.get("stat"):
+            created = media_fs.signature_mtime(entry["stat"])
+        elif not high_latency:
+            created = _provisional_mtime(os.path.join(folder_path, fname))
         else:
-            # 新規データの作成
-            image_tag_map[fname] = {
-                "createday": mtime_str, 
-                "tags": [],
-                "thumbnail": {},
-                "file_hash": _calculate_file_hash(file_path)
-            }
-        
-        # タグ集計用の一時リストに追加
-        temp_tags.extend(image_tag_map[fname]["tags"])
-        
-    
-    # 3. タグ情報の集計
-    tag_counter = collections.Counter(temp_tags)
-    
-    # 他のタグを追加更新
-    all_tags.update(tag_counter)
+            created = 0
+        record = image_tag_map.add(
+            fname,
+            created,
+            entry.get("tags", []),
+            bytes.fromhex(entry.get("file_hash", "")),
+            base64.b64decode(thumbnail["data"]) if "data" in thumbnail else b"",
+            date_source,
+            entry.get("stat", 0),
+            base64.b64decode(entry["descriptor"]) if "descriptor" in entry else b"",
+        )
+        yield scan_events.FileDiscovered(record)
+
+    # 前回のJSONにあってフォルダからなくなったファイル
+    removed = [fname for fname in existing_tag_map if fname not in image_tag_map]
+    for fname in removed:
+        yield scan_events.FileRemoved(fname)
+
+    # JSONの辞書は不要になったので解放
+    existing_tag_map = None
+
+    # 3. タグ情報の集計とファイル名検索インデックスの構築
+    all_tags = image_tag_map.tag_counts()
+    image_tag_map.name_index()
+
+    # 4. サムネイルキャッシュと撮影日時の更新（新規・変更ファイルのみ）
+    meter = scan_events.ProgressMeter(len(image_tag_map))
+    next_progress = time.monotonic() + constants.SCAN_PROGRESS_INTERVAL_SEC
+    cache_updated = bool(removed)
+    for record, metadata_changed, thumbnail_changed, error in _iter_file_updates(
+            folder_path, image_tag_map, cancel_event):
+        meter.advance()
+        if error is not None:
+            print(f"ファイルの処理に失敗: {record.name}: {error}")
+            yield scan_events.ScanError(record.name, error)
+        if metadata_changed:
+            cache_updated = True
+            yield scan_events.MetadataReady(record)
+        if thumbnail_changed:
+            cache_updated = True
+            yield scan_events.ThumbnailReady(record)
+        if time.monotonic() >= next_progress:
+            next_progress = time.monotonic() + constants.SCAN_PROGRESS_INTERVAL_SEC
+            yield meter.snapshot()
+    cancelled = cancel_event is not None and cancel_event.is_set()
+    yield meter.snapshot()
 
-    # 4. サムネイルキャッシュの更新
-    cache_updated = update_thumbnail_cache(forlder_path, image_tag_map)
-    
     # 5. 更新されたJSONファイルを保存（タグまたはサムネイルが更新された場合）
-    if cache_updated:
+    saved = False
+    if cache_updated or journal_applied:
         try:
-            with open(tags_json_path, "w", encoding="utf-8") as f:
-                json.dump(image_tag_map, f, ensure_ascii=False, indent=4)
+            image_tag_map.write_json(tags_json_path)
+            # ジャーナルの内容はJSON本体に取り込まれたので削除（コンパクション）
+            _clear_tag_journal(folder_path, journal_bytes)
+            saved = True
             print("サムネイルキャッシュが更新されました")
         except Exception as e:
             print(f"{constants.PICTURE_TAGS_JSON} の保存に失敗: {e}")
 
+    yield scan_events.ScanDone(image_tag_map, all_tags, cancelled, saved)
+
+
+def scan_tags(forlder_path, on_progress=None, cancel_event=None):
+    """
+    フォルダ（またはZIPアーカイブ）内の画像・動画ファイルをスキャンし、タグ情報を初期化・読み込みする
+    （iter_scan のイベントを最後まで読み進める）
+
+    Args:
+        forlder_path: フォルダまたはZIPアーカイブのパス
+        on_progress: ScanProgress を受け取るコールバック（省略可）
+        cancel_event: セットするとスキャンを取り消す threading.Event（省略可）
+
+    Returns:
+        tuple: (image_tag_map(MediaStore), all_tags)
+    """
+    for event in iter_scan(forlder_path, cancel_event):
+        if isinstance(event, scan_events.ScanProgress):
+            if on_progress is not None:
+                on_progress(event)
+        elif isinstance(event, scan_events.ScanDone):
+            return event.store, event.all_tags
+
+
+def _scan_cli(folder_path):
+    """
+    コマンドラインからフォルダをスキャンし、進捗バーを表示する
+    Ctrl+C で取り消した場合も、処理済みの結果は保存される
+    """
+    import sys
+    import signal
+    import threading
+
+    cancel_event = threading.Event()
+
+    def on_interrupt(signum, frame):
+        # 例外で中断するとジェネレータが終了して保存されないため、取り消しを要求するだけにする
+        cancel_event.set()
+        print("\n取り消しています...")
+
+    signal.signal(signal.SIGINT, on_interrupt)
+    counts = {"discovered": 0, "thumbnail": 0, "error": 0}
+    for event in iter_scan(folder_path, cancel_event):
+        if isinstance(event, scan_events.FileDiscovered):
+            counts["discovered"] += 1
+        elif isinstance(event, scan_events.ThumbnailReady):
+            counts["thumbnail"] += 1
+        elif isinstance(event, scan_events.ScanError):
+            counts["error"] += 1
+        elif isinstance(event, scan_events.ScanProgress):
+            width = 30
+            filled = width * event.done // event.total if event.total else width
+            sys.stdout.write(f"\r[{'#' * filled}{'.' * (width - filled)}] {event.format()}   ")
+            sys.stdout.flush()
+        elif isinstance(event, scan_events.ScanDone):
+            print()
+            status = "取り消し" if event.cancelled else "完了"
+            print(f"{status}: {counts['discovered']} 件中 サムネイル生成 {counts['thumbnail']} 件, "
+                  f"エラー {counts['error']} 件, 保存 {'あり' if event.saved else 'なし'}")
+
 
-    return image_tag_map, all_tags
+if __name__ == "__main__":
+    # 使い方: python src/logic.py <フォルダまたはZIPアーカイブ>
+    import sys
+    _scan_cli(sys.argv[1])
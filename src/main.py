@@ -1,14 +1,34 @@
 import os
-import json
+import queue
+import time
+import threading
+import datetime
 import logic
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
 import constants
+import tag_query
 from components.update_tag_menu import SubMenu 
 from components.tag_button_manager import TagButtonManager
 from components.date_range_manager import DateRangeManager 
 from components.thumbnail_display_manager import ThumbnailDisplayManager 
+from components.perf_hud import PerfHud
+from library_catalog import LibraryCatalog
+from media_store import MediaStore
+from tag_index import TagCompletionIndex
+import cache_maintenance
+import session_snapshot
+import scan_events
+import visual_index
+from thumbnail_cache import MemoryThumbnailCache
+
+# 表示形式の選択肢: タイムラインの区切り（None は一覧表示）
+TIMELINE_MODES = {
+    "一覧": None,
+    "日ごと": constants.TIMELINE_DAY,
+    "月ごと": constants.TIMELINE_MONTH,
+}
 
 
 class ThumbnailApp(tk.Tk):
@@ -31,13 +51,26 @@ class ThumbnailApp(tk.Tk):
 
         # データ管理
         self.all_tags = {}  # タグ情報を管理するdict タグ名: タグの出現回数
-        self.image_tag_map = {}  # メディアファイルのタグ情報管理: Json対応
+        self.tag_index = None  # タグ編集メニューの検索インデックス（初回のメニュー表示時に作成）
+        self.image_tag_map = MediaStore()  # メディアファイルのタグ情報管理（MediaStore）: Json対応
+
+        # ライブラリ（複数フォルダ）管理
+        self.library = LibraryCatalog()
+        self.library_mode = False  # True の場合、登録済みの全フォルダを横断表示
+        self._library_events = queue.Queue()  # バックグラウンド読み込み完了通知
+        self._name_search_job = None  # ファイル名検索の遅延実行（after のID）
+        self._maintenance_thread = None  # キャッシュ整理のバックグラウンドスレッド
+        # 表示中のフォルダのバックグラウンドのスキャン（初回の読み込み・前回のセッションから復元した後の再スキャン）
+        # (フォルダ, 取り消し用Event)
+        self._background_scan = None
         
         # UI状態管理
-        self._thumbnail_cache = {}  # サムネイルキャッシュ
+        self._thumbnail_cache = MemoryThumbnailCache()  # デコード済みサムネイルのメモリキャッシュ（LRU）
         self.scrollbar_visible = False
         self._last_size = (self.winfo_width(), self.winfo_height())  # ウィンドウサイズの初期値
         self.tag_menu = None  # タグメニューの参照
+        self.thumbnail_display_manager = None  # サムネイル表示管理クラスの参照
+        self._perf_hud_visible = constants.PERF_HUD_VISIBLE  # パフォーマンスHUDの表示状態（フォルダを開き直しても維持）
 
         # UI初期化
         self._setup_ui()
@@ -45,12 +78,27 @@ class ThumbnailApp(tk.Tk):
         # データ初期化
         self._initialize_data()
 
+        # ライブラリのバックグラウンド読み込み（変更のあるフォルダのみ再スキャン）
+        self.library.start_background_load(self._library_events.put)
+        self.after(200, self._poll_library_events)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
     # ===============================
     # 初期化・セットアップメソッド
     # ===============================
 
     def _clear_ui(self):
         """既存のUIコンポーネントをクリア"""
+        self._cancel_background_scan()
+        if self._name_search_job is not None:
+            self.after_cancel(self._name_search_job)
+            self._name_search_job = None
+
+        # サムネイル読み込みのワーカーを停止
+        if self.thumbnail_display_manager is not None:
+            self.thumbnail_display_manager.shutdown()
+            self.thumbnail_display_manager = None
+
         # すべての子ウィジェットを削除
         for widget in self.winfo_children():
             widget.destroy()
@@ -83,12 +131,70 @@ class ThumbnailApp(tk.Tk):
         self.tag_filedialog.pack(fill="x", padx=10, pady=2)
         btn = ttk.Button(self.tag_filedialog, text="フォルダ選択", command=lambda: self.show_select_folder())
         btn.pack(side="left", padx=5, pady=2)
+        btn = ttk.Button(self.tag_filedialog, text="ZIPを開く", command=lambda: self.show_select_archive())
+        btn.pack(side="left", padx=5, pady=2)
+        btn = ttk.Button(self.tag_filedialog, text="ライブラリに追加", command=lambda: self.add_folder_to_library())
+        btn.pack(side="left", padx=5, pady=2)
+        btn = ttk.Button(self.tag_filedialog, text="ライブラリ表示", command=lambda: self.show_library())
+        btn.pack(side="left", padx=5, pady=2)
+        btn = ttk.Button(self.tag_filedialog, text="キャッシュ整理", command=lambda: self.run_cache_maintenance())
+        btn.pack(side="left", padx=5, pady=2)
+
+        # タグ検索式（例: (風景 OR 旅行) AND NOT 仕事）
+        ttk.Label(self.tag_filedialog, text="検索式：").pack(side="left", padx=(10, 0))
+        self.query_var = tk.StringVar()
+        query_entry = ttk.Entry(self.tag_filedialog, textvariable=self.query_var, width=40)
+        query_entry.pack(side="left", padx=5, pady=2)
+        query_entry.bind("<Return>", lambda e: self.show_thumbnails())
+        btn = ttk.Button(self.tag_filedialog, text="検索", command=lambda: self.show_thumbnails())
+        btn.pack(side="left", padx=5, pady=2)
+
+        # ファイル名検索（部分一致。入力が止まったら自動で絞り込む）
+        ttk.Label(self.tag_filedialog, text="ファイル名：").pack(side="left", padx=(10, 0))
+        self.name_var = tk.StringVar()
+        name_entry = ttk.Entry(self.tag_filedialog, textvariable=self.name_var, width=20)
+        name_entry.pack(side="left", padx=5, pady=2)
+        name_entry.bind("<KeyRelease>", self._on_name_search_change)
+        name_entry.bind("<Return>", lambda e: self._run_name_search())
 
         self.tag_frame = tk.Frame(inner_frame)
         self.tag_frame.pack(fill="x", padx=10, pady=2)
 
         self.data_frame = tk.Frame(inner_frame)
         self.data_frame.pack(fill="x", padx=10, pady=2)
+
+        # 選択件数と一括選択（Ctrl+A: すべて選択、Ctrl+I: 反転、Esc: 解除）
+        selection_frame = tk.Frame(self.data_frame)
+        selection_frame.pack(side="right", padx=(10, 0))
+        self.selection_var = tk.StringVar(value="選択：0件")
+        ttk.Label(selection_frame, textvariable=self.selection_var).pack(side="left", padx=5)
+        ttk.Button(selection_frame, text="すべて選択",
+                   command=lambda: self.thumbnail_display_manager.select_all()).pack(side="left", padx=2)
+        ttk.Button(selection_frame, text="反転",
+                   command=lambda: self.thumbnail_display_manager.invert_selection()).pack(side="left", padx=2)
+        ttk.Button(selection_frame, text="解除",
+                   command=lambda: self.thumbnail_display_manager.clear_selection()).pack(side="left", padx=2)
+
+        # 表示形式（一覧 / タイムライン）と、タイムラインの区間への移動
+        self.jump_var = tk.StringVar()
+        self.jump_combo = ttk.Combobox(self.data_frame, textvariable=self.jump_var, width=20, state="disabled")
+        self.jump_combo.pack(side="right", padx=5)
+        self.jump_combo.bind("<<ComboboxSelected>>", self._on_timeline_jump)
+        ttk.Label(self.data_frame, text="移動：").pack(side="right")
+        self.timeline_var = tk.StringVar(value=next(iter(TIMELINE_MODES)))
+        timeline_combo = ttk.Combobox(self.data_frame, textvariable=self.timeline_var, width=8,
+                                      values=list(TIMELINE_MODES), state="readonly")
+        timeline_combo.pack(side="right", padx=5)
+        timeline_combo.bind("<<ComboboxSelected>>", self._on_timeline_mode_change)
+        ttk.Label(self.data_frame, text="表示：").pack(side="right")
+        self._jump_keys = []  # 移動先の選択肢に対応する区間の開始日
+
+        # 類似検索中の表示（解除ボタンで通常の表示に戻す）
+        self.similar_frame = tk.Frame(self.data_frame)
+        self.similar_var = tk.StringVar()
+        ttk.Label(self.similar_frame, textvariable=self.similar_var).pack(side="left")
+        ttk.Button(self.similar_frame, text="類似検索を解除",
+                   command=lambda: self.clear_similar()).pack(side="left", padx=5)
    
 
 
@@ -118,7 +224,7 @@ class ThumbnailApp(tk.Tk):
         self.canvas_thumb.pack(side="left", fill="both", expand=True)
         h_scroll_thumb = ttk.Scrollbar(thumb_area, orient="vertical", command=self.canvas_thumb.yview)
         h_scroll_thumb.pack(side="right", fill="y")
-        self.canvas_thumb.configure(yscrollcommand=h_scroll_thumb.set)
+        self.canvas_thumb.configure(yscrollcommand=lambda first, last: self._on_thumb_view_changed(h_scroll_thumb, first, last))
 
         self.image_frame = tk.Frame(self.canvas_thumb)
         self.canvas_thumb.create_window((0, 0), window=self.image_frame, anchor="nw")
@@ -140,6 +246,9 @@ class ThumbnailApp(tk.Tk):
 
         self.image_frame.bind("<Configure>", on_image_frame_configure)
 
+        # パフォーマンスHUD（サムネイル一覧の右上に重ねて表示）
+        self.perf_hud = PerfHud(thumb_area, visible=self._perf_hud_visible)
+
     def _setup_event_bindings(self):
         """イベントバインディングのセットアップ"""
         # マウスホイールスクロール対応
@@ -150,13 +259,36 @@ class ThumbnailApp(tk.Tk):
         # ウィンドウリサイズイベント
         self.bind("<Configure>", self._on_window_resize)
 
+        # パフォーマンスHUDの表示切り替え
+        self.bind(constants.PERF_HUD_KEY, self._toggle_perf_hud)
+
+        # 一括選択のショートカット（入力欄での文字の全選択などは妨げない）
+        self.bind("<Control-a>", lambda e: self._on_selection_shortcut(e, ThumbnailDisplayManager.select_all))
+        self.bind("<Control-i>", lambda e: self._on_selection_shortcut(e, ThumbnailDisplayManager.invert_selection))
+        self.bind("<Escape>", lambda e: self._on_selection_shortcut(e, ThumbnailDisplayManager.clear_selection))
+
     def _initialize_data(self):
         """データとマネージャークラスの初期化"""
         # メディアファイルのタグ情報とタグ一覧を取得
-        self.image_tag_map, self.all_tags = logic.scan_tags(self.select_folder)
-
-        if not self.image_tag_map:
-            messagebox.showinfo(messagebox.INFO, "選択されたフォルダには画像・動画が含まれていません。")
+        session = None
+        if self.library_mode:
+            # ライブラリ表示ではキーが絶対パスのため、フォルダは空文字とする
+            self.image_tag_map, self.all_tags = self.library.merged_map()
+        else:
+            store, session = (
+                session_snapshot.load(self.select_folder) if constants.SESSION_SNAPSHOT_ENABLED else (None, None)
+            )
+            if store is not None:
+                # 前回のセッションから即座に表示し、スキャンはバックグラウンドで行って差分を反映
+                self.image_tag_map, self.all_tags = store, store.tag_counts()
+                self._start_reconcile()
+            else:
+                # 空の状態で表示を始め、バックグラウンドのスキャンで見つかったファイルから順に表示する
+                self.image_tag_map = MediaStore()
+                self.all_tags = self.image_tag_map.tag_counts()
+                self._start_scan()
+        self.tag_index = None
+        self._similar_file = None  # 類似検索の基準のファイル（None は通常の表示）
         
         # タグボタン管理クラスの初期化
         self.tag_button_manager = TagButtonManager(
@@ -175,14 +307,273 @@ class ThumbnailApp(tk.Tk):
         # サムネイル表示管理クラスの初期化
         self.thumbnail_display_manager = ThumbnailDisplayManager(
             parent_frame=self.image_frame,
-            select_folder=self.select_folder,
+            select_folder="" if self.library_mode else self.select_folder,
             thumbnail_cache=self._thumbnail_cache,
-            on_right_click_callback=self.on_main_frame_right_click
+            on_right_click_callback=self.on_main_frame_right_click,
+            viewport_canvas=self.canvas_thumb,
+            on_similar_callback=self.show_similar,
+            on_selection_change_callback=self._on_selection_change
         )
+        self._on_selection_change(0)
 
         # show_thumbnailsラッパーメソッドを設定
         self.show_thumbnails = self._show_thumbnails_wrapper
 
+        # 前回の絞り込み条件・日付範囲・スクロール位置を復元
+        if not self.library_mode and session:
+            self._restore_session(session)
+
+    def _restore_session(self, session):
+        """
+        前回のセッションの表示状態を復元
+        - 検索式・ファイル名・選択タグ・日付範囲（絞り込んでいた場合のみ）を入力欄に戻す
+        - スクロール位置はサムネイルの配置後に戻す
+        """
+        self.query_var.set(session.get("query_text", ""))
+        self.name_var.set(session.get("name_text", ""))
+        for tag in session.get("selected_tags", []):
+            self.tag_button_manager.set_tag_selection(tag, True)
+        if session.get("date_range"):
+            from_date, to_date = (datetime.date.fromisoformat(d) for d in session["date_range"])
+            self.date_range_manager.set_date_range(from_date, to_date)
+        if session.get("scroll"):
+            self.after(constants.SESSION_SCROLL_RETRY_MS, self._restore_scroll, session["scroll"], 0)
+
+    def _restore_scroll(self, fraction, attempt):
+        """
+        サムネイルが配置されたらスクロール位置を戻す
+        （起動直後はウィンドウの表示とサムネイルの配置を待って再試行）
+        """
+        manager = self.thumbnail_display_manager
+        if manager is None:
+            return
+        if not self.winfo_ismapped() or not manager.displayed_files:
+            if attempt < constants.SESSION_SCROLL_RETRIES:
+                self.after(constants.SESSION_SCROLL_RETRY_MS, self._restore_scroll, fraction, attempt + 1)
+            return
+        self.update_idletasks()
+        self.canvas_thumb.configure(scrollregion=self.canvas_thumb.bbox("all"))
+        self.canvas_thumb.yview_moveto(fraction)
+
+    def _save_session(self):
+        """表示中のフォルダのメディア情報と表示状態をスナップショットに保存"""
+        if (not constants.SESSION_SNAPSHOT_ENABLED or self.library_mode or not self.select_folder
+                or not self.image_tag_map or self.thumbnail_display_manager is None):
+            return
+        # 日付範囲はデータ全体の範囲から絞り込んでいた場合だけ保存（追加されたファイルを隠さない）
+        date_range = self.date_range_manager.get_date_range()
+        bounds = self.image_tag_map.date_bounds()
+        if bounds and date_range == (bounds[0].date(), bounds[1].date()):
+            date_range = None
+        session = {
+            "query_text": self.query_var.get(),
+            "name_text": self.name_var.get(),
+            "selected_tags": self.tag_button_manager.get_selected_tags(),
+            "date_range": [d.isoformat() for d in date_range] if date_range else None,
+            "scroll": self.canvas_thumb.yview()[0],
+        }
+        session_snapshot.save(self.select_folder, self.image_tag_map, session)
+
+    def _start_reconcile(self):
+        """
+        前回のセッションから復元したメディア情報とフォルダの実際の内容を、バックグラウンドのスキャンで照合する
+        （スキャン結果は _poll_reconcile でメインスレッドに反映）
+        """
+        folder = self.select_folder
+        cancel_event = threading.Event()
+        results = queue.Queue()
+
+        def run():
+            try:
+                # 取り消されたかどうかが必要なため、scan_tags ではなく ScanDone を直接受け取る
+                for event in logic.iter_scan(folder, cancel_event):
+                    if isinstance(event, scan_events.ScanDone):
+                        results.put(event)
+            except Exception as e:
+                results.put(e)
+
+        self._background_scan = (folder, cancel_event)
+        threading.Thread(target=run, name="session-reconcile", daemon=True).start()
+        self.after(constants.SESSION_RECONCILE_POLL_MS, self._poll_reconcile, cancel_event, results)
+
+    def _cancel_background_scan(self):
+        """スキャン・再スキャンを取り消す（処理済みの結果は logic.iter_scan がJSONへ保存する）"""
+        if self._background_scan is not None:
+            self._background_scan[1].set()
+            self._background_scan = None
+
+    def _start_scan(self):
+        """
+        フォルダをバックグラウンドでスキャンし、イベントをキュー経由でメインスレッドに送る
+        （_poll_scan が見つかったファイルから順に表示に反映する）
+        """
+        folder = self.select_folder
+        cancel_event = threading.Event()
+        events = queue.Queue()
+        record_events = (scan_events.FileDiscovered, scan_events.MetadataReady, scan_events.ThumbnailReady)
+
+        def run():
+            try:
+                for event in logic.iter_scan(folder, cancel_event):
+                    if isinstance(event, record_events):
+                        # レコードはスキャン側で更新され続けるため、送る時点の値を写す
+                        events.put((type(event), event.record.fields()))
+                    elif not isinstance(event, scan_events.FileRemoved):
+                        events.put((type(event), event))
+            except Exception as e:
+                events.put((Exception, e))
+
+        self._background_scan = (folder, cancel_event)
+        threading.Thread(target=run, name="folder-scan", daemon=True).start()
+        self.after(constants.SCAN_STREAM_POLL_MS, self._poll_scan, cancel_event, events, self.title(), 0.0, None)
+
+    def _poll_scan(self, cancel_event, events, base_title, last_render, auto_range):
+        """
+        スキャンのイベントを表示に反映（メインスレッドで定期実行）
+        - FileDiscovered: ファイルを追加して一覧を表示し直す（タグボタン・全期間の日付範囲も更新）
+        - MetadataReady / ThumbnailReady: 日付・サムネイルを更新し、セルの画像を読み直す
+          （日付による並べ直しは SCAN_STREAM_RENDER_INTERVAL_MS ごとにまとめて行う）
+        - ScanProgress: タイトルバーに進捗（件数・速度・残り時間）を表示
+        - ScanDone: タイトルを戻し、最終結果で表示し直す
+        タグは表示中の値を使う（スキャン中の編集はジャーナルに残っている）
+
+        Args:
+            cancel_event: スキャンの取り消し用Event（取り消し・開き直した後の古いスキャンの結果は捨てる）
+            events: スキャンのワーカースレッドから届くイベントのキュー
+            base_title: スキャン前のウィンドウタイトル
+            last_render: 最後に一覧を表示し直した時刻（time.monotonic）
+            auto_range: 最後にデータから自動設定した日付範囲（未設定はNone）。
+                        利用者が日付で絞り込んだ後は範囲を変えない
+        """
+        if self._background_scan is None or self._background_scan[1] is not cancel_event:
+            return
+        store = self.image_tag_map
+
+        discovered = False
+        dated = False
+        updated = {}
+        progress = None
+        done = None
+        try:
+            while done is None:
+                kind, payload = events.get_nowait()
+                if kind is scan_events.FileDiscovered:
+                    self.all_tags.update(store.add(*payload).tags)
+                    discovered = True
+                elif kind is scan_events.MetadataReady or kind is scan_events.ThumbnailReady:
+                    record = store.get(payload[0])
+                    if record is not None:
+                        dated = dated or payload[1] != record.created
+                        updated[record.name] = store.add(payload[0], payload[1], record.tags, *payload[3:])
+                elif kind is scan_events.ScanProgress:
+                    progress = payload
+                else:
+                    done = payload
+        except queue.Empty:
+            pass
+
+        if done is not None:
+            self._background_scan = None
+            self.title(base_title)
+            if kind is Exception:
+                print(f"フォルダのスキャンに失敗: {done}")
+            elif not store and not done.cancelled:
+                messagebox.showinfo(messagebox.INFO, "選択されたフォルダには画像・動画が含まれていません。")
+        elif progress is not None:
+            self._show_scan_progress(base_title, progress)
+
+        if discovered:
+            selected_tags = self.tag_button_manager.get_selected_tags()
+            self.tag_index = None
+            self.tag_button_manager.update_tag_counts(self.all_tags)
+            for tag in selected_tags:
+                self.tag_button_manager.set_tag_selection(tag, True)
+        if updated:
+            self.thumbnail_display_manager.invalidate_records(updated.values())
+
+        now = time.monotonic()
+        render_due = now - last_render >= constants.SCAN_STREAM_RENDER_INTERVAL_MS / 1000
+        if discovered or (dated and render_due) or (done is not None and (dated or updated)):
+            self.date_range_manager.image_tag_map = store
+            if auto_range is None or self.date_range_manager.get_date_range() == auto_range:
+                self.date_range_manager.set_date_range_from_image_data(store)
+                auto_range = self.date_range_manager.get_date_range()
+            self.show_thumbnails()
+            last_render = now
+        if done is None:
+            self.after(constants.SCAN_STREAM_POLL_MS, self._poll_scan,
+                       cancel_event, events, base_title, last_render, auto_range)
+
+    def _poll_reconcile(self, cancel_event, results):
+        """
+        再スキャンの完了を待って差分を反映
+        （取り消した再スキャンの結果は捨てる。同じフォルダを開き直した場合も、新しい再スキャンとは取り消し用Eventで区別する）
+        """
+        if self._background_scan is None or self._background_scan[1] is not cancel_event:
+            return
+        try:
+            result = results.get_nowait()
+        except queue.Empty:
+            self.after(constants.SESSION_RECONCILE_POLL_MS, self._poll_reconcile, cancel_event, results)
+            return
+        self._background_scan = None
+        if isinstance(result, Exception):
+            print(f"フォルダの再スキャンに失敗: {result}")
+            return
+        if result.cancelled:
+            # 未処理のファイルは前回の値・新規ファイルは日付未設定のままのため反映しない
+            return
+        self._apply_reconcile(result.store)
+
+    def _apply_reconcile(self, scanned):
+        """
+        再スキャンの結果を表示中のメディア情報に反映
+        - 追加・削除されたファイルを反映
+        - 内容が変わったファイルは作成日時・ハッシュ・サムネイルを更新し、セルの画像を読み直す
+        - タグは表示中の値を使う（再スキャン中の編集はジャーナルに残っている）
+
+        Args:
+            scanned: 再スキャンで得た MediaStore
+        """
+        store = self.image_tag_map
+        bounds = store.date_bounds()
+        full_range = bounds is not None and \
+            self.date_range_manager.get_date_range() == (bounds[0].date(), bounds[1].date())
+        removed = [name for name in store if name not in scanned]
+        for name in removed:
+            store.remove(name)
+
+        added = []
+        changed = []
+        for name, new in scanned.items():
+            record = store.get(name)
+            if record is None:
+                added.append(store.add(name, new.created, new.tags, new.file_hash, new.thumbnail,
+                                       new.date_source, new.stat_signature, new.descriptor))
+            elif (record.file_hash, record.created, record.thumbnail, record.date_source) != \
+                    (new.file_hash, new.created, new.thumbnail, new.date_source):
+                changed.append(store.add(name, new.created, record.tags, new.file_hash, new.thumbnail,
+                                         new.date_source, new.stat_signature, new.descriptor))
+            else:
+                record.stat_signature = new.stat_signature
+                if record.descriptor != new.descriptor:
+                    store.set_descriptor(name, new.descriptor)
+        if not (removed or added or changed):
+            return
+
+        if removed or added:
+            selected_tags = self.tag_button_manager.get_selected_tags()
+            self.all_tags = store.tag_counts()
+            self.tag_index = None
+            self.tag_button_manager.update_tag_counts(self.all_tags)
+            for tag in selected_tags:
+                self.tag_button_manager.set_tag_selection(tag, True)
+        if full_range:
+            # 日付で絞り込んでいなければ、追加・変更されたファイルの日付まで範囲を広げる
+            self.date_range_manager.set_date_range_from_image_data(store)
+        self.thumbnail_display_manager.invalidate_records(changed)
+        self.show_thumbnails()
+
     # ===============================
     # 公開メソッド（外部インターフェース）
     # ===============================
@@ -196,17 +587,76 @@ class ThumbnailApp(tk.Tk):
         date_range = self.date_range_manager.get_date_range()
         frame_width = self.winfo_width()
         
-        self.thumbnail_display_manager.show_thumbnails(
-            image_tag_map=self.image_tag_map,
-            date_range=date_range,
-            selected_tags=selected_tags,
-            frame_width=frame_width
-        )
+        try:
+            self.thumbnail_display_manager.show_thumbnails(
+                image_tag_map=self.image_tag_map,
+                date_range=date_range,
+                selected_tags=selected_tags,
+                frame_width=frame_width,
+                query_text=self.query_var.get(),
+                name_text=self.name_var.get(),
+                similar_to=self._similar_file
+            )
+        except tag_query.TagQueryError as e:
+            messagebox.showwarning(messagebox.WARNING, f"検索式が正しくありません: {e}")
+            return
+
+        self._update_facet_counts()
+        self._update_timeline_jump()
+
+    def _update_timeline_jump(self):
+        """タイムラインの区間を移動先の選択肢に反映（一覧表示では無効）"""
+        sections = self.thumbnail_display_manager.timeline_sections()
+        self._jump_keys = [key for key, _, _ in sections]
+        self.jump_combo["values"] = [f"{label}（{count}件）" for _, label, count in sections]
+        self.jump_combo.configure(state="readonly" if sections else "disabled")
+        self.jump_var.set("")
+
+    def _update_facet_counts(self):
+        """現在の絞り込み結果に対するファセット件数をタグボタンに反映"""
+        index = self.image_tag_map.query_index()
+        facet_counts = index.facet_counts(self.thumbnail_display_manager.last_result_bits)
+        self.tag_button_manager.update_facet_counts(facet_counts)
 
     # ===============================
     # イベントハンドラメソッド
     # ===============================
 
+    def _show_scan_progress(self, base_title, progress):
+        """スキャンの進捗をタイトルバーに表示"""
+        self.title(f"{base_title} - 読み込み中 {progress.format()}")
+
+    def _on_name_search_change(self, event):
+        """ファイル名の入力中は検索を遅らせ、入力が止まってから1回だけ絞り込む"""
+        if self._name_search_job is not None:
+            self.after_cancel(self._name_search_job)
+        self._name_search_job = self.after(constants.NAME_SEARCH_DELAY_MS, self._run_name_search)
+
+    def _run_name_search(self):
+        """ファイル名の条件が前回の表示から変わっていれば再表示"""
+        if self._name_search_job is not None:
+            self.after_cancel(self._name_search_job)
+            self._name_search_job = None
+        if self.thumbnail_display_manager is None:
+            return
+        last_filter = self.thumbnail_display_manager.last_filter
+        if last_filter is not None and last_filter[2] == self.name_var.get():
+            return  # カーソル移動など入力が変わらないキー操作
+        self.show_thumbnails()
+
+    def _on_timeline_mode_change(self, event):
+        """表示形式（一覧・日ごと・月ごと）を切り替えて再表示（類似検索中は解除）"""
+        self._set_similar_file(None)
+        self.thumbnail_display_manager.set_timeline(TIMELINE_MODES[self.timeline_var.get()])
+        self.canvas_thumb.yview_moveto(0)
+        self.show_thumbnails()
+
+    def _on_timeline_jump(self, event):
+        """選択した区間までスクロール"""
+        index = self.jump_combo.current()
+        if 0 <= index < len(self._jump_keys):
+            self.thumbnail_display_manager.jump_to_section(self._jump_keys[index])
+
     def _on_window_resize(self, event):
         """
         ウィンドウサイズが変更された時の処理
@@ -219,6 +669,30 @@ class ThumbnailApp(tk.Tk):
                 self._last_size = new_size
                 self.after_idle(self.show_thumbnails)
 
+    def _on_selection_change(self, count):
+        """選択件数の表示を更新"""
+        self.selection_var.set(f"選択：{count:,}件")
+
+    def _on_selection_shortcut(self, event, action):
+        """一括選択のショートカットキーの処理（入力欄にフォーカスがある場合は何もしない）"""
+        if isinstance(event.widget, tk.Entry) or self.thumbnail_display_manager is None:
+            return
+        action(self.thumbnail_display_manager)
+
+    def _toggle_perf_hud(self, event):
+        """パフォーマンスHUDの表示・非表示を切り替え"""
+        self._perf_hud_visible = self.perf_hud.toggle()
+
+    def _on_thumb_view_changed(self, scrollbar, first, last):
+        """
+        サムネイル一覧の表示範囲が変わった時の処理（スクロール・リサイズ）
+        - スクロールバーを更新
+        - 表示範囲に近いサムネイルから読み込むよう優先順位を更新
+        """
+        scrollbar.set(first, last)
+        if self.thumbnail_display_manager is not None:
+            self.thumbnail_display_manager.update_viewport()
+
     def _on_mousewheel(self, event):
         """マウスホイールのスクロール処理"""
         if self.scrollbar_visible:
@@ -237,53 +711,77 @@ class ThumbnailApp(tk.Tk):
         メインフレームで右クリックされた時の処理
         - タグ編集メニューを表示
         """
-        self.tag_menu = SubMenu(self, event.x_root, event.y_root, list(self.all_tags.keys()), self.on_tag_menu_close)
+        if self.tag_index is None:
+            self.tag_index = TagCompletionIndex(tag for tag, count in self.all_tags.items() if count > 0)
+        self.tag_menu = SubMenu(self, event.x_root, event.y_root, list(self.all_tags.keys()),
+                                self.on_tag_menu_close, tag_index=self.tag_index)
         self.tag_menu.transient(self)
         self.tag_menu.grab_set()
         self.tag_menu.focus_set()
         self.tag_menu.protocol("WM_DELETE_WINDOW", self.on_tag_menu_close)
 
-    def on_tag_menu_close(self, update_tags=None):
+    def on_tag_menu_close(self, update_tags=None, mode=constants.TAG_EDIT_REPLACE):
         """
         タグ編集メニューが閉じられた時の処理
         - タグの更新が選択された場合：
-          - 選択されたファイルのタグを更新
-          - タグ一覧を再読み込み
-          - サムネイルを再表示
+          - 選択されたファイルのタグを追加・削除・置換で一括更新
+          - 変更差分だけをジャーナルに保存
+          - 件数の変わったタグボタンと、変更されたサムネイルだけを再描画
         - 更新がキャンセルされた場合：
           - メニューを閉じる
         """
         if update_tags:
             selected_items = self.thumbnail_display_manager.get_selected_items()
-            if messagebox.askyesno(messagebox.YESNO, f"{update_tags}のタグで\n{len(selected_items)}件の選択した写真を更新しますか？"):
-                # タグの更新処理
-                for fname in selected_items:
-                    self.image_tag_map[fname]["tags"] = update_tags
-                
-                # ファイルへの保存
-                try:
-                    if self.select_folder and constants.PICTURE_TAGS_JSON:
-                        json_path = os.path.join(self.select_folder, constants.PICTURE_TAGS_JSON)
-                        with open(json_path, "w", encoding="utf-8") as f:
-                            json.dump(self.image_tag_map, f, ensure_ascii=False, indent=4)
-                    else:
-                        print("フォルダまたはPICTURE_TAGS_JSONが設定されていません。")
-                        return
-                except Exception as e:
-                    print(f"タグマップの保存に失敗しました: {e}")
+            mode_text = {
+                constants.TAG_EDIT_ADD: "を追加",
+                constants.TAG_EDIT_REMOVE: "を削除",
+                constants.TAG_EDIT_REPLACE: "で更新",
+            }[mode]
+            if messagebox.askyesno(messagebox.YESNO, f"{update_tags}のタグ{mode_text}\n{len(selected_items)}件の選択した写真を更新しますか？"):
+                if not self.library_mode and (not self.select_folder or not constants.PICTURE_TAGS_JOURNAL):
+                    print("フォルダまたはPICTURE_TAGS_JOURNALが設定されていません。")
                     return
-                
-                # UI更新処理
-                self.image_tag_map, self.all_tags = logic.scan_tags(self.select_folder)
-                self.tag_button_manager.update_tag_counts(self.all_tags)
-
-                # 選択状態の復元
-                for tag in self.tag_button_manager.get_selected_tags():
-                    if tag in self.tag_button_manager.check_vars:
-                        self.tag_button_manager.set_tag_selection(tag, True)
- 
-                self.show_thumbnails()
-                self.canvas_thumb.yview_moveto(0)
+
+                # タグの更新処理（メモリ上のマップとタグ集計を差分更新）
+                changes = logic.bulk_update_tags(
+                    self.image_tag_map, self.all_tags, selected_items, update_tags, mode
+                )
+
+                # 変更差分だけをファイルへ保存（ライブラリ表示ではフォルダごとに振り分け）
+                if self.library_mode:
+                    failed = self.library.apply_tag_changes(changes)
+                elif logic.append_tag_journal(self.select_folder, changes):
+                    failed = {}
+                else:
+                    failed = changes
+                if failed:
+                    # 保存できなかった変更はメモリ上のマップとタグ集計から元に戻す
+                    logic.revert_tag_changes(self.image_tag_map, self.all_tags, failed)
+                    messagebox.showwarning(
+                        messagebox.WARNING, f"タグの保存に失敗したため、{len(failed)}件の変更を元に戻しました。"
+                    )
+                    if len(failed) == len(changes):
+                        return
+                    changes = {fname: change for fname, change in changes.items() if fname not in failed}
+
+                # UI更新処理（変更のあったタグとセルだけ）
+                changed_tags = set()
+                for old_tags, new_tags in changes.values():
+                    changed_tags.update(old_tags)
+                    changed_tags.update(new_tags)
+
+                before_tags = self.tag_button_manager.get_selected_tags()
+                self.tag_button_manager.apply_tag_count_changes(changed_tags)
+                if self.tag_index is not None:
+                    self.tag_index.sync_counts(self.all_tags, changed_tags)
+
+                if self.tag_button_manager.get_selected_tags() != before_tags:
+                    # 選択中のタグが消えた場合は表示条件自体が変わるため再表示
+                    self.show_thumbnails()
+                else:
+                    self.thumbnail_display_manager.refresh_items(self.image_tag_map, changes.keys())
+                    self._update_facet_counts()
+                    self._update_timeline_jump()
             else:
                 messagebox.showinfo(messagebox.INFO, "更新はキャンセルされました")
                 return
@@ -293,6 +791,34 @@ class ThumbnailApp(tk.Tk):
             self.tag_menu = None
 
 
+    def show_similar(self, file):
+        """
+        ファイルに見た目が似ているファイルを、類似度の高い順に表示
+        （タグ・日付・ファイル名の絞り込み条件は引き続き適用）
+        """
+        if not visual_index.has_descriptor(self.image_tag_map[file]):
+            messagebox.showinfo(messagebox.INFO, "このファイルには類似検索用の特徴量がありません。\nフォルダを開き直すとスキャン時に計算されます。")
+            return
+        self.thumbnail_display_manager.set_timeline(None)
+        self.timeline_var.set(next(iter(TIMELINE_MODES)))
+        self._set_similar_file(file)
+        self.canvas_thumb.yview_moveto(0)
+        self.show_thumbnails()
+
+    def clear_similar(self):
+        """類似検索を解除して通常の表示に戻す"""
+        self._set_similar_file(None)
+        self.show_thumbnails()
+
+    def _set_similar_file(self, file):
+        """類似検索の基準のファイルを設定し、類似検索中の表示を切り替え"""
+        self._similar_file = file
+        if file is None:
+            self.similar_frame.pack_forget()
+        else:
+            self.similar_var.set(f"「{os.path.basename(file)}」に似た画像")
+            self.similar_frame.pack(side="right", padx=10)
+
     def show_select_folder(self):
         """
         フォルダ選択ダイアログを表示し、選択されたフォルダのパスを更新
@@ -302,14 +828,136 @@ class ThumbnailApp(tk.Tk):
         )
 
         if select_folder:
-            self.select_folder = select_folder
-            self._clear_ui()  # 既存のUIをクリア
-            self._setup_ui()
-            self._initialize_data()
-            self.show_thumbnails()
+            self._open_folder(select_folder)
         else:
             pass  # フォルダが選択されなかった場合は何もしない
 
+    def show_select_archive(self):
+        """
+        ZIPアーカイブ選択ダイアログを表示し、アーカイブを仮想フォルダとして開く（展開はしない）
+        """
+        select_archive = filedialog.askopenfilename(
+            title="画像が含まれているZIPアーカイブを選択",
+            filetypes=[("ZIPアーカイブ", " ".join(f"*{ext}" for ext in constants.ARCHIVE_EXTS))],
+        )
+
+        if select_archive:
+            self._open_folder(select_archive)
+
+    def _open_folder(self, folder_path):
+        """フォルダ（またはZIPアーカイブ）を開いてサムネイルを表示"""
+        self._save_session()  # 表示中のフォルダの状態を保存
+        self.select_folder = folder_path
+        self.library_mode = False
+        self.title("画像・動画サムネイルビューア")
+        self._clear_ui()  # 既存のUIをクリア
+        self._setup_ui()
+        self._initialize_data()
+        self.show_thumbnails()
+
+    def add_folder_to_library(self):
+        """
+        表示中のフォルダをライブラリに登録し、バックグラウンドで読み込む
+        """
+        if self.library_mode or not self.select_folder:
+            return
+        if self.library.add_root(self.select_folder):
+            self.library.start_background_load(self._library_events.put)
+            messagebox.showinfo(messagebox.INFO, f"{self.select_folder}\nをライブラリに追加しました")
+        else:
+            messagebox.showinfo(messagebox.INFO, "既にライブラリに登録されているフォルダです")
+
+    def show_library(self):
+        """
+        ライブラリに登録された全フォルダを横断して表示
+        - 読み込み済みのフォルダはカタログから即座に表示
+        - 未読み込み・変更のあるフォルダはバックグラウンドで読み込み、完了次第反映
+        """
+        if not self.library.roots:
+            messagebox.showinfo(messagebox.INFO, "ライブラリに登録されたフォルダがありません")
+            return
+        self._save_session()
+        self.library_mode = True
+        self.title("画像・動画サムネイルビューア - ライブラリ")
+        self._clear_ui()
+        self._setup_ui()
+        self._initialize_data()
+        self.show_thumbnails()
+        self.library.start_background_load(self._library_events.put)
+
+    def run_cache_maintenance(self):
+        """
+        サムネイルキャッシュの整理をバックグラウンドで実行し、完了したら解放した容量を表示
+        （表示中のフォルダとライブラリのフォルダから参照されないサムネイルを削除）
+        """
+        if self._maintenance_thread is not None and self._maintenance_thread.is_alive():
+            messagebox.showinfo(messagebox.INFO, "キャッシュを整理中です")
+            return
+        folders = [] if self.library_mode or not self.select_folder else [self.select_folder]
+        results = queue.Queue()
+
+        def run():
+            try:
+                results.put(cache_maintenance.run_maintenance(folders))
+            except Exception as e:
+                results.put(e)
+
+        self._maintenance_thread = threading.Thread(target=run, name="cache-maintenance", daemon=True)
+        self._maintenance_thread.start()
+        self.after(500, self._poll_cache_maintenance, results)
+
+    def _poll_cache_maintenance(self, results):
+        """キャッシュ整理の完了を待って結果を表示"""
+        try:
+            report = results.get_nowait()
+        except queue.Empty:
+            self.after(500, self._poll_cache_maintenance, results)
+            return
+        if isinstance(report, Exception):
+            messagebox.showwarning(messagebox.WARNING, f"キャッシュの整理に失敗しました: {report}")
+        else:
+            messagebox.showinfo(messagebox.INFO, report.format())
+
+    def _poll_library_events(self):
+        """
+        バックグラウンド読み込みの完了通知をメインスレッドで処理
+        - ライブラリ表示中であれば、読み込まれたフォルダを表示に反映
+        - 日付で絞り込んでいる場合は範囲を保つ（全期間を表示中の場合だけ読み込まれた分まで広げる）
+        """
+        loaded = False
+        try:
+            while True:
+                self._library_events.get_nowait()
+                loaded = True
+        except queue.Empty:
+            pass
+
+        if loaded and self.library_mode:
+            bounds = self.image_tag_map.date_bounds()
+            full_range = bounds is None or \
+                self.date_range_manager.get_date_range() == (bounds[0].date(), bounds[1].date())
+            selected_tags = self.tag_button_manager.get_selected_tags()
+            self.image_tag_map, self.all_tags = self.library.merged_map()
+            self.tag_index = None
+            self.tag_button_manager.update_tag_counts(self.all_tags)
+            for tag in selected_tags:
+                self.tag_button_manager.set_tag_selection(tag, True)
+            self.date_range_manager.image_tag_map = self.image_tag_map
+            if full_range:
+                self.date_range_manager.set_date_range_from_image_data(self.image_tag_map)
+            self.show_thumbnails()
+
+        self.after(200, self._poll_library_events)
+
+    def _on_close(self):
+        """ウィンドウを閉じる時の処理（セッションを保存し、バックグラウンド処理を停止）"""
+        self._save_session()
+        self._cancel_background_scan()
+        self.library.shutdown()
+        if self.thumbnail_display_manager is not None:
+            self.thumbnail_display_manager.shutdown()
+        self.destroy()
+
 
 def main():
     """
@@ -0,0 +1,383 @@
+# --- メディアファイルへのアクセス（フォルダ・ZIPアーカイブ共通） ---
+# ZIPアーカイブを仮想フォルダとして扱い、展開せずにメンバーを直接読み込む
+# - アーカイブ内のファイルのパスは「アーカイブのパス/メンバー名」で表す
+# - メンバーの読み込みは zipfile によるストリーミング（一時ファイルは作らない）
+# - 変更検知にはメンバーのCRCとサイズを使う（中身を読まない）
+# - タグJSON・ジャーナルはアーカイブの隣にサイドカーファイルとして保存する
+# ネットワークドライブなど待ち時間の長いファイルシステム（高遅延モード）では
+# - フォルダの一覧をTTL付きでキャッシュする
+# - inject_latency で1回のI/Oごとに待ち時間を入れ、ローカルで高遅延環境を再現できる
+
+import os
+import stat
+import time
+import threading
+import zipfile
+import datetime
+import contextlib
+import constants
+
+# スレッドごとに開いたアーカイブ（ZipFileは1つのファイルハンドルを共有するため、スレッド間で共有しない）
+_local = threading.local()
+
+# 高遅延モードの判定結果（フォルダ: bool）とフォルダ一覧のキャッシュ（フォルダ: (有効期限, 一覧)）
+_high_latency = {}
+_listing_cache = {}
+_cache_lock = threading.Lock()
+
+# テスト用に1回のI/Oごとに入れる待ち時間（秒）
+_injected_latency = 0.0
+
+# デコーダープラグイン（preview_decoders）で追加された画像の拡張子
+_registered_image_exts = ()
+
+
+def is_archive(path):
+    """ZIPアーカイブ（仮想フォルダ）かどうか"""
+    return path.lower().endswith(constants.ARCHIVE_EXTS) and _isfile(path)
+
+
+def split_archive_path(path):
+    """
+    アーカイブ内のファイルのパスをアーカイブのパスとメンバー名に分割
+
+    Returns:
+        tuple: (アーカイブのパス, メンバー名)。アーカイブ内のパスでない場合 (None, None)
+    """
+    lower = path.lower()
+    for ext in constants.ARCHIVE_EXTS:
+        start = 0
+        while True:
+            idx = lower.find(ext, start)
+            if idx < 0:
+                break
+            end = idx + len(ext)
+            if end < len(path) and path[end] in (os.sep, "/") and _isfile(path[:end]):
+                return path[:end], path[end + 1:].replace(os.sep, "/")
+            start = end
+    return None, None
+
+
+def register_image_exts(exts):
+    """一覧表示の対象とする画像の拡張子を追加（preview_decoders.register から呼ばれる）"""
+    global _registered_image_exts
+    added = tuple(ext.lower() for ext in exts if ext.lower() not in constants.IMAGE_EXTS + _registered_image_exts)
+    _registered_image_exts += added
+
+
+def list_media(folder_path):
+    """
+    フォルダ・アーカイブ内のメディアファイル名の一覧を取得
+    - アーカイブの場合はメンバー名（サブフォルダを含むパス）。動画は展開しないと再生できないため画像のみ
+    - 高遅延モードのフォルダは NETWORK_LISTING_TTL_SEC の間、前回の一覧を返す
+
+    Returns:
+        list: ファイル名のリスト
+    """
+    if is_archive(folder_path):
+        return [
+            info.filename for info in _open_archive(folder_path).infolist()
+            if not info.is_dir() and os.path.splitext(info.filename)[1].lower() in constants.IMAGE_EXTS + _registered_image_exts
+        ]
+
+    use_cache = is_high_latency(folder_path)
+    if use_cache:
+        with _cache_lock:
+            cached = _listing_cache.get(folder_path)
+        if cached is not None and cached[0] > time.monotonic():
+            return list(cached[1])
+
+    _delay()
+    files = [f for f in os.listdir(folder_path)
+             if os.path.splitext(f)[1].lower() in constants.VIDEO_AND_IMAGE_EXTS + _registered_image_exts]
+    if use_cache:
+        with _cache_lock:
+            _listing_cache[folder_path] = (time.monotonic() + constants.NETWORK_LISTING_TTL_SEC, files)
+    return list(files)
+
+
+def invalidate_listing(folder_path=None):
+    """フォルダ一覧のキャッシュを破棄（省略時はすべて）"""
+    with _cache_lock:
+        if folder_path is None:
+            _listing_cache.clear()
+        else:
+            _listing_cache.pop(folder_path, None)
+
+
+def is_high_latency(folder_path):
+    """
+    フォルダが高遅延なファイルシステム上にあるか
+    - constants.HIGH_LATENCY_FS_MODE が True / False ならその値
+    - "auto" の場合はフォルダへのstatの待ち時間を測って判定（結果はフォルダごとに保持）
+    """
+    mode = constants.HIGH_LATENCY_FS_MODE
+    if mode != "auto":
+        return bool(mode)
+    with _cache_lock:
+        cached = _high_latency.get(folder_path)
+    if cached is not None:
+        return cached
+
+    # 存在しないファイルへの問い合わせはクライアント側でキャッシュされにくく、往復時間を反映しやすい
+    probe = os.path.join(folder_path, ".latency_probe")
+    samples = []
+    for _ in range(3):
+        start = time.perf_counter()
+        _exists(probe)
+        samples.append(time.perf_counter() - start)
+    result = sorted(samples)[1] * 1000 >= constants.NETWORK_LATENCY_THRESHOLD_MS
+    with _cache_lock:
+        _high_latency[folder_path] = result
+    if result:
+        print(f"高遅延モードで読み込みます: {folder_path}")
+    return result
+
+
+def open_media(path):
+    """
+    メディアファイルをバイナリモードで開く（アーカイブ内はメンバーをストリーミングで読む）
+
+    Returns:
+        file object: シーク可能なファイルオブジェクト（with文で閉じる）
+    """
+    archive, member = split_archive_path(path)
+    if archive is None:
+        _delay()
+        f = open(path, "rb")
+        return _LatencyFile(f) if _injected_latency else f
+    try:
+        return _open_archive(archive).open(member)
+    except KeyError:
+        raise FileNotFoundError(path)
+
+
+def read_head(path, size):
+    """ファイルの先頭 size バイトを読み込む（1回の読み込みで済ませる）"""
+    with open_media(path) as f:
+        return f.read(size)
+
+
+def stat_media(path):
+    """
+    メディアファイルのサイズと更新日時を取得
+
+    Returns:
+        tuple: (サイズ, 更新日時のUNIX時刻)
+
+    Raises:
+        OSError: ファイルが存在しない場合
+    """
+    archive, member = split_archive_path(path)
+    if archive is None:
+        st = _stat(path)
+        return st.st_size, st.st_mtime
+    info = _member_info(archive, member)
+    return info.file_size, datetime.datetime(*info.date_time).timestamp()
+
+
+def stat_signature(size, mtime):
+    """サイズと更新日時を1つの整数にまとめた変更検知用のシグネチャ（マイクロ秒単位）"""
+    return (size << 64) | (int(mtime * 1_000_000) & 0xFFFFFFFFFFFFFFFF)
+
+
+def signature_size(signature):
+    """stat_signature からファイルサイズを取り出す"""
+    return signature >> 64
+
+
+def signature_mtime(signature):
+    """stat_signature から更新日時（エポック秒）を取り出す"""
+    return (signature & 0xFFFFFFFFFFFFFFFF) / 1_000_000
+
+
+def media_exists(path):
+    """メディアファイルが存在するか"""
+    try:
+        stat_media(path)
+        return True
+    except OSError:
+        return False
+
+
+def archive_fingerprint(path):
+    """
+    アーカイブ内のファイルの変更検知用ハッシュ（CRC32 + サイズの16進文字列）
+
+    Returns:
+        str: アーカイブ内のファイルでない場合・存在しない場合None
+    """
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return None
+    try:
+        info = _member_info(archive, member)
+    except OSError:
+        return None
+    return f"{info.CRC:08x}{info.file_size:016x}"
+
+
+def tags_json_path(folder_path):
+    """タグJSONのパス（アーカイブの場合は隣のサイドカーファイル）"""
+    if is_archive(folder_path):
+        return folder_path + "." + constants.PICTURE_TAGS_JSON
+    return os.path.join(folder_path, constants.PICTURE_TAGS_JSON)
+
+
+def tag_journal_path(folder_path):
+    """タグ更新ジャーナルのパス（アーカイブの場合は隣のサイドカーファイル）"""
+    if is_archive(folder_path):
+        return folder_path + "." + constants.PICTURE_TAGS_JOURNAL
+    return os.path.join(folder_path, constants.PICTURE_TAGS_JOURNAL)
+
+
+@contextlib.contextmanager
+def inject_latency(seconds):
+    """
+    このモジュールを通るstat・一覧取得・オープン・読み込みの1回ごとに待ち時間を入れる（テスト用）
+    ネットワークドライブの往復時間をローカルのフォルダで再現する
+
+    使い方:
+        with media_fs.inject_latency(0.02):
+            logic.scan_tags(folder)
+    """
+    global _injected_latency
+    previous = _injected_latency
+    _injected_latency = seconds
+    # 高遅延モードの判定とフォルダ一覧は待ち時間の有無で変わるため破棄
+    with _cache_lock:
+        _high_latency.clear()
+        _listing_cache.clear()
+    try:
+        yield
+    finally:
+        _injected_latency = previous
+        with _cache_lock:
+            _high_latency.clear()
+            _listing_cache.clear()
+
+
+# ===============================
+# 内部関数（プライベート）
+# ===============================
+
+class _LatencyFile:
+    """読み込み・シークごとに待ち時間を入れるファイルラッパー（inject_latency 用）"""
+
+    def __init__(self, f):
+        self._f = f
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+        return False
+
+    def read(self, *args):
+        _delay()
+        return self._f.read(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+def _delay():
+    """注入された待ち時間だけ待つ"""
+    if _injected_latency:
+        time.sleep(_injected_latency)
+
+
+def _stat(path):
+    """os.stat（注入された待ち時間を含む）"""
+    _delay()
+    return os.stat(path)
+
+
+def _isfile(path):
+    """通常のファイルかどうか"""
+    try:
+        return stat.S_ISREG(_stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def _exists(path):
+    """ファイルが存在するか"""
+    try:
+        _stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _open_archive(archive_path):
+    """
+    このスレッド用に開いたアーカイブを取得（アーカイブが更新されていれば開き直す）
+    開くときは中央ディレクトリだけを読むので、巨大なアーカイブでもすぐに開ける
+    """
+    archives = getattr(_local, "archives", None)
+    if archives is None:
+        archives = _local.archives = {}
+    mtime = _stat(archive_path).st_mtime_ns
+    cached = archives.get(archive_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    try:
+        zf = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile as e:
+        raise OSError(f"ZIPアーカイブを開けません: {archive_path}: {e}")
+    archives[archive_path] = (mtime, zf)
+    return zf
+
+
+def _member_info(archive_path, member):
+    """メンバーのZipInfoを取得（存在しない場合 FileNotFoundError）"""
+    try:
+        return _open_archive(archive_path).getinfo(member)
+    except KeyError:
+        raise FileNotFoundError(f"{archive_path}/{member}")
+
+
+def _benchmark(count=200, latency=0.01):
+    """
+    待ち時間を注入したフォルダで、通常モードと高遅延モードのスキャン時間を比較する
+    初回スキャン（JSONなし）と再スキャン（変更なし）をそれぞれ測る
+    """
+    import shutil
+    import tempfile
+    from PIL import Image
+    import logic
+    import media_fs  # __main__ として実行した場合も logic と同じモジュールの待ち時間を設定する
+
+    constants.SHARED_THUMBNAIL_CACHE_ENABLED = False  # 共有キャッシュのヒットで結果が変わらないよう無効化
+    folder = tempfile.mkdtemp(prefix="media_fs_bench_")
+    try:
+        for i in range(count):
+            exif = Image.Exif()
+            exif.get_ifd(0x8769)[0x9003] = f"2020:01:01 00:{i // 60 % 60:02d}:{i % 60:02d}"
+            img = Image.new("RGB", (2000, 1500), (i % 256, 80, 160))
+            img.save(os.path.join(folder, f"IMG_{i:05d}.jpg"), "JPEG", exif=exif.tobytes())
+
+        for mode in (False, True):
+            constants.HIGH_LATENCY_FS_MODE = mode
+            json_path = media_fs.tags_json_path(folder)
+            if os.path.exists(json_path):
+                os.remove(json_path)
+            with media_fs.inject_latency(latency):
+                for label in ("初回", "再スキャン"):
+                    start = time.perf_counter()
+                    logic.scan_tags(folder)
+                    elapsed = time.perf_counter() - start
+                    print(f"{'高遅延' if mode else '通常'}モード {label}: {elapsed:6.2f} 秒 ({count} 件)")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # 使い方: python src/media_fs.py [件数] [待ち時間(秒)]
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+               float(sys.argv[2]) if len(sys.argv) > 2 else 0.01)
@@ -0,0 +1,409 @@
+# --- メディアメタデータ読み取り ---
+# 画素データをデコードせず、ファイルのヘッダ部分だけを読んで撮影日時を取得する
+# - JPEG: APP1（Exif）セグメント内のTIFF構造
+# - TIFF（TIFF構造のRAW: CR2/NEF/ARW/DNG を含む）: ファイル先頭からのIFD
+# - MP4/MOV: moov/mvhd アトムの作成日時
+# TIFF構造のファイルに埋め込まれたJPEGプレビューの位置の列挙も行う（取り出しは preview_decoders）
+# ファイル先頭の読み込み済みバイト列（head）を渡すと、収まっている範囲はファイルを読み直さずに解析する
+
+import io
+import os
+import struct
+import datetime
+import media_fs
+
+# Exif タグ
+_TAG_DATETIME = 0x0132  # IFD0: 更新日時
+_TAG_EXIF_IFD = 0x8769  # IFD0: Exif IFD へのポインタ
+_TAG_DATETIME_ORIGINAL = 0x9003  # Exif IFD: 撮影日時
+_TAG_DATETIME_DIGITIZED = 0x9004  # Exif IFD: デジタル化日時
+_TAG_THUMBNAIL_OFFSET = 0x0201  # IFD1: 埋め込みサムネイル（JPEG）の位置
+_TAG_THUMBNAIL_LENGTH = 0x0202  # IFD1: 埋め込みサムネイルのバイト数
+_TAG_COMPRESSION = 0x0103  # 圧縮方式
+_TAG_STRIP_OFFSETS = 0x0111  # 画像データ（ストリップ）の位置
+_TAG_ORIENTATION = 0x0112  # 画像の向き
+_TAG_STRIP_BYTE_COUNTS = 0x0117  # 画像データ（ストリップ）のバイト数
+_TAG_SUB_IFDS = 0x014A  # 子IFDへのポインタ（RAWのプレビュー・本体）
+_DATE_TAGS = (_TAG_DATETIME, _TAG_EXIF_IFD, _TAG_DATETIME_ORIGINAL, _TAG_DATETIME_DIGITIZED)
+_THUMBNAIL_TAGS = (_TAG_THUMBNAIL_OFFSET, _TAG_THUMBNAIL_LENGTH)
+_PREVIEW_TAGS = _THUMBNAIL_TAGS + (
+    _TAG_COMPRESSION, _TAG_STRIP_OFFSETS, _TAG_ORIENTATION, _TAG_STRIP_BYTE_COUNTS, _TAG_SUB_IFDS,
+)
+_JPEG_COMPRESSIONS = (6, 7)  # 旧JPEG・JPEG
+
+_TYPE_ASCII = 2
+_TYPE_SHORT = 3
+_TYPE_LONG = 4
+_TYPE_IFD = 13
+_MAX_IFD_ENTRIES = 1024  # 壊れたファイルで長時間ループしないための上限
+_MAX_IFDS = 64  # プレビューの探索で辿るIFD数の上限
+_MAX_JPEG_SEGMENTS = 64  # JPEGのサイズ取得で読み飛ばすセグメント数の上限
+# デコードできるJPEGのフレーム（ベースライン・拡張シーケンシャル・プログレッシブ）。ロスレス（RAW本体）は除く
+_JPEG_SOF_MARKERS = (0xC0, 0xC1, 0xC2)
+
+# MP4 の時刻基準（1904-01-01 UTC）からUNIX時刻への差
+_MP4_EPOCH_OFFSET = 2082844800
+
+_JPEG_EXTS = ('.jpg', '.jpeg')
+_TIFF_EXTS = ('.tif', '.tiff', '.cr2', '.nef', '.arw', '.dng')
+_MP4_EXTS = ('.mp4', '.mov', '.m4v', '.3gp')
+
+
+def read_capture_time(file_path, head=None):
+    """
+    ファイルのヘッダから撮影日時を取得
+
+    Args:
+        file_path: ファイルパス
+        head: 読み込み済みのファイル先頭のバイト列（省略可）
+
+    Returns:
+        float: 撮影日時（UNIX時刻）。取得できない場合None
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in _JPEG_EXTS + _TIFF_EXTS + _MP4_EXTS:
+        return None
+    if head is not None and ext not in _MP4_EXTS:
+        try:
+            return _read_exif_datetime(io.BytesIO(head), ext)
+        except (EOFError, ValueError, struct.error):
+            pass  # 先頭に収まっていない場合はファイルから読む
+    try:
+        with media_fs.open_media(file_path) as f:
+            if ext in _MP4_EXTS:
+                return _read_mp4(f)
+            return _read_exif_datetime(f, ext)
+    except (OSError, EOFError, ValueError, struct.error) as e:
+        print(f"撮影日時の読み取りに失敗: {file_path}: {e}")
+    return None
+
+
+def read_embedded_thumbnail(file_path, head=None):
+    """
+    JPEGのExifに埋め込まれたサムネイル（通常160x120程度のJPEG）を取得
+    画像本体を読まずに済むため、高遅延なファイルシステムでのサムネイル作成に使う
+
+    Args:
+        file_path: ファイルパス
+        head: 読み込み済みのファイル先頭のバイト列（省略可）
+
+    Returns:
+        bytes: 埋め込みサムネイルのJPEGデータ。ない場合None
+    """
+    if os.path.splitext(file_path)[1].lower() not in _JPEG_EXTS:
+        return None
+    if head is not None:
+        try:
+            return _read_jpeg_thumbnail(io.BytesIO(head))
+        except (EOFError, ValueError, struct.error):
+            pass
+    try:
+        with media_fs.open_media(file_path) as f:
+            return _read_jpeg_thumbnail(f)
+    except (OSError, EOFError, ValueError, struct.error) as e:
+        print(f"埋め込みサムネイルの読み取りに失敗: {file_path}: {e}")
+    return None
+
+
+def read_tiff_previews(f):
+    """
+    TIFF構造のファイルに埋め込まれたJPEGの位置を列挙（画素データは読まない）
+    IFD0から次のIFD（複数ページ）とSubIFDを辿り、JPEGInterchangeFormat と
+    JPEG圧縮の単一ストリップを候補にする（RAW本体のロスレスJPEGも含むため、read_jpeg_size で判定する）
+
+    Args:
+        f: シーク可能なファイルオブジェクト
+
+    Returns:
+        tuple: ([(オフセット, バイト数)], IFD0の向き（Exif Orientation、ない場合1）)
+    """
+    endian, offset = _read_tiff_header(f, 0)
+    if endian is None:
+        return [], 1
+
+    candidates = []
+    orientation = 1
+    pending = [offset]
+    visited = set()
+    while pending and len(visited) < _MAX_IFDS:
+        offset = pending.pop(0)
+        if not offset or offset in visited:
+            continue
+        visited.add(offset)
+        ifd, next_offset = _read_ifd(f, 0, offset, endian, _PREVIEW_TAGS)
+        if len(visited) == 1 and _TAG_ORIENTATION in ifd:
+            orientation = ifd[_TAG_ORIENTATION][1] or 1
+
+        if _TAG_THUMBNAIL_OFFSET in ifd and _TAG_THUMBNAIL_LENGTH in ifd:
+            candidates.append((ifd[_TAG_THUMBNAIL_OFFSET][1], ifd[_TAG_THUMBNAIL_LENGTH][1]))
+        strips, counts = ifd.get(_TAG_STRIP_OFFSETS), ifd.get(_TAG_STRIP_BYTE_COUNTS)
+        compression = ifd.get(_TAG_COMPRESSION)
+        if (strips and counts and strips[2] == 1 and counts[2] == 1
+                and compression and compression[1] in _JPEG_COMPRESSIONS):
+            candidates.append((strips[1], counts[1]))
+
+        if _TAG_SUB_IFDS in ifd:
+            pending.extend(_read_offsets(f, ifd[_TAG_SUB_IFDS], endian))
+        pending.append(next_offset)
+
+    # 同じデータを複数のIFDが指す場合がある
+    return [c for c in dict.fromkeys(candidates) if c[0] and c[1]], orientation
+
+
+def read_jpeg_size(f, offset):
+    """
+    offset から始まるJPEGのフレームヘッダ（SOF）を読み、画像サイズを取得
+
+    Returns:
+        tuple: (幅, 高さ)。JPEGでない・デコードできない形式（ロスレスなど）の場合None
+    """
+    f.seek(offset)
+    if f.read(2) != b"\xff\xd8":
+        return None
+    for _ in range(_MAX_JPEG_SEGMENTS):
+        header = _read_exact(f, 4)
+        if header[0] != 0xFF:
+            return None
+        marker = header[1]
+        length = struct.unpack(">H", header[2:])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", _read_exact(f, 5)[1:])
+            return width, height
+        if 0xC3 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            # 対応していないSOF（ロスレス・算術符号化）
+            return None
+        if marker in (0xDA, 0xD9):
+            return None
+        f.seek(length - 2, os.SEEK_CUR)
+    return None
+
+
+# ===============================
+# JPEG / TIFF
+# ===============================
+
+def _read_exact(f, size):
+    """size バイトを読み込む（足りない場合は EOFError。head の範囲外を読もうとした場合も同様）"""
+    data = f.read(size)
+    if len(data) < size:
+        raise EOFError("ファイルの終端に達しました")
+    return data
+
+
+def _read_exif_datetime(f, ext):
+    """JPEGまたはTIFFから撮影日時を取得"""
+    if ext in _TIFF_EXTS:
+        return _read_tiff(f, 0)
+    segment = _find_exif_segment(f)
+    return _read_tiff(io.BytesIO(segment), 6) if segment is not None else None
+
+
+def _read_jpeg_thumbnail(f):
+    """JPEGのExifのIFD1から埋め込みサムネイルを取り出す"""
+    segment = _find_exif_segment(f)
+    if segment is None:
+        return None
+    f = io.BytesIO(segment)
+    endian, ifd0_offset = _read_tiff_header(f, 6)
+    if endian is None:
+        return None
+    _, ifd1_offset = _read_ifd(f, 6, ifd0_offset, endian, ())
+    if not ifd1_offset:
+        return None
+    ifd1, _ = _read_ifd(f, 6, ifd1_offset, endian, _THUMBNAIL_TAGS)
+    if _TAG_THUMBNAIL_OFFSET not in ifd1 or _TAG_THUMBNAIL_LENGTH not in ifd1:
+        return None
+    f.seek(6 + ifd1[_TAG_THUMBNAIL_OFFSET][1])
+    data = _read_exact(f, ifd1[_TAG_THUMBNAIL_LENGTH][1])
+    return data if data[:2] == b"\xff\xd8" else None
+
+
+def _find_exif_segment(f):
+    """
+    JPEGのマーカーを順に読み、APP1（Exif）セグメントを取得（他のセグメントは読み飛ばす）
+
+    Returns:
+        bytes: Exif識別子から始まるセグメントの内容。ない場合None
+    """
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        header = _read_exact(f, 4)
+        if header[0] != 0xFF:
+            return None
+        marker = header[1]
+        length = struct.unpack(">H", header[2:])[0]
+        if marker in (0xDA, 0xD9):
+            # 画像データ（SOS）以降にメタデータはない
+            return None
+        if marker == 0xE1:
+            segment = _read_exact(f, length - 2)
+            if segment[:6] == b"Exif\x00\x00":
+                return segment
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _read_tiff_header(f, base):
+    """
+    TIFFヘッダを読み込む
+
+    Returns:
+        tuple: (エンディアン（"<" or ">"）, IFD0のオフセット)。TIFFでない場合 (None, None)
+    """
+    f.seek(base)
+    header = _read_exact(f, 8)
+    if header[:2] == b"II":
+        endian = "<"
+    elif header[:2] == b"MM":
+        endian = ">"
+    else:
+        return None, None
+    if struct.unpack(endian + "H", header[2:4])[0] != 42:
+        return None, None
+    return endian, struct.unpack(endian + "I", header[4:8])[0]
+
+
+def _read_tiff(f, base):
+    """
+    TIFF構造から撮影日時を取得
+
+    Args:
+        f: シーク可能なファイルオブジェクト
+        base: TIFFヘッダの開始位置（IFDのオフセットの基準）
+    """
+    endian, ifd0_offset = _read_tiff_header(f, base)
+    if endian is None:
+        return None
+
+    ifd0, _ = _read_ifd(f, base, ifd0_offset, endian, _DATE_TAGS)
+    exif_offset = ifd0.get(_TAG_EXIF_IFD)
+    exif = _read_ifd(f, base, exif_offset[1], endian, _DATE_TAGS)[0] if exif_offset else {}
+
+    for ifd, tag in ((exif, _TAG_DATETIME_ORIGINAL), (exif, _TAG_DATETIME_DIGITIZED), (ifd0, _TAG_DATETIME)):
+        entry = ifd.get(tag)
+        if entry is None:
+            continue
+        value = _parse_exif_datetime(_read_ascii(f, base, entry, endian))
+        if value is not None:
+            return value
+    return None
+
+
+def _read_ifd(f, base, offset, endian, wanted):
+    """
+    IFDを読み込み、必要なタグのエントリだけを返す
+
+    Args:
+        wanted: 取得するタグのタプル
+
+    Returns:
+        tuple: ({タグ: (型, 値またはオフセット, 個数, 値フィールドの生バイト)}, 次のIFDのオフセット)
+    """
+    f.seek(base + offset)
+    count = min(struct.unpack(endian + "H", _read_exact(f, 2))[0], _MAX_IFD_ENTRIES)
+    data = _read_exact(f, count * 12 + 4)
+    next_offset = struct.unpack(endian + "I", data[-4:])[0]
+
+    entries = {}
+    for i in range(count):
+        tag, typ, num = struct.unpack(endian + "HHI", data[i * 12:i * 12 + 8])
+        if tag not in wanted:
+            continue
+        raw = data[i * 12 + 8:i * 12 + 12]
+        if typ == _TYPE_LONG:
+            value = struct.unpack(endian + "I", raw)[0]
+        elif typ == _TYPE_SHORT:
+            value = struct.unpack(endian + "H", raw[:2])[0]
+        else:
+            value = None
+        entries[tag] = (typ, value, num, raw)
+    return entries, next_offset
+
+
+def _read_offsets(f, entry, endian):
+    """LONG型（またはIFD型）の配列のエントリからオフセットの一覧を取得（4バイト超は別位置から読む）"""
+    typ, _, num, raw = entry
+    if typ not in (_TYPE_LONG, _TYPE_IFD) or not num:
+        return []
+    num = min(num, _MAX_IFDS)
+    if num == 1:
+        return [struct.unpack(endian + "I", raw)[0]]
+    f.seek(struct.unpack(endian + "I", raw)[0])
+    return list(struct.unpack(endian + "%dI" % num, _read_exact(f, num * 4)))
+
+
+def _read_ascii(f, base, entry, endian):
+    """ASCII型のエントリの文字列を取得（4バイト超は別位置から読む）"""
+    typ, _, num, raw = entry
+    if typ != _TYPE_ASCII:
+        return ""
+    if num <= 4:
+        data = raw[:num]
+    else:
+        f.seek(base + struct.unpack(endian + "I", raw)[0])
+        data = _read_exact(f, num)
+    return data.split(b"\x00", 1)[0].decode("ascii", errors="ignore")
+
+
+def _parse_exif_datetime(text):
+    """Exifの日時文字列（YYYY:MM:DD HH:MM:SS、ローカル時刻）をUNIX時刻に変換"""
+    try:
+        return datetime.datetime.strptime(text.strip()[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+    except ValueError:
+        # 未設定の場合は "0000:00:00 00:00:00" や空白で埋められている
+        return None
+
+
+# ===============================
+# MP4 / MOV
+# ===============================
+
+def _read_mp4(f):
+    """トップレベルのアトムを辿り、moov/mvhd の作成日時を取得（mdatは読み飛ばす）"""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    moov = _find_atom(f, 0, file_size, b"moov")
+    if moov is None:
+        return None
+    mvhd = _find_atom(f, moov[0], moov[1], b"mvhd")
+    if mvhd is None:
+        return None
+
+    f.seek(mvhd[0])
+    version = f.read(4)[0]
+    if version == 1:
+        created = struct.unpack(">Q", f.read(8))[0]
+    else:
+        created = struct.unpack(">I", f.read(4))[0]
+    if created <= _MP4_EPOCH_OFFSET:
+        return None  # 未設定（0）またはUNIX時刻より前
+    return float(created - _MP4_EPOCH_OFFSET)
+
+
+def _find_atom(f, start, end, name):
+    """
+    [start, end) の範囲から指定名のアトムを探す
+
+    Returns:
+        tuple: (内容の開始位置, 内容の終了位置)。見つからない場合None
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos  # ファイル末尾まで
+        if size < header_size:
+            return None
+        if kind == name:
+            return pos + header_size, min(pos + size, end)
+        pos += size
+    return None
@@ -0,0 +1,389 @@
+# --- メディア情報ストア ---
+# ファイルごとのメタデータ（作成日・タグ・ハッシュ・サムネイル）を省メモリな形式で保持する
+# - 1ファイル1レコード（__slots__）で辞書のオーバーヘッドをなくす
+# - 作成日は整数のUNIX時刻、ハッシュ・サムネイルはbase64ではなく生のバイト列
+# - タグは文字列・タグの組み合わせ（タプル）ともにインターンして共有する
+
+import os
+import sys
+import json
+import base64
+import datetime
+import collections
+import constants
+from tag_query import TagQueryIndex
+from name_index import FilenameIndex
+from visual_index import VisualIndex
+
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class MediaRecord:
+    """
+    1ファイル分のメタデータ
+    """
+
+    __slots__ = ("name", "ordinal", "created", "tags", "file_hash", "thumbnail", "date_source",
+                 "stat_signature", "descriptor")
+
+    def __init__(self, name, ordinal, created, tags, file_hash, thumbnail, date_source="",
+                 stat_signature=0, descriptor=b""):
+        """
+        初期化
+
+        Args:
+            name: ファイル名（ストア内のキー）
+            ordinal: ストア内の通し番号（インデックスのビット位置に使用）
+            created: 作成日時（UNIX時刻の整数）
+            tags: インターン済みのタグのタプル
+            file_hash: ファイルハッシュ（生のバイト列）
+            thumbnail: エンコード済みサムネイル画像（生のバイト列）
+            date_source: 作成日時の取得元（constants.DATE_SOURCE_*、未解析は空文字）
+            stat_signature: 前回スキャン時のサイズと更新日時（media_fs.stat_signature、未取得は0）
+            descriptor: 類似検索用の特徴量（visual_index.compute_descriptor、未計算は空のバイト列）
+        """
+        self.name = name
+        self.ordinal = ordinal
+        self.created = created
+        self.tags = tags
+        self.file_hash = file_hash
+        self.thumbnail = thumbnail
+        self.date_source = date_source
+        self.stat_signature = stat_signature
+        self.descriptor = descriptor
+
+    def fields(self):
+        """MediaStore.add に渡せる値の組（別スレッドへ送る時点の値を写す）"""
+        return (self.name, self.created, self.tags, self.file_hash, self.thumbnail, self.date_source,
+                self.stat_signature, self.descriptor)
+
+    @property
+    def created_datetime(self):
+        """作成日時（datetime）"""
+        return datetime.datetime.fromtimestamp(self.created)
+
+    @property
+    def createday(self):
+        """作成日時（JSON保存形式の文字列）"""
+        return self.created_datetime.strftime(DATE_FORMAT)
+
+    @property
+    def file_hash_hex(self):
+        """ファイルハッシュ（16進文字列）"""
+        return self.file_hash.hex()
+
+    def to_json_entry(self):
+        """JSON保存用の辞書に変換（image_tag_map.json の形式）"""
+        entry = {
+            "createday": self.createday,
+            "tags": list(self.tags),
+            "thumbnail": {},
+            "file_hash": self.file_hash_hex,
+        }
+        if self.date_source:
+            entry["date_source"] = self.date_source
+        if self.stat_signature:
+            entry["stat"] = self.stat_signature
+        if self.descriptor:
+            entry["descriptor"] = base64.b64encode(self.descriptor).decode("ascii")
+        if self.thumbnail:
+            entry["thumbnail"] = {
+                "data": base64.b64encode(self.thumbnail).decode("utf-8"),
+                "size": constants.THUMBNAIL_SIZE,
+                "format": constants.THUMBNAIL_FORMAT,
+            }
+        return entry
+
+
+class MediaStore:
+    """
+    ファイル名をキーにMediaRecordを保持するストア
+    - 読み出しは辞書と同様（store[name], name in store, items() など）
+    - タグの変更は set_tags を通して行う（インターンと件数集計を維持するため）
+    """
+
+    def __init__(self):
+        self._records = {}  # ファイル名: MediaRecord
+        self._by_ordinal = []  # 通し番号: MediaRecord（削除済みはNone）
+        self._tag_names = {}  # タグ文字列のインターン表
+        self._tag_tuples = {}  # タグの組み合わせのインターン表
+        self._query_index = None  # タグ検索用のビットセットインデックス（遅延構築）
+        self._name_index = None  # ファイル名検索用の3-gramインデックス（構築後は差分更新）
+        self._visual_index = None  # 類似検索用の特徴量の行列（遅延構築）
+
+    # ===============================
+    # 辞書互換の読み出し
+    # ===============================
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __contains__(self, name):
+        return name in self._records
+
+    def __getitem__(self, name):
+        return self._records[name]
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def get(self, name, default=None):
+        return self._records.get(name, default)
+
+    def keys(self):
+        return self._records.keys()
+
+    def values(self):
+        return self._records.values()
+
+    def items(self):
+        return self._records.items()
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def add(self, name, created, tags=(), file_hash=b"", thumbnail=b"", date_source="",
+            stat_signature=0, descriptor=b""):
+        """
+        レコードを追加（同名のレコードがあれば置き換え）
+
+        Args:
+            name: ファイル名
+            created: 作成日時（UNIX時刻）
+            tags: タグのリスト
+            file_hash: ファイルハッシュ（バイト列）
+            thumbnail: サムネイル画像（バイト列）
+            date_source: 作成日時の取得元（constants.DATE_SOURCE_*）
+            stat_signature: サイズと更新日時のシグネチャ
+            descriptor: 類似検索用の特徴量（バイト列）
+
+        Returns:
+            MediaRecord: 追加したレコード
+        """
+        self._query_index = None
+        self._visual_index = None
+        record = self._records.get(name)
+        if record is not None:
+            record.created = int(created)
+            record.tags = self.intern_tags(tags)
+            record.file_hash = file_hash
+            record.thumbnail = thumbnail
+            record.date_source = date_source
+            record.stat_signature = stat_signature
+            record.descriptor = descriptor
+            return record
+
+        record = MediaRecord(
+            sys.intern(name), len(self._by_ordinal), int(created),
+            self.intern_tags(tags), file_hash, thumbnail, date_source, stat_signature, descriptor,
+        )
+        self._records[record.name] = record
+        self._by_ordinal.append(record)
+        if self._name_index is not None:
+            self._name_index.add(record.ordinal, record.name)
+        return record
+
+    def add_json_entry(self, name, entry):
+        """image_tag_map.json 形式の辞書からレコードを追加"""
+        created = datetime.datetime.strptime(entry["createday"], DATE_FORMAT).timestamp()
+        thumbnail = entry.get("thumbnail") or {}
+        return self.add(
+            name,
+            created,
+            entry.get("tags", []),
+            bytes.fromhex(entry.get("file_hash", "")),
+            base64.b64decode(thumbnail["data"]) if "data" in thumbnail else b"",
+            entry.get("date_source", ""),
+            entry.get("stat", 0),
+            base64.b64decode(entry["descriptor"]) if "descriptor" in entry else b"",
+        )
+
+    def merge_json_entries(self, removed, entries):
+        """
+        レコードの削除・追加をまとめて反映（構築済みの検索インデックスは作り直さず差分反映）
+
+        Args:
+            removed: 削除するファイル名のリスト
+            entries: 追加する (ファイル名, image_tag_map.json 形式の辞書) のリスト。
+                     既存のファイル名は削除してから追加する（新しい通し番号になる）
+
+        Returns:
+            bool: 変更があったかどうか
+        """
+        query_index = self._query_index
+        removed_records = [self.remove(name) for name in removed]
+        removed_records += [self.remove(name) for name, _ in entries if name in self._records]
+        added_records = [self.add_json_entry(name, entry) for name, entry in entries]
+        removed_records = [r for r in removed_records if r is not None]
+        self._query_index = query_index
+        if query_index is not None:
+            query_index.remove_records(removed_records)
+            query_index.add_records(added_records)
+        return bool(removed_records or added_records)
+
+    def set_created(self, name, created, date_source):
+        """レコードの作成日時を変更（日付インデックスは次回の検索で再構築）"""
+        record = self._records[name]
+        record.created = int(created)
+        record.date_source = date_source
+        self._query_index = None
+
+    def set_descriptor(self, name, descriptor):
+        """レコードの特徴量を変更（類似検索の行列は次回の検索で再構築）"""
+        self._records[name].descriptor = descriptor
+        self._visual_index = None
+
+    def remove(self, name):
+        """レコードを削除（通し番号は再利用しない）"""
+        record = self._records.pop(name, None)
+        if record is not None:
+            self._by_ordinal[record.ordinal] = None
+            self._query_index = None
+            self._visual_index = None
+            if self._name_index is not None:
+                self._name_index.remove(record.ordinal)
+        return record
+
+    def set_tags(self, name, tags):
+        """レコードのタグを変更（検索インデックスにも反映）"""
+        record = self._records[name]
+        old_tags = record.tags
+        record.tags = self.intern_tags(tags)
+        if self._query_index is not None:
+            self._query_index.mark_tags_changed(record.ordinal, old_tags, record.tags)
+
+    def query_index(self):
+        """タグ検索用のビットセットインデックスを取得（初回呼び出し時に構築）"""
+        if self._query_index is None:
+            self._query_index = TagQueryIndex(self)
+        return self._query_index
+
+    def name_index(self):
+        """ファイル名検索用の3-gramインデックスを取得（初回呼び出し時に構築）"""
+        if self._name_index is None:
+            self._name_index = FilenameIndex(self)
+        return self._name_index
+
+    def visual_index(self):
+        """類似検索用の特徴量の行列を取得（初回呼び出し時に構築）"""
+        if self._visual_index is None:
+            self._visual_index = VisualIndex(self)
+        return self._visual_index
+
+    def intern_tags(self, tags):
+        """タグのリストを共有のタプルに変換（同じ組み合わせは同一オブジェクト）"""
+        key = tuple(self._tag_names.setdefault(t, sys.intern(t)) for t in tags)
+        return self._tag_tuples.setdefault(key, key)
+
+    def record_at(self, ordinal):
+        """通し番号からレコードを取得（削除済みはNone）"""
+        return self._by_ordinal[ordinal]
+
+    @property
+    def ordinal_count(self):
+        """通し番号の上限（削除済みを含む）"""
+        return len(self._by_ordinal)
+
+    def tag_counts(self):
+        """タグごとの件数を集計"""
+        counter = collections.Counter()
+        for record in self._records.values():
+            counter.update(record.tags)
+        return counter
+
+    def date_bounds(self):
+        """
+        作成日時の最小・最大を取得
+
+        Returns:
+            tuple: (最小datetime, 最大datetime)（レコードがない場合None）
+        """
+        if not self._records:
+            return None
+        created = [r.created for r in self._records.values()]
+        return (datetime.datetime.fromtimestamp(min(created)),
+                datetime.datetime.fromtimestamp(max(created)))
+
+    def write_json(self, path):
+        """
+        image_tag_map.json 形式で保存
+        全体の辞書を作らず1件ずつ書き出すため、保存時もメモリを消費しない
+        一時ファイルに書き終えてから置き換えるため、途中で終了しても既存のファイルは壊れない
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("{\n")
+            first = True
+            for name, record in self._records.items():
+                if not first:
+                    f.write(",\n")
+                first = False
+                f.write(f"    {json.dumps(name, ensure_ascii=False)}: ")
+                f.write(json.dumps(record.to_json_entry(), ensure_ascii=False))
+            f.write("\n}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def _benchmark(count=200_000, thumbnail_bytes=64):
+    """
+    tracemalloc で辞書形式と MediaStore のメモリ使用量を比較する
+    サムネイルは小さなダミーにして、レコード自体のオーバーヘッドを比較する
+    """
+    import random
+    import tracemalloc
+
+    tag_pool = [f"tag{i}" for i in range(50)]
+    rng = random.Random(0)
+    source = []
+    for i in range(count):
+        tags = rng.sample(tag_pool, rng.randint(0, 3))
+        created = 1_600_000_000 + i * 60
+        file_hash = os.urandom(16)
+        thumbnail = os.urandom(thumbnail_bytes)
+        source.append((f"IMG_{i:07d}.jpg", created, tags, file_hash, thumbnail, json.dumps(tags)))
+
+    def build_dicts():
+        image_tag_map = {}
+        for name, created, _, file_hash, thumbnail, tags_json in source:
+            image_tag_map[name] = {
+                "createday": datetime.datetime.fromtimestamp(created).strftime(DATE_FORMAT),
+                # JSON読み込み時と同様に、レコードごとに別々の文字列オブジェクトになるようデコードする
+                "tags": json.loads(tags_json),
+                "thumbnail": {
+                    "data": base64.b64encode(thumbnail).decode("utf-8"),
+                    "size": list(constants.THUMBNAIL_SIZE),
+                    "format": constants.THUMBNAIL_FORMAT,
+                },
+                "file_hash": file_hash.hex(),
+            }
+        return image_tag_map
+
+    def build_store():
+        store = MediaStore()
+        for name, created, tags, file_hash, thumbnail, _ in source:
+            store.add(name, created, tags, file_hash, thumbnail)
+        return store
+
+    results = {}
+    for label, builder in (("dict", build_dicts), ("MediaStore", build_store)):
+        tracemalloc.start()
+        data = builder()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[label] = current
+        print(f"{label:>10}: {current / 1024 / 1024:8.1f} MB ({len(data)} 件)")
+        del data
+
+    print(f"削減率: {1 - results['MediaStore'] / results['dict']:.1%}")
+
+
+if __name__ == "__main__":
+    # 使い方: python src/media_store.py [件数]
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
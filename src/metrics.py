@@ -0,0 +1,198 @@
+# --- パフォーマンス計測値のレジストリ ---
+# 各モジュールが計測値を書き込み、パフォーマンスHUD（components/perf_hud.py）と不具合報告用のファイル書き出しが読み出す
+# - カウンター: 累計値（例: メモリキャッシュのヒット・ミス）
+# - ゲージ: 最新の値（例: 読み込み待ちの件数）。値の代わりに関数を登録すると、読み出す時に呼んで求める
+#   （HUDを表示していない間は計算しない）
+# - タイマー: 処理時間（直近・平均・最大・回数）
+# - スキャン・サムネイル読み込みのワーカースレッドからも書き込めるよう、ロックで保護する
+
+import os
+import sys
+import json
+import time
+import datetime
+import platform
+import threading
+import contextlib
+
+_lock = threading.Lock()
+_counters = {}  # 名前: 累計値
+_gauges = {}  # 名前: 値または値を返す関数
+_timers = {}  # 名前: [回数, 合計秒, 直近の秒, 最大秒]
+_start = time.monotonic()
+
+
+def increment(name, amount=1):
+    """カウンターを増やす"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    """
+    ゲージの値を設定
+
+    Args:
+        name: ゲージ名
+        value: 値、または引数なしで値を返す関数（読み出す時に呼ぶ）
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def remove_gauge(name):
+    """ゲージを削除（関数を登録したオブジェクトが破棄される時に呼ぶ）"""
+    with _lock:
+        _gauges.pop(name, None)
+
+
+def record_time(name, seconds):
+    """処理時間を記録"""
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            _timers[name] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = seconds
+            stats[3] = max(stats[3], seconds)
+
+
+@contextlib.contextmanager
+def timer(name):
+    """with ブロックの処理時間を記録"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+
+def reset():
+    """カウンターとタイマーを初期化（ゲージは現在の値のまま）"""
+    global _start
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+        _start = time.monotonic()
+
+
+def snapshot():
+    """
+    現在の計測値を取得
+
+    Returns:
+        dict: {"uptime_sec", "counters", "gauges", "timers", "rss_bytes"}
+              timers は {名前: {"count", "last_ms", "avg_ms", "max_ms"}}
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timers = {name: list(stats) for name, stats in _timers.items()}
+        uptime = time.monotonic() - _start
+
+    # 関数のゲージはロックの外で呼ぶ（関数内で計測値を書き込んでも止まらないように）
+    for name, value in gauges.items():
+        if callable(value):
+            try:
+                gauges[name] = value()
+            except Exception as e:
+                print(f"計測値の取得に失敗 {name}: {e}")
+                gauges[name] = None
+    return {
+        "uptime_sec": round(uptime, 1),
+        "counters": counters,
+        "gauges": gauges,
+        "timers": {
+            name: {
+                "count": count,
+                "last_ms": round(last * 1000, 2),
+                "avg_ms": round(total * 1000 / count, 2),
+                "max_ms": round(peak * 1000, 2),
+            }
+            for name, (count, total, last, peak) in timers.items()
+        },
+        "rss_bytes": process_rss(),
+    }
+
+
+def hit_rate(counters, name):
+    """
+    カウンター「<name>.hits」「<name>.misses」からヒット率を求める
+
+    Returns:
+        float: 0〜1のヒット率（まだ参照がない場合None）
+    """
+    hits = counters.get(f"{name}.hits", 0)
+    total = hits + counters.get(f"{name}.misses", 0)
+    return hits / total if total else None
+
+
+def export(path):
+    """
+    計測値を環境情報と一緒にJSONファイルへ書き出す（不具合報告に添付する）
+
+    Returns:
+        bool: 書き出せたかどうか
+    """
+    data = {
+        "exported_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "metrics": snapshot(),
+    }
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+        return True
+    except OSError as e:
+        print(f"計測値の書き出しに失敗: {e}")
+        return False
+
+
+def process_rss():
+    """
+    プロセスの常駐メモリ（RSS）のバイト数（取得できない場合None）
+    - Linux: /proc/self/statm
+    - Windows: GetProcessMemoryInfo
+    - その他（macOS）: getrusage のピーク値
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        if sys.platform == "win32":
+            return _windows_rss()
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # macOS はバイト単位
+    except Exception:
+        return None
+
+
+def _windows_rss():
+    """Windows のワーキングセットのバイト数"""
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize
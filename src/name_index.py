@@ -0,0 +1,168 @@
+# --- ファイル名検索インデックス ---
+# ファイル名の部分一致検索を、3-gram（トライグラム）の転置インデックスで高速化する
+# - 3-gramごとに、その文字列をファイル名に含むファイルの通し番号の昇順配列（NumPy）を保持
+# - 3文字以上の入力は各3-gramの配列の積集合を候補とし、候補のファイル名で実際の部分一致を確認
+# - 1〜2文字の入力はインデックスで絞り込めないため全件を走査する
+# - ファイルの追加は3-gramごとの未反映リストに溜め、検索で使う3-gramだけを反映する
+#   （通し番号は再利用されず増える一方なので、末尾に連結するだけで昇順が保たれる）
+# - 削除されたファイルの通し番号は配列に残る。検索結果は全件のビットセットとANDして使う
+
+import unicodedata
+import collections
+import numpy as np
+
+_GRAM = 3
+
+
+def normalize_text(text):
+    """検索用に文字列を正規化（大文字・小文字、全角・半角の違いを無視）"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def normalize_name(name):
+    """検索対象のファイル名部分を正規化（ライブラリ表示の絶対パス・アーカイブ内のパスはフォルダ部分を除く）"""
+    return normalize_text(name.replace("\\", "/").rsplit("/", 1)[-1])
+
+
+class FilenameIndex:
+    """
+    MediaStore のファイル名に対する3-gram転置インデックス
+    """
+
+    def __init__(self, store):
+        """
+        初期化（ストア全体から構築）
+
+        Args:
+            store: 対象の MediaStore
+        """
+        self._names = [None] * store.ordinal_count  # 通し番号: 正規化したファイル名（削除済みはNone）
+        postings = collections.defaultdict(list)
+        for record in store.values():
+            key = normalize_name(record.name)
+            self._names[record.ordinal] = key
+            for gram in self._grams_of(key):
+                postings[gram].append(record.ordinal)
+        # store.values() は追加順＝通し番号順なので、各リストは昇順
+        self._postings = {gram: np.array(ordinals, dtype=np.int64) for gram, ordinals in postings.items()}
+        self._pending = collections.defaultdict(list)  # 3-gram: 未反映の通し番号
+        self._cache = None  # 直近の (入力, 合致した通し番号の配列)
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def add(self, ordinal, name):
+        """ファイルを追加（同じ通し番号の再追加はファイル名の更新として扱う）"""
+        key = normalize_name(name)
+        self._cache = None
+        if ordinal < len(self._names):
+            if self._names[ordinal] == key:
+                return
+            # ファイル名が変わった場合は削除扱いにして新しい3-gramを登録（古い3-gramは確認で除外される）
+            self._names[ordinal] = key
+        else:
+            self._names.extend([None] * (ordinal - len(self._names)))
+            self._names.append(key)
+        for gram in self._grams_of(key):
+            self._pending[gram].append(ordinal)
+
+    def remove(self, ordinal):
+        """ファイルを削除（3-gramの配列からは取り除かず、検索時に除外する）"""
+        if ordinal < len(self._names):
+            self._names[ordinal] = None
+            self._cache = None
+
+    def search(self, text):
+        """
+        ファイル名に入力文字列を含むファイルを検索
+
+        Args:
+            text: 入力文字列（前後の空白は無視）
+
+        Returns:
+            numpy.ndarray: 合致したファイルの通し番号の昇順配列（空の入力はNone）
+        """
+        query = normalize_text(text.strip())
+        if not query:
+            return None
+        if self._cache is not None and self._cache[0] == query:
+            return self._cache[1]
+
+        names = self._names
+        if len(query) < _GRAM:
+            ordinals = [o for o, key in enumerate(names) if key is not None and query in key]
+        else:
+            candidates = self._candidates(query)
+            ordinals = [o for o in candidates.tolist() if names[o] is not None and query in names[o]]
+        result = np.array(ordinals, dtype=np.int64)
+        self._cache = (query, result)
+        return result
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    @staticmethod
+    def _grams_of(key):
+        """キーに含まれる3-gramの集合"""
+        return {key[i:i + _GRAM] for i in range(len(key) - _GRAM + 1)}
+
+    def _posting(self, gram):
+        """3-gramの通し番号配列を取得（未反映の追加分をここで連結）"""
+        pending = self._pending.pop(gram, None)
+        current = self._postings.get(gram)
+        if pending:
+            added = np.array(pending, dtype=np.int64)
+            current = added if current is None else np.concatenate([current, added])
+            self._postings[gram] = current
+        return current if current is not None else np.empty(0, dtype=np.int64)
+
+    def _candidates(self, query):
+        """入力に含まれる全3-gramを持つファイルの通し番号（件数の少ない配列から順に絞り込む）"""
+        postings = sorted((self._posting(query[i:i + _GRAM]) for i in range(len(query) - _GRAM + 1)), key=len)
+        result = postings[0]
+        for other in postings[1:]:
+            if not len(result) or not len(other):
+                return result[:0]
+            # 昇順配列同士なので二分探索で共通部分を求める
+            idx = np.searchsorted(other, result)
+            idx[idx == len(other)] = 0
+            result = result[other[idx] == result]
+        return result
+
+
+def _benchmark(count=100_000, queries=("i", "20", "img", "img_0", "0123", "_2019", "xyz", "dsc_12345")):
+    """count 件のファイル名での構築時間と1回の検索時間を計測"""
+    import time
+    import random
+    from media_store import MediaStore
+
+    rng = random.Random(0)
+    prefixes = ["IMG_", "DSC_", "PXL_2019", "VID_2020", "旅行_", "Screenshot "]
+    store = MediaStore()
+    for i in range(count):
+        store.add(f"{rng.choice(prefixes)}{rng.randrange(10**7):07d}.jpg", 1_500_000_000 + i)
+
+    start = time.perf_counter()
+    index = FilenameIndex(store)
+    print(f"構築: {time.perf_counter() - start:.2f} 秒 ({count} 件)")
+
+    for text in queries:
+        index._cache = None
+        start = time.perf_counter()
+        result = index.search(text)
+        print(f"{text!r:>12}: {(time.perf_counter() - start) * 1000:7.2f} ms ({len(result)} 件合致)")
+
+    start = time.perf_counter()
+    for i in range(1000):
+        record = store.add(f"NEW_{i:05d}.jpg", 1_600_000_000 + i)
+        index.add(record.ordinal, record.name)
+    index.search("new_0")
+    print(f"1000件追加後の検索: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    # 使い方: python src/name_index.py [件数]
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,131 @@
+# --- プレビューのデコーダープラグイン ---
+# 画像全体をデコードせずに、ファイルに埋め込まれたプレビュー（JPEG）を取り出すデコーダーを拡張子ごとに登録する
+# - サムネイル生成・プレビュー表示は登録済みのデコーダーを先に試し、プレビューがない場合だけ画像全体をデコードする
+# - 新しい形式は @register(".拡張子", ...) を付けた関数を定義するだけで追加できる（フォルダ一覧の対象にもなる）
+#   デコーダーはファイルオブジェクトを受け取り、埋め込みJPEGの (オフセット, バイト数) の一覧と向きを返す
+# - 候補が複数ある場合は、表示枠に収める時に拡大せずに済む最も小さいものを選ぶ（サムネイルには小さいプレビュー、表示には大きいもの）
+#   候補のサイズはJPEGのフレームヘッダだけを読んで調べる
+# - 組み込み: TIFF構造のRAW（CR2/NEF/ARW/DNG）とTIFF（複数ページを含む）。デモザイク処理は行わない
+
+import io
+import os
+import struct
+from PIL import Image, ImageOps
+import media_fs
+import media_metadata
+
+# 拡張子: [デコーダー関数]
+_decoders = {}
+
+# Exif Orientation: 正しい向きに戻す変換（ImageOps.exif_transpose と同じ対応）
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_EXIF_ORIENTATION = 0x0112
+
+
+def register(*exts):
+    """
+    デコーダーを登録するデコレータ
+
+    Args:
+        exts: 対象の拡張子（".cr2" など）
+
+    デコーダー関数:
+        引数: シーク可能なファイルオブジェクト
+        戻り値: ([(埋め込みJPEGのオフセット, バイト数)], Exif Orientation)
+    """
+    def decorator(func):
+        for ext in exts:
+            _decoders.setdefault(ext.lower(), []).append(func)
+        media_fs.register_image_exts(exts)
+        return func
+    return decorator
+
+
+def has_decoder(file_path):
+    """ファイルの拡張子にデコーダーが登録されているか"""
+    return os.path.splitext(file_path)[1].lower() in _decoders
+
+
+def open_preview(file_path, box_size, draft_scale=1):
+    """
+    埋め込みプレビューをデコードして返す
+
+    Args:
+        file_path: ファイルパス
+        box_size: 表示枠のサイズ (幅, 高さ)。収める時に拡大せずに済む最も小さいプレビューを選ぶ（ない場合は最も大きいもの）
+        draft_scale: 1より大きい場合、box_size の 1/draft_scale を目安に粗くデコードする（JPEGのドラフトモード）
+
+    Returns:
+        PIL.Image: 向きを補正したRGB画像（デコーダーがない・プレビューがない場合None）
+    """
+    decoders = _decoders.get(os.path.splitext(file_path)[1].lower())
+    if not decoders:
+        return None
+    try:
+        with media_fs.open_media(file_path) as f:
+            for decoder in decoders:
+                img = _open_best_candidate(f, decoder, box_size, draft_scale)
+                if img is not None:
+                    return img
+    except (OSError, EOFError, ValueError, struct.error) as e:
+        print(f"埋め込みプレビューの読み取りに失敗: {file_path}: {e}")
+    return None
+
+
+# ===============================
+# 内部処理
+# ===============================
+
+def _open_best_candidate(f, decoder, box_size, draft_scale):
+    """デコーダーの候補から要求サイズに合うものを選んでデコード（壊れている候補は飛ばす）"""
+    ranges, orientation = decoder(f)
+    rotated = orientation in (5, 6, 7, 8)
+    sized = []
+    for offset, length in ranges:
+        size = media_metadata.read_jpeg_size(f, offset)
+        if size is not None:
+            sized.append((size[::-1] if rotated else size, offset, length))
+
+    # 表示枠に収める時に拡大せずに済むもの（幅・高さのどちらかが枠以上）を小さい順、その後に残りを大きい順
+    large = sorted(c for c in sized if c[0][0] >= box_size[0] or c[0][1] >= box_size[1])
+    small = sorted((c for c in sized if c not in large), reverse=True)
+    for _, offset, length in large + small:
+        f.seek(offset)
+        data = f.read(length)
+        try:
+            return _decode_jpeg(data, orientation, box_size, draft_scale)
+        except Exception as e:
+            print(f"埋め込みプレビューのデコードに失敗: {e}")
+    return None
+
+
+def _decode_jpeg(data, orientation, box_size, draft_scale):
+    """埋め込みJPEGをデコードし、向きを補正する（JPEG自身にExifの向きがあればそちらを優先）"""
+    img = Image.open(io.BytesIO(data))
+    width, height = box_size if orientation not in (5, 6, 7, 8) else box_size[::-1]
+    img.draft("RGB", (max(1, width // draft_scale), max(1, height // draft_scale)))
+    if img.getexif().get(_EXIF_ORIENTATION, 1) != 1:
+        img = ImageOps.exif_transpose(img)
+    elif orientation in _ORIENTATION_TRANSPOSE:
+        img = img.transpose(_ORIENTATION_TRANSPOSE[orientation])
+    img = img.convert("RGB")
+    img.load()
+    return img
+
+
+# ===============================
+# 組み込みデコーダー
+# ===============================
+
+@register(".cr2", ".nef", ".arw", ".dng", ".tif", ".tiff")
+def _tiff_previews(f):
+    """TIFF構造のファイル（RAW・複数ページTIFF）のIFDを辿り、埋め込みJPEGを探す"""
+    return media_metadata.read_tiff_previews(f)
@@ -0,0 +1,136 @@
+# --- スキャンのイベント ---
+# logic.iter_scan が順に返すイベントの型と、進捗（スループット・残り時間）の集計
+# - FileDiscovered: フォルダ内でファイルを見つけた（JSONの既存情報を反映済みのレコード）
+#   日付が未解析のレコードはファイル更新日時が仮の日付（高遅延モードの新規ファイルは0）で、MetadataReady で確定する
+# - FileRemoved: JSONにあったがフォルダからなくなったファイル
+# - MetadataReady: ハッシュ・撮影日時などのメタデータを更新した
+# - ThumbnailReady: サムネイルを生成した
+# - ScanError: ファイルの処理に失敗した（スキャンは続行）
+# - ScanProgress: 一定間隔ごとの進捗
+# - ScanDone: スキャン完了（取り消した場合も送られる）
+
+import time
+import metrics
+
+
+class FileDiscovered:
+    """ファイルを見つけた"""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record):
+        self.record = record  # MediaRecord
+
+
+class FileRemoved:
+    """前回のスキャン結果にあったファイルがなくなった"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class MetadataReady:
+    """ハッシュ・作成日時・statシグネチャを更新した"""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record):
+        self.record = record
+
+
+class ThumbnailReady:
+    """サムネイルを生成した"""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record):
+        self.record = record
+
+
+class ScanError:
+    """ファイルの処理に失敗した"""
+
+    __slots__ = ("name", "error")
+
+    def __init__(self, name, error):
+        self.name = name
+        self.error = error  # 発生した例外
+
+
+class ScanProgress:
+    """
+    スキャンの進捗
+    - done / total: 処理済み・全体のファイル数
+    - rate: 直近の処理速度（件/秒）
+    - eta: 残り時間の見込み（秒、速度が測れない間はNone）
+    """
+
+    __slots__ = ("done", "total", "elapsed", "rate", "eta")
+
+    def __init__(self, done, total, elapsed, rate, eta):
+        self.done = done
+        self.total = total
+        self.elapsed = elapsed
+        self.rate = rate
+        self.eta = eta
+
+    def format(self):
+        """進捗を1行の文字列にする（例: 1200/5000 (24%) 310件/秒 残り約12秒）"""
+        percent = self.done * 100 // self.total if self.total else 100
+        text = f"{self.done}/{self.total} ({percent}%) {self.rate:.0f}件/秒"
+        if self.eta is not None:
+            text += f" 残り約{self.eta:.0f}秒"
+        return text
+
+
+class ScanDone:
+    """スキャン完了"""
+
+    __slots__ = ("store", "all_tags", "cancelled", "saved")
+
+    def __init__(self, store, all_tags, cancelled, saved):
+        self.store = store  # MediaStore
+        self.all_tags = all_tags  # タグ: 件数
+        self.cancelled = cancelled  # 途中で取り消したかどうか
+        self.saved = saved  # JSONを保存したかどうか
+
+
+class ProgressMeter:
+    """
+    処理件数から ScanProgress を作る
+    速度は直近の区間（SMOOTHING で指数平滑化）で測り、変更のないファイルが続いた後の急な変化を和らげる
+    """
+
+    SMOOTHING = 0.3
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self._start = time.monotonic()
+        self._last_time = self._start
+        self._last_done = 0
+        self._rate = None
+
+    def advance(self, count=1):
+        """処理件数を進める"""
+        self.done += count
+
+    def snapshot(self):
+        """現在の進捗を取得（前回の取得からの区間で速度を更新）"""
+        now = time.monotonic()
+        interval = now - self._last_time
+        if interval > 0 and self.done > self._last_done:
+            rate = (self.done - self._last_done) / interval
+            self._rate = rate if self._rate is None else (
+                self.SMOOTHING * rate + (1 - self.SMOOTHING) * self._rate
+            )
+            self._last_time = now
+            self._last_done = self.done
+        rate = self._rate or 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else None
+        metrics.set_gauge("scan.rate", rate)
+        metrics.set_gauge("scan.done", self.done)
+        metrics.set_gauge("scan.total", self.total)
+        return ScanProgress(self.done, self.total, now - self._start, rate, eta)
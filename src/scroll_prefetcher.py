@@ -0,0 +1,64 @@
+# --- スクロール先読み ---
+# スクロールの方向と速度から、次に表示されるセルの範囲（先読み範囲）を求める
+
+import time
+import constants
+
+
+class ScrollPrefetcher:
+    """
+    スクロールの方向と速度を追跡し、先読み範囲を計算するクラス
+    - 速いスクロールほど先の画面まで先読みする（最大 PREFETCH_MAX_SCREENS 画面）
+    - スクロール方向の逆側は PREFETCH_BEHIND_SCREENS 画面だけ保持する
+    """
+
+    # この時間以上スクロールが止まっていたら速度をリセット
+    _IDLE_RESET_SEC = 0.5
+
+    def __init__(self):
+        self.velocity = 0.0  # セル/秒（正: 下方向、負: 上方向）
+        self.direction = 1
+        self._last = None  # 直近の (先頭位置, 時刻)
+
+    def update(self, first, now=None):
+        """
+        表示中の先頭位置を記録して速度・方向を更新
+
+        Args:
+            first: 表示中の先頭セルの位置
+            now: 現在時刻（省略時は time.monotonic()）
+        """
+        now = time.monotonic() if now is None else now
+        if self._last is not None:
+            last_first, last_time = self._last
+            moved = first - last_first
+            elapsed = now - last_time
+            if elapsed > self._IDLE_RESET_SEC:
+                self.velocity = 0.0
+            if moved and elapsed > 0:
+                # 指数移動平均で速度を平滑化
+                self.velocity = 0.5 * self.velocity + 0.5 * (moved / elapsed)
+                self.direction = 1 if moved > 0 else -1
+        self._last = (first, now)
+
+    def window(self, first, last, total):
+        """
+        先読み範囲を計算
+
+        Args:
+            first: 表示中の先頭位置
+            last: 表示中の末尾位置
+            total: 全セル数
+
+        Returns:
+            tuple: (先頭位置, 末尾位置) の先読み範囲（表示中の範囲を含む）
+        """
+        screen = max(1, last - first + 1)
+        screens_ahead = abs(self.velocity) * constants.PREFETCH_LOOKAHEAD_SEC / screen
+        screens_ahead = min(max(screens_ahead, 1.0), constants.PREFETCH_MAX_SCREENS)
+        ahead = int(screen * screens_ahead)
+        behind = screen * constants.PREFETCH_BEHIND_SCREENS
+
+        if self.direction >= 0:
+            return max(0, first - behind), min(total - 1, last + ahead)
+        return max(0, first - ahead), min(total - 1, last + behind)
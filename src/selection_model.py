@@ -0,0 +1,223 @@
+# --- 選択範囲のモデル ---
+# サムネイル一覧の選択状態を、表示順の位置の範囲（半開区間 [開始, 終了)）の並びで保持する
+# - 範囲は開始位置の昇順で、重なり・隣接がないよう常に結合しておく
+# - すべて選択・反転・範囲選択は範囲の数だけの処理で済み、選択件数に比例しない（10万件でも一瞬）
+# - 変更操作は「状態が変わった位置の範囲」を返す。呼び出し側は、その範囲のうち
+#   ウィジェットを作成済みのセルだけを再描画すればよい
+# - 表示順が変わった場合は、呼び出し側がファイル名経由で from_positions で作り直す
+
+import bisect
+
+
+class RangeSelection:
+    """
+    表示順の位置の範囲で表した選択状態
+    """
+
+    def __init__(self, ranges=()):
+        """
+        初期化
+
+        Args:
+            ranges: 選択する (開始, 終了) の範囲（重なり・順不同でもよい）
+        """
+        self._starts = []  # 範囲の開始位置（昇順）
+        self._ends = []  # 範囲の終了位置（この位置は含まない）
+        self._count = 0
+        for start, end in ranges:
+            self.add_range(start, end)
+
+    @classmethod
+    def from_positions(cls, positions):
+        """
+        位置の一覧から作成（連続する位置は1つの範囲にまとめる）
+
+        Args:
+            positions: 選択する位置（順不同、重複可）
+        """
+        selection = cls()
+        positions = sorted(set(positions))
+        i = 0
+        while i < len(positions):
+            j = i
+            while j + 1 < len(positions) and positions[j + 1] == positions[j] + 1:
+                j += 1
+            selection._starts.append(positions[i])
+            selection._ends.append(positions[j] + 1)
+            i = j + 1
+        selection._count = len(positions)
+        return selection
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, position):
+        i = bisect.bisect_right(self._starts, position) - 1
+        return i >= 0 and position < self._ends[i]
+
+    def __iter__(self):
+        for start, end in zip(self._starts, self._ends):
+            yield from range(start, end)
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def ranges(self):
+        """選択中の (開始, 終了) の範囲のリスト（昇順）"""
+        return list(zip(self._starts, self._ends))
+
+    def add_range(self, start, end):
+        """
+        [start, end) を選択に加える
+
+        Returns:
+            list: 新たに選択された (開始, 終了) の範囲のリスト
+        """
+        if start >= end:
+            return []
+        changed = self._gaps(start, end)
+        # 重なる・隣接する範囲を1つに結合
+        lo = bisect.bisect_left(self._ends, start)
+        hi = bisect.bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+        self._count += sum(e - s for s, e in changed)
+        return changed
+
+    def remove_range(self, start, end):
+        """
+        [start, end) を選択から外す
+
+        Returns:
+            list: 選択が解除された (開始, 終了) の範囲のリスト
+        """
+        if start >= end:
+            return []
+        changed = self._overlaps(start, end)
+        if not changed:
+            return []
+        lo = bisect.bisect_right(self._ends, start)
+        hi = bisect.bisect_left(self._starts, end)
+        # 端の範囲のうち、外す範囲の外側に残る部分
+        starts, ends = [], []
+        if self._starts[lo] < start:
+            starts.append(self._starts[lo])
+            ends.append(start)
+        if self._ends[hi - 1] > end:
+            starts.append(end)
+            ends.append(self._ends[hi - 1])
+        self._starts[lo:hi] = starts
+        self._ends[lo:hi] = ends
+        self._count -= sum(e - s for s, e in changed)
+        return changed
+
+    def toggle(self, position):
+        """
+        1件の選択状態を切り替え
+
+        Returns:
+            list: 状態が変わった範囲のリスト
+        """
+        if position in self:
+            return self.remove_range(position, position + 1)
+        return self.add_range(position, position + 1)
+
+    def select_all(self, total):
+        """
+        [0, total) をすべて選択
+
+        Returns:
+            list: 新たに選択された範囲のリスト
+        """
+        return self.add_range(0, total)
+
+    def invert(self, total):
+        """
+        [0, total) の選択状態を反転
+
+        Returns:
+            list: 状態が変わった範囲のリスト（範囲内のすべての位置）
+        """
+        gaps = self._gaps(0, total)
+        self._starts = [s for s, _ in gaps]
+        self._ends = [e for _, e in gaps]
+        self._count = sum(e - s for s, e in gaps)
+        return [(0, total)] if total > 0 else []
+
+    def clear(self):
+        """
+        すべての選択を解除
+
+        Returns:
+            list: 選択が解除された範囲のリスト
+        """
+        changed = self.ranges()
+        self._starts = []
+        self._ends = []
+        self._count = 0
+        return changed
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _overlaps(self, start, end):
+        """[start, end) のうち選択されている部分の範囲のリスト"""
+        result = []
+        i = bisect.bisect_right(self._ends, start)
+        while i < len(self._starts) and self._starts[i] < end:
+            result.append((max(start, self._starts[i]), min(end, self._ends[i])))
+            i += 1
+        return result
+
+    def _gaps(self, start, end):
+        """[start, end) のうち選択されていない部分の範囲のリスト"""
+        result = []
+        cursor = start
+        for s, e in self._overlaps(start, end):
+            if cursor < s:
+                result.append((cursor, s))
+            cursor = e
+        if cursor < end:
+            result.append((cursor, end))
+        return result
+
+
+def contains_position(ranges, position):
+    """
+    (開始, 終了) の範囲のリスト（昇順・重なりなし）に位置が含まれるか
+
+    Args:
+        ranges: RangeSelection の変更操作が返した範囲のリスト
+        position: 位置
+    """
+    i = bisect.bisect_right(ranges, (position, float("inf"))) - 1
+    return i >= 0 and position < ranges[i][1]
+
+
+def _benchmark(count=100_000):
+    """count 件の一覧での、すべて選択・反転・範囲選択・位置の取り出しの時間を計測"""
+    import time
+
+    selection = RangeSelection()
+    for label, operation in (
+        ("すべて選択", lambda: selection.select_all(count)),
+        ("反転", lambda: selection.invert(count)),
+        ("範囲選択", lambda: selection.add_range(count // 4, count * 3 // 4)),
+        ("1件ずつ切り替え x1000", lambda: [selection.toggle(i * 97 % count) for i in range(1000)]),
+        ("位置の取り出し", lambda: list(selection)),
+        ("すべて解除", lambda: selection.clear()),
+    ):
+        start = time.perf_counter()
+        operation()
+        print(f"{label}: {(time.perf_counter() - start) * 1000:.3f} ms（選択 {len(selection)} 件）")
+
+
+if __name__ == "__main__":
+    # 使い方: python src/selection_model.py [件数]
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
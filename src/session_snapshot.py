@@ -0,0 +1,182 @@
+# --- セッションのスナップショット ---
+# フォルダを閉じる時に、読み込み済みのメディア情報と表示状態（絞り込み条件・日付範囲・スクロール位置）を保存し、
+# 次に同じフォルダを開いた時はスキャンを待たずに前回の表示を復元する
+# - 保存先はユーザーキャッシュディレクトリ（フォルダごとに1ファイル）
+# - 形式: 識別子 + JSONヘッダの長さ（struct）+ JSONヘッダ + バイト列の連結
+#   （pickleは読み込むだけで任意のコードを実行できるため使わない）
+# - サムネイルはbase64ではなく生のバイト列のまま保存するため、JSONだけの形式より小さく読み込みも速い
+# - 復元前に、フォルダ・タグJSON・ジャーナルの更新時刻と、一部のファイルのサイズ・更新日時を確認する
+#   （一致しない場合はメディア情報を使わず、通常のスキャンを行う）
+# - 復元後はバックグラウンドで通常のスキャンを行い、差分を反映する（呼び出し側で実施）
+
+import os
+import json
+import struct
+import hashlib
+import constants
+import media_fs
+import thumbnail_cache
+from media_store import MediaStore
+
+_VERSION = 3
+_MAGIC = b"TKSESS03"
+_HEADER = struct.Struct("<8sQ")  # 識別子, JSONヘッダのバイト数
+
+
+def snapshot_path(folder_path):
+    """フォルダのスナップショットファイルのパス"""
+    name = hashlib.sha1(os.path.abspath(folder_path).encode("utf-8")).hexdigest()
+    return os.path.join(thumbnail_cache.get_user_cache_dir(), constants.SESSION_SNAPSHOT_DIR, name + ".snapshot")
+
+
+def folder_signature(folder_path):
+    """
+    フォルダの変更検知用シグネチャ（ファイルの中身は読まない）
+    - フォルダ（またはZIPアーカイブ）の更新時刻: ファイルの追加・削除・名前の変更で変わる
+    - タグJSON・ジャーナルの更新時刻とサイズ: スキャン結果の保存・タグの編集で変わる
+    """
+    signature = []
+    for path in (folder_path, media_fs.tags_json_path(folder_path), media_fs.tag_journal_path(folder_path)):
+        try:
+            st = os.stat(path)
+            signature.append([st.st_mtime_ns, st.st_size])
+        except OSError:
+            signature.append(None)
+    return signature
+
+
+def save(folder_path, store, session):
+    """
+    スナップショットを保存（一時ファイルに書いてから置き換えるため、途中で終了しても壊れない）
+
+    Args:
+        folder_path: フォルダまたはZIPアーカイブのパス
+        store: 読み込み済みの MediaStore
+        session: 表示状態の辞書（query_text, name_text, selected_tags, date_range, scroll）
+    """
+    path = snapshot_path(folder_path)
+    records = []
+    blobs = []
+    for r in store.values():
+        # バイト列は長さだけをヘッダに書き、本体はヘッダの後ろに順に連結する
+        records.append([r.name, r.created, list(r.tags), r.date_source, r.stat_signature,
+                        len(r.file_hash), len(r.thumbnail), len(r.descriptor)])
+        blobs += (r.file_hash, r.thumbnail, r.descriptor)
+    header = json.dumps({
+        "version": _VERSION,
+        "folder": os.path.abspath(folder_path),
+        "signature": folder_signature(folder_path),
+        "records": records,
+        "session": session,
+    }, ensure_ascii=False).encode("utf-8")
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(header)))
+            f.write(header)
+            f.writelines(blobs)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"セッションの保存に失敗: {e}")
+
+
+def load(folder_path):
+    """
+    スナップショットを読み込む
+
+    Returns:
+        tuple: (MediaStore or None, 表示状態の辞書 or None)
+               メディア情報はフォルダが変更されていない場合だけ返す。表示状態は変更されていても返す
+    """
+    path = snapshot_path(folder_path)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None, None
+    except OSError as e:
+        print(f"セッションの読み込みに失敗: {e}")
+        return None, None
+    try:
+        data, blobs = _parse(content)
+    except (ValueError, TypeError, KeyError, struct.error) as e:
+        # 旧形式（pickle）や壊れたファイルは中身を解釈せずに捨て、通常のスキャンを行う
+        print(f"セッションの読み込みに失敗: {e}")
+        return None, None
+    if data.get("version") != _VERSION or data.get("folder") != os.path.abspath(folder_path):
+        return None, None
+
+    session = data.get("session")
+    if not isinstance(session, dict):
+        session = None
+    if data.get("signature") != folder_signature(folder_path):
+        return None, session
+
+    try:
+        store = _build_store(data["records"], blobs)
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"セッションの読み込みに失敗: {e}")
+        return None, session
+    if not _sample_unchanged(folder_path, store):
+        return None, session
+    return store, session
+
+
+def _parse(content):
+    """
+    スナップショットのバイト列をJSONヘッダとバイト列部分に分ける
+
+    Returns:
+        tuple: (ヘッダの辞書, バイト列部分の memoryview)
+    """
+    if len(content) < _HEADER.size:
+        raise ValueError("ファイルが短すぎます")
+    magic, header_size = _HEADER.unpack_from(content)
+    if magic != _MAGIC:
+        raise ValueError("スナップショットの形式ではありません")
+    end = _HEADER.size + header_size
+    if end > len(content):
+        raise ValueError("ヘッダが途中で切れています")
+    data = json.loads(content[_HEADER.size:end].decode("utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError("ヘッダの形式が不正です")
+    return data, memoryview(content)[end:]
+
+
+def _build_store(records, blobs):
+    """ヘッダのレコード情報とバイト列部分から MediaStore を組み立てる"""
+    store = MediaStore()
+    offset = 0
+    for name, created, tags, date_source, stat_signature, hash_size, thumb_size, descriptor_size in records:
+        values = []
+        for size in (hash_size, thumb_size, descriptor_size):
+            if not isinstance(size, int) or size < 0 or offset + size > len(blobs):
+                raise ValueError("バイト列の長さが不正です")
+            values.append(bytes(blobs[offset:offset + size]))
+            offset += size
+        file_hash, thumbnail, descriptor = values
+        store.add(str(name), float(created), [str(t) for t in tags], file_hash, thumbnail,
+                  str(date_source), int(stat_signature), descriptor)
+    if offset != len(blobs):
+        raise ValueError("バイト列の長さが一致しません")
+    return store
+
+
+def _sample_unchanged(folder_path, store):
+    """
+    等間隔に選んだ一部のファイルのサイズ・更新日時が前回のスキャン時と同じか
+    （フォルダの更新時刻が変わらない上書き保存を、全件を調べずに検出する）
+    """
+    records = list(store.values())
+    if not records:
+        return True
+    step = max(1, len(records) // constants.SESSION_SAMPLE_FILES)
+    for record in records[::step]:
+        try:
+            signature = media_fs.stat_signature(*media_fs.stat_media(os.path.join(folder_path, record.name)))
+        except OSError:
+            return False
+        if record.stat_signature and signature != record.stat_signature:
+            return False
+    return True
@@ -0,0 +1,191 @@
+# --- タグ補完インデックス ---
+# タグ編集メニューの入力補完用に、タグを前方一致・部分一致で検索するインデックス
+# - 前方一致: 正規化したタグのソート済み配列を二分探索
+# - 部分一致: 2〜3文字のN-gramの転置インデックス（3文字を超える入力は3-gramの積集合を絞り込んで確認）
+#   候補が多すぎる場合（1文字の入力など）はソート済み配列を先頭から走査し、表示件数に達したら打ち切る
+# - タグの追加・削除は差分で反映し、メニューを開き直しても作り直さない
+
+import heapq
+import bisect
+import unicodedata
+import collections
+
+_MIN_GRAM = 2
+_MAX_GRAM = 3
+_SCAN_RATIO = 20  # 候補数が表示件数のこの倍数を超えたら、ソート済み配列の走査に切り替える
+
+
+def normalize_tag(tag):
+    """検索用にタグを正規化（大文字・小文字、全角・半角の違いを無視）"""
+    return unicodedata.normalize("NFKC", tag).casefold()
+
+
+class TagCompletionIndex:
+    """
+    タグの前方一致・部分一致検索インデックス
+    """
+
+    def __init__(self, tags=()):
+        """
+        初期化
+
+        Args:
+            tags: 登録するタグ
+        """
+        self._keys = {tag: normalize_tag(tag) for tag in tags}  # タグ: 正規化したキー
+        self._sorted = sorted((key, tag) for tag, key in self._keys.items())  # (キー, タグ) の昇順リスト
+        self._grams = collections.defaultdict(set)  # N-gram: その文字列を含むタグの集合
+        for tag, key in self._keys.items():
+            for gram in self._grams_of(key):
+                self._grams[gram].add(tag)
+
+    def __contains__(self, tag):
+        return tag in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def add(self, tag):
+        """タグを追加（登録済みなら何もしない）"""
+        if tag in self._keys:
+            return
+        key = normalize_tag(tag)
+        self._keys[tag] = key
+        bisect.insort(self._sorted, (key, tag))
+        for gram in self._grams_of(key):
+            self._grams[gram].add(tag)
+
+    def remove(self, tag):
+        """タグを削除（未登録なら何もしない）"""
+        key = self._keys.pop(tag, None)
+        if key is None:
+            return
+        idx = bisect.bisect_left(self._sorted, (key, tag))
+        if idx < len(self._sorted) and self._sorted[idx] == (key, tag):
+            del self._sorted[idx]
+        for gram in self._grams_of(key):
+            postings = self._grams.get(gram)
+            if postings is not None:
+                postings.discard(tag)
+                if not postings:
+                    del self._grams[gram]
+
+    def sync_counts(self, tag_counts, tags):
+        """
+        件数の変わったタグを反映（件数が0になったタグは削除、1以上なら追加）
+
+        Args:
+            tag_counts: タグ: 件数 の辞書
+            tags: 件数の変わったタグ
+        """
+        for tag in tags:
+            if tag_counts.get(tag, 0) > 0:
+                self.add(tag)
+            else:
+                self.remove(tag)
+
+    def search(self, text, limit=None):
+        """
+        入力文字列に一致するタグを検索
+
+        Args:
+            text: 入力文字列（空の場合はすべてのタグ）
+            limit: 返す件数の上限（None で無制限）
+
+        Returns:
+            list: 前方一致のタグ（昇順）→ 部分一致のタグ（昇順）の順のリスト
+        """
+        query = normalize_tag(text.strip())
+        if not query:
+            end = len(self._sorted) if limit is None else limit
+            return [tag for _, tag in self._sorted[:end]]
+
+        # 前方一致（ソート済み配列の連続した範囲）
+        start = bisect.bisect_left(self._sorted, (query,))
+        prefix = []
+        for key, tag in self._sorted[start:]:
+            if not key.startswith(query):
+                break
+            prefix.append(tag)
+            if limit is not None and len(prefix) >= limit:
+                return prefix
+
+        # 部分一致（前方一致を除く）
+        prefix_set = set(prefix)
+        candidates = self._substring_candidates(query)
+        if candidates is None or (limit is not None and len(candidates) > limit * _SCAN_RATIO):
+            # 候補が多い場合は昇順に走査すれば早く表示件数に達する
+            others = []
+            for key, tag in self._sorted:
+                if query in key and tag not in prefix_set:
+                    others.append(tag)
+                    if limit is not None and len(prefix) + len(others) >= limit:
+                        break
+            return prefix + others
+
+        # 2〜3文字はN-gramが完全に一致するので確認不要
+        verify = len(query) > _MAX_GRAM
+        others = [tag for tag in candidates
+                  if tag not in prefix_set and (not verify or query in self._keys[tag])]
+        sort_key = lambda t: (self._keys[t], t)
+        if limit is None:
+            others.sort(key=sort_key)
+        else:
+            others = heapq.nsmallest(limit - len(prefix), others, key=sort_key)
+        return prefix + others
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    @staticmethod
+    def _grams_of(key):
+        """キーに含まれる2〜3文字のN-gramの集合"""
+        return {key[i:i + n] for n in range(_MIN_GRAM, _MAX_GRAM + 1) for i in range(len(key) - n + 1)}
+
+    def _substring_candidates(self, query):
+        """
+        部分一致の候補（2〜3文字は確定、それより長い場合は3-gramの積集合）
+
+        Returns:
+            set: 候補のタグ。インデックスで絞り込めない1文字の入力はNone
+        """
+        if len(query) < _MIN_GRAM:
+            return None
+        if len(query) <= _MAX_GRAM:
+            return self._grams.get(query, ())
+        grams = sorted(
+            (self._grams.get(query[i:i + _MAX_GRAM], set())
+             for i in range(len(query) - _MAX_GRAM + 1)),
+            key=len,
+        )
+        return set.intersection(*grams) if grams[0] else ()
+
+
+def _benchmark(count=50_000, keystrokes=("t", "ta", "tag", "tag1", "tag12", "g12", "2")):
+    """タグ数 count の場合の1回の入力（検索）あたりの時間を計測"""
+    import time
+    import random
+
+    rng = random.Random(0)
+    words = ["tag", "photo", "家族", "旅行", "sample", "カメラ", "event", "memo"]
+    tags = {f"{rng.choice(words)}{i}" for i in range(count)}
+
+    start = time.perf_counter()
+    index = TagCompletionIndex(tags)
+    print(f"構築: {time.perf_counter() - start:.2f} 秒 ({len(index)} 件)")
+
+    for text in keystrokes:
+        start = time.perf_counter()
+        result = index.search(text, limit=200)
+        print(f"{text!r:>10}: {(time.perf_counter() - start) * 1000:6.2f} ms ({len(result)} 件表示)")
+
+
+if __name__ == "__main__":
+    # 使い方: python src/tag_index.py [タグ数]
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
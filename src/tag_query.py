@@ -0,0 +1,510 @@
+# --- タグ検索式エンジン ---
+# AND / OR / NOT と括弧を使ったタグ検索式を解析し、タグごとのビットセットの演算で評価する
+# ビットセットはファイルの通し番号（MediaRecord.ordinal）をビット位置とするPythonの整数
+
+import sys
+import datetime
+import collections
+import numpy as np
+import constants
+from date_buckets import DateBucketIndex
+
+
+class TagQueryError(ValueError):
+    """検索式の構文エラー"""
+
+
+# ===============================
+# 検索式の解析
+# ===============================
+
+_KEYWORDS = {"AND": "and", "OR": "or", "NOT": "not"}
+_SYMBOLS = {"&": "and", "|": "or", "!": "not", "(": "(", ")": ")"}
+
+
+def _tokenize(text):
+    """
+    検索式をトークンに分割
+
+    Returns:
+        list: (種類, 値) のリスト。種類は "and" / "or" / "not" / "(" / ")" / "tag"
+    """
+    tokens = []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch.isspace():
+            i += 1
+        elif ch in _SYMBOLS:
+            tokens.append((_SYMBOLS[ch], ch))
+            i += 1
+        elif ch == '"':
+            end = text.find('"', i + 1)
+            if end < 0:
+                raise TagQueryError("引用符が閉じられていません")
+            tokens.append(("tag", text[i + 1:end]))
+            i = end + 1
+        else:
+            start = i
+            while i < len(text) and not text[i].isspace() and text[i] not in _SYMBOLS and text[i] != '"':
+                i += 1
+            word = text[start:i]
+            kind = _KEYWORDS.get(word.upper())
+            tokens.append((kind, word) if kind else ("tag", word))
+    return tokens
+
+
+class _Parser:
+    """
+    再帰下降パーサ
+        expr     := and_expr (OR and_expr)*
+        and_expr := not_expr ((AND)? not_expr)*   ※ANDは省略可能
+        not_expr := NOT not_expr | atom
+        atom     := "(" expr ")" | タグ
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self._expr()
+        if self.pos < len(self.tokens):
+            raise TagQueryError(f"予期しない '{self.tokens[self.pos][1]}' があります")
+        return node
+
+    def _expr(self):
+        node = self._and_expr()
+        while self._peek() == "or":
+            self._next()
+            node = ("or", node, self._and_expr())
+        return node
+
+    def _and_expr(self):
+        node = self._not_expr()
+        while self._peek() in ("and", "not", "(", "tag"):
+            if self._peek() == "and":
+                self._next()
+            node = ("and", node, self._not_expr())
+        return node
+
+    def _not_expr(self):
+        if self._peek() == "not":
+            self._next()
+            return ("not", self._not_expr())
+        return self._atom()
+
+    def _atom(self):
+        kind = self._peek()
+        if kind is None:
+            raise TagQueryError("検索式が途中で終わっています")
+        if kind == "(":
+            self._next()
+            node = self._expr()
+            if self._peek() != ")":
+                raise TagQueryError("括弧が閉じられていません")
+            self._next()
+            return node
+        if kind == "tag":
+            return ("tag", self._next()[1])
+        raise TagQueryError(f"予期しない '{self.tokens[self.pos][1]}' があります")
+
+
+def parse_query(text):
+    """
+    検索式を構文木に変換
+
+    Args:
+        text: 検索式（例: "(風景 OR 旅行) AND NOT 仕事"）
+
+    Returns:
+        tuple: 構文木（空の検索式の場合None）
+
+    Raises:
+        TagQueryError: 構文エラーの場合
+    """
+    tokens = _tokenize(text or "")
+    if not tokens:
+        return None
+    return _Parser(tokens).parse()
+
+
+def selection_to_query(selected_tags):
+    """
+    タグボタンの選択状態を構文木に変換
+    - 「タグなし」のみ選択: タグなしのファイル
+    - それ以外: 選択タグを全て含むファイル
+    """
+    if not selected_tags:
+        return None
+    if selected_tags == [constants.NONE_TAG_TEXT]:
+        return ("untagged",)
+    return combine_and(*[("tag", tag) for tag in selected_tags])
+
+
+def combine_and(*nodes):
+    """複数の構文木をANDで結合（Noneは無視）"""
+    result = None
+    for node in nodes:
+        if node is None:
+            continue
+        result = node if result is None else ("and", result, node)
+    return result
+
+
+# ===============================
+# ビットセット
+# ===============================
+
+def _bits_from_bool(bool_array):
+    """bool配列をビットセット（整数）に変換"""
+    packed = np.packbits(bool_array, bitorder="little")
+    return int.from_bytes(packed.tobytes(), "little")
+
+
+def _bits_from_ordinals(ordinals, size):
+    """通し番号のリストをビットセット（整数）に変換"""
+    bool_array = np.zeros(size, dtype=bool)
+    bool_array[np.asarray(ordinals, dtype=np.int64)] = True
+    return _bits_from_bool(bool_array)
+
+
+def bits_to_ordinals(bits, size):
+    """ビットセット（整数）を通し番号の昇順配列に変換"""
+    if not bits:
+        return np.empty(0, dtype=np.int64)
+    raw = np.frombuffer(bits.to_bytes((size + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder="little")[:size])
+
+
+class TagQueryIndex:
+    """
+    MediaStore に対するタグ・日付のビットセットインデックス
+    - タグごとに、そのタグを持つファイルの通し番号のビットセットを保持
+    - タグ変更は mark_tags_changed で受け取り、次回の評価時にタグ単位でまとめて反映
+    - レコードの追加・削除は add_records / remove_records で差分反映（ストア全体は走査しない）
+    """
+
+    def __init__(self, store):
+        """
+        初期化
+
+        Args:
+            store: 対象の MediaStore
+        """
+        self.store = store
+        self._pending = []  # 未反映のタグ変更 (通し番号, 変更前タグ, 変更後タグ)
+        self._date_cache = None  # 直近の日付範囲とそのビットセット
+        self._date_buckets = None  # タイムライン表示用の日・月の区間インデックス（遅延構築）
+        self._build()
+
+    def _build(self):
+        """ストア全体からインデックスを構築"""
+        size = self.store.ordinal_count
+        created = np.zeros(size, dtype=np.int64)
+        live = np.zeros(size, dtype=bool)
+        tag_ordinals = collections.defaultdict(list)
+        untagged = []
+
+        for record in self.store.values():
+            ordinal = record.ordinal
+            created[ordinal] = record.created
+            live[ordinal] = True
+            if record.tags:
+                for tag in record.tags:
+                    tag_ordinals[tag].append(ordinal)
+            else:
+                untagged.append(ordinal)
+
+        self.size = size
+        self._created = created
+        self._live = live
+        self.all_bits = _bits_from_bool(live)
+        self._tag_bits = {tag: _bits_from_ordinals(ordinals, size) for tag, ordinals in tag_ordinals.items()}
+        self._untagged_bits = _bits_from_ordinals(untagged, size)
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def mark_tags_changed(self, ordinal, old_tags, new_tags):
+        """タグ変更を登録（反映は次回の評価時にまとめて行う）"""
+        self._pending.append((ordinal, old_tags, new_tags))
+
+    def add_records(self, records):
+        """
+        ストアに追加されたレコードを反映（通し番号の上限まで配列を広げる）
+
+        Args:
+            records: 追加した MediaRecord のリスト（インデックスに未登録のもの）
+        """
+        self._flush()
+        size = self.store.ordinal_count
+        if size > self.size:
+            self._created = np.concatenate([self._created, np.zeros(size - self.size, dtype=np.int64)])
+            self._live = np.concatenate([self._live, np.zeros(size - self.size, dtype=bool)])
+            self.size = size
+        tag_ordinals, untagged = self._group_by_tag(records)
+        for record in records:
+            self._created[record.ordinal] = record.created
+            self._live[record.ordinal] = True
+        self.all_bits |= _bits_from_ordinals([r.ordinal for r in records], size)
+        for tag, ordinals in tag_ordinals.items():
+            self._tag_bits[tag] = self._tag_bits.get(tag, 0) | _bits_from_ordinals(ordinals, size)
+        if untagged:
+            self._untagged_bits |= _bits_from_ordinals(untagged, size)
+        self._date_cache = None
+        self._date_buckets = None
+
+    def remove_records(self, records):
+        """
+        ストアから削除されたレコードを反映
+
+        Args:
+            records: 削除した MediaRecord のリスト（削除時点のタグを持つもの）
+        """
+        self._flush()
+        tag_ordinals, untagged = self._group_by_tag(records)
+        for record in records:
+            self._live[record.ordinal] = False
+        self.all_bits &= ~_bits_from_ordinals([r.ordinal for r in records], self.size)
+        for tag, ordinals in tag_ordinals.items():
+            bits = self._tag_bits.get(tag, 0) & ~_bits_from_ordinals(ordinals, self.size)
+            if bits:
+                self._tag_bits[tag] = bits
+            else:
+                self._tag_bits.pop(tag, None)
+        if untagged:
+            self._untagged_bits &= ~_bits_from_ordinals(untagged, self.size)
+        self._date_cache = None
+        self._date_buckets = None
+
+    def tag_bits(self, tag):
+        """タグのビットセットを取得（存在しないタグは0）"""
+        self._flush()
+        return self._tag_bits.get(tag, 0)
+
+    def untagged_bits(self):
+        """タグなしファイルのビットセットを取得"""
+        self._flush()
+        return self._untagged_bits
+
+    def tags(self):
+        """インデックス内の全タグ"""
+        self._flush()
+        return self._tag_bits.keys()
+
+    def date_bits(self, date_range):
+        """
+        日付範囲に含まれるファイルのビットセットを取得
+
+        Args:
+            date_range: (from_date, to_date) の datetime.date タプル（None の場合は全件）
+        """
+        if date_range is None:
+            return self.all_bits
+        if self._date_cache is not None and self._date_cache[0] == date_range:
+            return self._date_cache[1]
+
+        from_date, to_date = date_range
+        from_ts = datetime.datetime.combine(from_date, datetime.time.min).timestamp()
+        to_ts = datetime.datetime.combine(to_date + datetime.timedelta(days=1), datetime.time.min).timestamp()
+        in_range = (self._created >= from_ts) & (self._created < to_ts)
+        bits = _bits_from_bool(in_range) & self.all_bits
+        self._date_cache = (date_range, bits)
+        return bits
+
+    def date_buckets(self):
+        """タイムライン表示用の日・月の区間インデックスを取得（初回呼び出し時に構築）"""
+        if self._date_buckets is None:
+            self._date_buckets = DateBucketIndex(self._created, self._live)
+        return self._date_buckets
+
+    def evaluate(self, node, date_range=None, name_text=""):
+        """
+        構文木を評価して合致するファイルのビットセットを返す
+
+        Args:
+            node: parse_query / selection_to_query の構文木（None は全件）
+            date_range: 日付範囲（None は全期間）
+            name_text: ファイル名に含まれる文字列（空の場合は絞り込まない）
+        """
+        self._flush()
+        bits = self.date_bits(date_range)
+        if node is not None:
+            bits &= self._eval(node)
+        if bits and name_text.strip():
+            bits &= self.name_bits(name_text)
+        return bits
+
+    def name_bits(self, name_text):
+        """ファイル名に文字列を含むファイルのビットセットを取得（3-gramインデックスで検索）"""
+        ordinals = self.store.name_index().search(name_text)
+        if ordinals is None:
+            return self.all_bits
+        return _bits_from_ordinals(ordinals, self.size) & self.all_bits
+
+    def facet_counts(self, bits):
+        """
+        現在の絞り込み結果に対して、各タグをさらにANDした場合の件数を集計
+        （ビットセットの積のビット数を数えるだけで、レコードは走査しない）
+
+        Args:
+            bits: 現在の絞り込み結果のビットセット
+
+        Returns:
+            dict: タグ名: 件数（「タグなし」はconstants.NONE_TAG_TEXTのキー）
+        """
+        self._flush()
+        counts = {tag: (bits & tag_bits).bit_count() for tag, tag_bits in self._tag_bits.items()}
+        counts[constants.NONE_TAG_TEXT] = (bits & self._untagged_bits).bit_count()
+        return counts
+
+    def ordinals(self, bits):
+        """ビットセットを通し番号の昇順配列に変換"""
+        return bits_to_ordinals(bits, self.size)
+
+    def bits(self, ordinals):
+        """通し番号の配列をビットセットに変換"""
+        return _bits_from_ordinals(ordinals, self.size)
+
+    def records(self, bits):
+        """ビットセットに含まれるレコードを通し番号順で取得"""
+        record_at = self.store.record_at
+        return [record_at(ordinal) for ordinal in self.ordinals(bits).tolist()]
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _eval(self, node):
+        """構文木を再帰的に評価"""
+        op = node[0]
+        if op == "tag":
+            if node[1] == constants.NONE_TAG_TEXT:
+                return self._untagged_bits
+            return self._tag_bits.get(node[1], 0)
+        if op == "untagged":
+            return self._untagged_bits
+        if op == "and":
+            left = self._eval(node[1])
+            return left & self._eval(node[2]) if left else 0
+        if op == "or":
+            return self._eval(node[1]) | self._eval(node[2])
+        if op == "not":
+            return self.all_bits & ~self._eval(node[1])
+        raise TagQueryError(f"不明な演算子: {op}")
+
+    @staticmethod
+    def _group_by_tag(records):
+        """レコードの通し番号をタグごとにまとめる（タグなしは別のリスト）"""
+        tag_ordinals = collections.defaultdict(list)
+        untagged = []
+        for record in records:
+            if record.tags:
+                for tag in record.tags:
+                    tag_ordinals[tag].append(record.ordinal)
+            else:
+                untagged.append(record.ordinal)
+        return tag_ordinals, untagged
+
+    def _flush(self):
+        """未反映のタグ変更をタグ単位でまとめてビットセットに反映"""
+        if not self._pending:
+            return
+        added = collections.defaultdict(list)
+        removed = collections.defaultdict(list)
+        untagged_added, untagged_removed = [], []
+
+        for ordinal, old_tags, new_tags in self._pending:
+            old_set, new_set = set(old_tags), set(new_tags)
+            for tag in new_set - old_set:
+                added[tag].append(ordinal)
+            for tag in old_set - new_set:
+                removed[tag].append(ordinal)
+            if old_set and not new_set:
+                untagged_added.append(ordinal)
+            elif new_set and not old_set:
+                untagged_removed.append(ordinal)
+        self._pending = []
+
+        for tag in added.keys() | removed.keys():
+            bits = self._tag_bits.get(tag, 0)
+            if tag in removed:
+                bits &= ~_bits_from_ordinals(removed[tag], self.size)
+            if tag in added:
+                bits |= _bits_from_ordinals(added[tag], self.size)
+            if bits:
+                self._tag_bits[tag] = bits
+            else:
+                self._tag_bits.pop(tag, None)
+
+        if untagged_removed:
+            self._untagged_bits &= ~_bits_from_ordinals(untagged_removed, self.size)
+        if untagged_added:
+            self._untagged_bits |= _bits_from_ordinals(untagged_added, self.size)
+
+
+def query(store, text, date_range=None, name_text=""):
+    """
+    検索式でファイルを検索（Python API）
+
+    Args:
+        store: MediaStore
+        text: 検索式（例: "(A OR B) NOT C"）
+        date_range: (from_date, to_date) の datetime.date タプル（省略時は全期間）
+        name_text: ファイル名に含まれる文字列（省略時は絞り込まない）
+
+    Returns:
+        list: 合致したファイル名（通し番号順）
+    """
+    index = store.query_index()
+    bits = index.evaluate(parse_query(text), date_range, name_text)
+    return [record.name for record in index.records(bits)]
+
+
+def _benchmark(count=200_000):
+    """200k件規模での検索式の評価時間を計測する"""
+    import random
+    import time
+    from media_store import MediaStore
+
+    rng = random.Random(0)
+    tag_pool = [f"tag{i}" for i in range(200)]
+    store = MediaStore()
+    for i in range(count):
+        store.add(f"IMG_{i:07d}.jpg", 1_500_000_000 + i * 600, rng.sample(tag_pool, rng.randint(0, 4)))
+
+    start = time.perf_counter()
+    index = store.query_index()
+    print(f"インデックス構築: {(time.perf_counter() - start) * 1000:.1f} ms ({count} 件)")
+
+    text = "(tag1 OR tag2 OR tag3) AND NOT (tag4 OR tag5) AND (tag6 OR NOT tag7)"
+    date_range = (datetime.date(2018, 1, 1), datetime.date(2019, 12, 31))
+    node = parse_query(text)
+    start = time.perf_counter()
+    for _ in range(100):
+        bits = index.evaluate(node, date_range)
+    elapsed = (time.perf_counter() - start) * 10
+    print(f"検索式の評価: {elapsed:.2f} ms/回 ({bits.bit_count()} 件合致)")
+
+    start = time.perf_counter()
+    records = index.records(bits)
+    print(f"レコード取得: {(time.perf_counter() - start) * 1000:.2f} ms ({len(records)} 件)")
+
+    start = time.perf_counter()
+    counts = index.facet_counts(index.evaluate(parse_query("tag1"), date_range))
+    print(f"ファセット件数: {(time.perf_counter() - start) * 1000:.2f} ms ({len(counts)} タグ)")
+
+
+if __name__ == "__main__":
+    # 使い方: python src/tag_query.py [件数]
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
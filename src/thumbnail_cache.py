@@ -0,0 +1,541 @@
+# --- サムネイルキャッシュ ---
+# 共有サムネイルキャッシュ: ファイル内容のフィンガープリントとサムネイル設定をキーに、全フォルダ共通でサムネイルを保存する
+# SQLite(WAL) を使うため、複数のアプリインスタンス・スレッドから同時にアクセスしても安全
+# メモリキャッシュ: デコード済みのサムネイルを上限サイズ付きで保持する
+# 生画素タイルキャッシュ: サムネイルを固定サイズのRGBタイルとしてメモリマップしたファイルに保存し、
+#   JPEGのデコードなしで表示用の画像を作る（ディスク使用量と引き換え。constants.RAW_TILE_CACHE_ENABLED で有効化）
+
+import os
+import mmap
+import time
+import struct
+import sqlite3
+import hashlib
+import threading
+import collections
+from PIL import Image
+import constants
+
+
+class SharedThumbnailCache:
+    """
+    ユーザー単位の共有サムネイルキャッシュ
+    - キー: ファイル内容のフィンガープリント + サムネイルのサイズ・形式・品質
+    - 値: エンコード済みのサムネイル画像バイト列
+    - 上限サイズを超えたら最終アクセスの古い順に削除
+    """
+
+    # 何回書き込むごとに合計サイズを確認するか
+    _EVICT_CHECK_INTERVAL = 64
+    # 整理時に1トランザクションで削除する件数・解放するページ数（他の読み書きを長く待たせない）
+    _DELETE_BATCH = 256
+    _VACUUM_PAGES = 1024
+
+    def __init__(self, db_path, max_bytes=constants.SHARED_THUMBNAIL_CACHE_MAX_BYTES):
+        """
+        初期化
+
+        Args:
+            db_path: キャッシュDBのパス
+            max_bytes: キャッシュの上限サイズ（バイト）
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._local = threading.local()  # スレッドごとの接続
+        self._put_count = 0
+        self._count_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                " key TEXT PRIMARY KEY,"
+                " data BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON thumbnails(last_access)")
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    @staticmethod
+    def make_key(fingerprint, size=constants.THUMBNAIL_SIZE,
+                 fmt=constants.THUMBNAIL_FORMAT, quality=constants.THUMBNAIL_QUALITY):
+        """フィンガープリントとサムネイル設定からキャッシュキーを作成"""
+        return f"{fingerprint}:{size[0]}x{size[1]}:{fmt}:{quality}"
+
+    @classmethod
+    def make_storyboard_key(cls, fingerprint, frames=constants.STORYBOARD_FRAMES):
+        """動画のストーリーボード（複数フレームを横に並べた1枚の画像）のキャッシュキーを作成"""
+        return f"{cls.make_key(fingerprint)}:storyboard{frames}"
+
+    def get(self, key):
+        """
+        サムネイルを取得
+
+        Returns:
+            bytes: サムネイル画像のバイト列（存在しない場合None）
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT data FROM thumbnails WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            # 最終アクセス時刻の更新は失敗しても読み込み結果に影響しない
+            try:
+                with conn:
+                    conn.execute("UPDATE thumbnails SET last_access = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.OperationalError:
+                pass
+            return bytes(row[0])
+        except sqlite3.Error as e:
+            print(f"共有サムネイルキャッシュの読み込みエラー: {e}")
+            return None
+
+    def put(self, key, data):
+        """サムネイルを保存（上限を超えた場合は古いものから削除）"""
+        if not data:
+            return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO thumbnails (key, data, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(data), len(data), time.time()),
+                )
+        except sqlite3.Error as e:
+            print(f"共有サムネイルキャッシュの書き込みエラー: {e}")
+            return
+
+        with self._count_lock:
+            self._put_count += 1
+            check = self._put_count % self._EVICT_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+
+    def total_bytes(self):
+        """キャッシュの合計サイズ（バイト）を取得"""
+        conn = self._connect()
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnails").fetchone()[0]
+
+    def evict(self):
+        """
+        上限サイズを超えていれば、最終アクセスの古い順に削除
+
+        Returns:
+            int: 削除したバイト数
+        """
+        try:
+            conn = self._connect()
+            # 他のインスタンスと同時に削除しないよう書き込みロックを取得してから判定
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnails").fetchone()[0]
+                if total <= self.max_bytes:
+                    conn.execute("COMMIT")
+                    return 0
+
+                target = total - int(self.max_bytes * constants.SHARED_THUMBNAIL_CACHE_EVICT_RATIO)
+                reclaimed = 0
+                keys = []
+                for key, size in conn.execute("SELECT key, size FROM thumbnails ORDER BY last_access"):
+                    keys.append((key,))
+                    reclaimed += size
+                    if reclaimed >= target:
+                        break
+                conn.executemany("DELETE FROM thumbnails WHERE key = ?", keys)
+                conn.execute("COMMIT")
+                return reclaimed
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"共有サムネイルキャッシュの整理エラー: {e}")
+            return 0
+
+    def entries(self):
+        """
+        全エントリのキー・サイズ・最終アクセス時刻を取得（画像データは読まない）
+
+        Returns:
+            list: (キー, サイズ, 最終アクセス時刻) のリスト
+        """
+        conn = self._connect()
+        return conn.execute("SELECT key, size, last_access FROM thumbnails").fetchall()
+
+    def delete(self, keys):
+        """
+        エントリを削除（少しずつ別のトランザクションで削除し、他のインスタンスの読み書きを妨げない）
+
+        Returns:
+            int: 削除した件数
+        """
+        keys = list(keys)
+        deleted = 0
+        conn = self._connect()
+        for start in range(0, len(keys), self._DELETE_BATCH):
+            batch = [(key,) for key in keys[start:start + self._DELETE_BATCH]]
+            try:
+                with conn:
+                    conn.executemany("DELETE FROM thumbnails WHERE key = ?", batch)
+                deleted += len(batch)
+            except sqlite3.Error as e:
+                print(f"共有サムネイルキャッシュの削除エラー: {e}")
+                break
+        return deleted
+
+    def file_bytes(self):
+        """DBファイルとWALファイルの合計サイズ（バイト）"""
+        total = 0
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def compact(self, full=False):
+        """
+        削除で空いた領域をファイルから解放する
+        - 通常は incremental_vacuum で少しずつ解放する（WALのため読み込み側は待たされない）
+        - 増分解放に対応していない既存のDB（auto_vacuum=NONE）は full=True の場合だけ VACUUM で作り直す
+          （VACUUM の間は他のインスタンスの書き込みが待たされるため、コマンドラインからの実行を想定）
+
+        Returns:
+            int: 解放したバイト数
+        """
+        before = self.file_bytes()
+        try:
+            conn = self._connect()
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                for _ in range(-(-free_pages // self._VACUUM_PAGES)):
+                    # executescript は1ページずつではなく指定ページ数を最後まで処理する
+                    conn.executescript(f"PRAGMA incremental_vacuum({self._VACUUM_PAGES});")
+            elif full:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            print(f"共有サムネイルキャッシュの圧縮エラー: {e}")
+        return max(0, before - self.file_bytes())
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _connect(self):
+        """スレッドごとのSQLite接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            # 新規作成時だけ有効（テーブル作成前に設定する必要がある）。削除後の領域を compact で少しずつ解放できる
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+class MemoryThumbnailCache:
+    """
+    デコード済みサムネイル（PIL.Image）のメモリキャッシュ
+    - 画素数から見積もったサイズの合計が上限を超えたら、使われていない順に破棄
+    - 辞書と同じ操作（in, [], get, pop, clear）で使える
+    """
+
+    def __init__(self, max_bytes=constants.MEMORY_THUMBNAIL_CACHE_MAX_BYTES):
+        """
+        初期化
+
+        Args:
+            max_bytes: キャッシュの上限サイズ（バイト）
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._images = collections.OrderedDict()  # キー: (画像, サイズ)
+
+    @staticmethod
+    def _image_bytes(img):
+        """画像のメモリ使用量の見積もり"""
+        return img.width * img.height * len(img.getbands())
+
+    def __contains__(self, key):
+        return key in self._images
+
+    def __len__(self):
+        return len(self._images)
+
+    def __getitem__(self, key):
+        img, _ = self._images[key]
+        self._images.move_to_end(key)
+        return img
+
+    def __setitem__(self, key, img):
+        if key in self._images:
+            self.total_bytes -= self._images.pop(key)[1]
+        size = self._image_bytes(img)
+        self._images[key] = (img, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self._images) > 1:
+            _, (_, evicted) = self._images.popitem(last=False)
+            self.total_bytes -= evicted
+
+    def get(self, key, default=None):
+        return self[key] if key in self._images else default
+
+    def pop(self, key, default=None):
+        if key not in self._images:
+            return default
+        img, size = self._images.pop(key)
+        self.total_bytes -= size
+        return img
+
+    def clear(self):
+        self._images.clear()
+        self.total_bytes = 0
+
+
+class RawTileCache:
+    """
+    ファイルの通し番号（MediaRecord.ordinal）で引く、デコード済みサムネイルのタイルキャッシュ
+    - ファイル先頭のヘッダの後に、通し番号順に固定長のスロットが並ぶ
+    - スロット = スロットヘッダ（幅, 高さ, 検証キー） + THUMBNAIL_SIZE 分のRGB画素
+    - 検証キーにはファイルハッシュを使い、同じ通し番号に別のファイルが入った場合は読み捨てる
+    - 読み出しはメモリマップの該当範囲から Image.frombuffer で直接画像を作る
+      （RGBはPillow内部の4バイト/画素への展開が唯一のコピーで、PhotoImageへはそのまま渡せる）
+    - 容量が足りなくなったらファイルを倍に拡張してマップし直す
+    """
+
+    _MAGIC = b"TKTILE01"
+    _HEADER = struct.Struct("<8sHH")  # マジック, タイルの幅, 高さ
+    _HEADER_SIZE = 64
+    _SLOT_HEADER = struct.Struct("<HHB16s")  # 幅, 高さ, 検証キーの長さ, 検証キー
+    _SLOT_WIDTH = struct.Struct("<H")  # スロットヘッダ先頭の幅（0 は空きスロット）
+    _SLOT_HEADER_SIZE = 32
+    _INITIAL_SLOTS = 256
+
+    def __init__(self, path, tile_size=constants.THUMBNAIL_SIZE):
+        """
+        初期化（ファイルがなければ作成、タイルサイズが変わっていれば作り直す）
+
+        Args:
+            path: タイルファイルのパス
+            tile_size: タイルの最大サイズ (幅, 高さ)
+        """
+        self.path = path
+        self.tile_size = tuple(tile_size)
+        self.slot_size = self._SLOT_HEADER_SIZE + self.tile_size[0] * self.tile_size[1] * 3
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = self._HEADER.pack(self._MAGIC, *self.tile_size).ljust(self._HEADER_SIZE, b"\0")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, "r+b")
+        current = self._file.read(self._HEADER_SIZE)
+        if current != header:
+            # 新規作成、またはタイルサイズ・形式が変わった場合は空にする
+            self._file.seek(0)
+            self._file.truncate(0)
+            self._file.write(header)
+            self._file.truncate(self._HEADER_SIZE + self.slot_size * self._INITIAL_SLOTS)
+            self._file.flush()
+        # 最後に使った日時を更新時刻に記録（キャッシュ整理で長く使われていないファイルを削除する）
+        os.utime(path)
+        self._map()
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def get(self, ordinal, key):
+        """
+        タイルを画像として取得
+
+        Args:
+            ordinal: ファイルの通し番号
+            key: 検証キー（ファイルハッシュのバイト列）
+
+        Returns:
+            PIL.Image: RGB画像。ない場合・キーが一致しない場合None
+        """
+        if not key or ordinal >= self.capacity:
+            return None
+        offset = self._HEADER_SIZE + ordinal * self.slot_size
+        with self._lock:
+            if self._mm is None:
+                return None
+            width, height, key_len, stored = self._SLOT_HEADER.unpack_from(self._mm, offset)
+            if not width or stored[:key_len] != key[:16]:
+                return None
+            start = offset + self._SLOT_HEADER_SIZE
+            with memoryview(self._mm)[start:start + width * height * 3] as pixels:
+                return Image.frombuffer("RGB", (width, height), pixels, "raw", "RGB", 0, 1)
+
+    def put(self, ordinal, key, img):
+        """
+        画像をタイルとして保存（タイルサイズより大きい画像・検証キーがない場合は保存しない）
+
+        Args:
+            ordinal: ファイルの通し番号
+            key: 検証キー（ファイルハッシュのバイト列）
+            img: サムネイル画像
+        """
+        if not key or img.width > self.tile_size[0] or img.height > self.tile_size[1]:
+            return
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        pixels = img.tobytes()
+        key = key[:16]
+        with self._lock:
+            if self._mm is None:
+                return
+            if ordinal >= self.capacity:
+                self._grow(ordinal + 1)
+            offset = self._HEADER_SIZE + ordinal * self.slot_size
+            start = offset + self._SLOT_HEADER_SIZE
+            # 先に幅を0にしてスロットを無効にし、画素を書き終えてから新しいヘッダを書く
+            # （書き込み中にプロセスが終了した場合や、同じファイルをマップした別のプロセスから読んだ場合に、
+            #   前のファイルの検証キーで書きかけの画素を読まない）
+            self._SLOT_WIDTH.pack_into(self._mm, offset, 0)
+            self._mm[start:start + len(pixels)] = pixels
+            self._SLOT_HEADER.pack_into(self._mm, offset, img.width, img.height, len(key), key)
+
+    def close(self):
+        """メモリマップとファイルを閉じる（内容はOSが書き戻す。以降の get / put は何もしない）"""
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+                self._file.close()
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _map(self):
+        """ファイル全体をメモリマップし、スロット数を求める"""
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self.capacity = (size - self._HEADER_SIZE) // self.slot_size
+
+    def _grow(self, min_slots):
+        """スロット数が min_slots 以上になるまでファイルを倍に拡張してマップし直す"""
+        slots = max(self.capacity, self._INITIAL_SLOTS)
+        while slots < min_slots:
+            slots *= 2
+        self._mm.close()
+        self._file.truncate(self._HEADER_SIZE + self.slot_size * slots)
+        self._map()
+
+
+_shared_cache = None
+_shared_cache_failed = False  # 開けなかった場合は以降再試行しない
+_shared_cache_lock = threading.Lock()
+
+
+def get_user_cache_dir():
+    """ユーザー単位のキャッシュディレクトリ（$XDG_CACHE_HOME / %LOCALAPPDATA%）を返す"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, constants.APP_DIR_NAME)
+
+
+def get_shared_cache():
+    """
+    共有サムネイルキャッシュを取得（無効化されている・開けない場合はNone）
+    """
+    global _shared_cache, _shared_cache_failed
+    if not constants.SHARED_THUMBNAIL_CACHE_ENABLED or _shared_cache_failed:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                db_path = os.path.join(get_user_cache_dir(), constants.SHARED_THUMBNAIL_CACHE_DB)
+                _shared_cache = SharedThumbnailCache(db_path)
+            except Exception as e:
+                print(f"共有サムネイルキャッシュを開けません: {e}")
+                _shared_cache_failed = True
+                return None
+        return _shared_cache
+
+
+def open_tile_cache(folder_key):
+    """
+    フォルダ（ライブラリ表示は空文字）用の生画素タイルキャッシュを開く
+
+    Returns:
+        RawTileCache: 無効化されている・開けない場合None
+    """
+    if not constants.RAW_TILE_CACHE_ENABLED:
+        return None
+    name = hashlib.sha1(os.path.abspath(folder_key).encode("utf-8") if folder_key else b"library").hexdigest()
+    path = os.path.join(get_user_cache_dir(), constants.RAW_TILE_CACHE_DIR, name + ".tiles")
+    try:
+        return RawTileCache(path)
+    except Exception as e:
+        print(f"タイルキャッシュを開けません: {e}")
+        return None
+
+
+def _benchmark(count=2000):
+    """
+    サムネイル count 件の取得時間を比較する
+    - base64 + JPEG: JSONの文字列からデコードする場合
+    - JPEG: レコードに保持したバイト列からデコードする場合（現在の表示経路）
+    - 生画素タイル: RawTileCache から読み出す場合
+    """
+    import io
+    import base64
+    import random
+    import tempfile
+
+    rng = random.Random(0)
+    width, height = constants.THUMBNAIL_SIZE
+    jpegs = []
+    for i in range(count):
+        # 写真に近い圧縮率になるよう、ノイズを含む画像を使う
+        img = Image.effect_noise((width, height * 3 // 4), 40 + i % 30).convert("RGB")
+        img = Image.blend(img, Image.new("RGB", img.size, (rng.randrange(256), 120, 60)), 0.5)
+        buf = io.BytesIO()
+        img.save(buf, constants.THUMBNAIL_FORMAT, quality=constants.THUMBNAIL_QUALITY)
+        jpegs.append(buf.getvalue())
+    encoded = [base64.b64encode(data).decode("ascii") for data in jpegs]
+    keys = [hashlib.md5(data).digest() for data in jpegs]
+
+    def decode(data):
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tiles = RawTileCache(os.path.join(tmp, "bench.tiles"))
+        for ordinal, data in enumerate(jpegs):
+            tiles.put(ordinal, keys[ordinal], decode(data))
+
+        results = {}
+        for label, load in (
+            ("base64 + JPEG", lambda i: decode(base64.b64decode(encoded[i]))),
+            ("JPEG", lambda i: decode(jpegs[i])),
+            ("生画素タイル", lambda i: tiles.get(i, keys[i])),
+        ):
+            start = time.perf_counter()
+            for i in range(count):
+                load(i)
+            results[label] = (time.perf_counter() - start) / count * 1_000_000
+            print(f"{label:>14}: {results[label]:7.1f} µs/件")
+
+        disk = os.path.getsize(tiles.path)
+        print(f"ディスク使用量: JPEG {sum(map(len, jpegs)) / 1024 / 1024:.1f} MB, "
+              f"タイル {disk / 1024 / 1024:.1f} MB ({count} 件)")
+        tiles.close()
+
+
+if __name__ == "__main__":
+    # 使い方: python src/thumbnail_cache.py [件数]
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,212 @@
+# --- サムネイル読み込みスケジューラ ---
+# サムネイルのデコード・生成処理をワーカースレッドで実行する
+# 表示中の範囲（ビューポート）に近いセルから順に処理し、スクロールに追従して優先順位を変える
+
+import queue
+import bisect
+import threading
+import collections
+import constants
+
+
+class ThumbnailScheduler:
+    """
+    ビューポートからの距離を優先度とするジョブスケジューラ
+    - ジョブは表示順の位置（セルのインデックス）と共に登録する
+    - 取り出し時に現在のビューポートに最も近いジョブを選ぶため、スクロール時の再計算が不要
+    - 絞り込み結果から外れたジョブは後回し（バックグラウンド）に移す
+    - 結果はメインスレッドから poll_results で受け取る（tkinterはメインスレッドでのみ操作可能）
+    """
+
+    def __init__(self, workers=constants.THUMBNAIL_WORKERS):
+        """
+        初期化
+
+        Args:
+            workers: ワーカースレッド数
+        """
+        self._cond = threading.Condition()
+        self._jobs = {}  # キー: ジョブ（引数なしの関数）
+        self._positions = {}  # キー: 表示位置（前面のジョブのみ）
+        self._sorted = []  # 前面のジョブの (表示位置, キー) の昇順リスト
+        self._background = collections.OrderedDict()  # 後回しのジョブのキー
+        self._viewport = (0, 0)  # 表示中の位置の範囲 (先頭, 末尾)
+        self._direction = 1  # スクロール方向（1: 下方向、-1: 上方向）
+        self._results = queue.Queue()
+        self._running = True
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"thumbnail-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def submit(self, key, job, position):
+        """
+        ジョブを登録（同じキーのジョブがあれば位置だけ更新）
+
+        Args:
+            key: ジョブのキー（ファイル名）
+            job: ワーカースレッドで実行する引数なしの関数
+            position: 表示順の位置
+        """
+        with self._cond:
+            self._jobs[key] = job
+            self._set_position(key, position)
+            self._cond.notify()
+
+    def update_positions(self, positions):
+        """
+        表示位置をまとめて更新（再描画で並びが変わった場合）
+        - positions に含まれない未処理ジョブは後回しにする
+
+        Args:
+            positions: キー: 表示位置 の辞書
+        """
+        with self._cond:
+            self._background.clear()
+            self._positions = {}
+            for key in self._jobs:
+                if key in positions:
+                    self._positions[key] = positions[key]
+                else:
+                    self._background[key] = None
+            self._sorted = sorted((pos, key) for key, pos in self._positions.items())
+
+    def deprioritize(self, key):
+        """ジョブを後回しにする（絞り込み結果から外れた場合）"""
+        with self._cond:
+            if key not in self._jobs or key in self._background:
+                return
+            self._remove_position(key)
+            self._background[key] = None
+
+    def retain(self, keys):
+        """
+        前面のジョブのうち keys に含まれないものを取り消す
+        （先読み範囲から外れたジョブの破棄。後回しのジョブはそのまま）
+
+        Args:
+            keys: 残すジョブのキーの集合
+        """
+        with self._cond:
+            for key in [k for k in self._positions if k not in keys]:
+                self._remove_position(key)
+                del self._jobs[key]
+
+    def cancel(self, key):
+        """未処理のジョブを取り消す"""
+        with self._cond:
+            if self._jobs.pop(key, None) is not None:
+                self._remove_position(key)
+                self._background.pop(key, None)
+
+    def set_viewport(self, first, last, direction=1):
+        """
+        表示中の位置の範囲を設定（次に取り出すジョブから反映）
+
+        Args:
+            first: 表示中（先読み範囲を含む）の先頭位置
+            last: 表示中（先読み範囲を含む）の末尾位置
+            direction: スクロール方向。範囲内は 1 なら先頭から、-1 なら末尾から順に処理
+        """
+        with self._cond:
+            self._viewport = (first, last)
+            self._direction = -1 if direction < 0 else 1
+
+    def pending_count(self):
+        """未処理のジョブ数"""
+        with self._cond:
+            return len(self._jobs)
+
+    def poll_results(self, max_items=50):
+        """
+        完了したジョブの結果を取得（メインスレッドから呼ぶ）
+
+        Returns:
+            list: (キー, 結果, 例外) のリスト
+        """
+        results = []
+        try:
+            while len(results) < max_items:
+                results.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        return results
+
+    def shutdown(self):
+        """ワーカースレッドを停止（未処理のジョブは破棄）"""
+        with self._cond:
+            self._running = False
+            self._jobs.clear()
+            self._positions.clear()
+            self._sorted.clear()
+            self._background.clear()
+            self._cond.notify_all()
+
+    # ===============================
+    # 内部メソッド（プライベート）
+    # ===============================
+
+    def _set_position(self, key, position):
+        """前面のジョブとして表示位置を設定"""
+        self._remove_position(key)
+        self._background.pop(key, None)
+        self._positions[key] = position
+        bisect.insort(self._sorted, (position, key))
+
+    def _remove_position(self, key):
+        """前面のジョブの表示位置を削除"""
+        position = self._positions.pop(key, None)
+        if position is not None:
+            idx = bisect.bisect_left(self._sorted, (position, key))
+            if idx < len(self._sorted) and self._sorted[idx] == (position, key):
+                del self._sorted[idx]
+
+    def _next_key(self):
+        """ビューポートに最も近いジョブのキーを選ぶ（ロック取得済みで呼ぶ）"""
+        if self._sorted:
+            first, last = self._viewport
+            idx = bisect.bisect_left(self._sorted, (first,))
+            after = self._sorted[idx] if idx < len(self._sorted) else None
+            before = self._sorted[idx - 1] if idx > 0 else None
+
+            # ビューポート内はスクロール方向の順、範囲外はビューポートに近い方を選ぶ
+            if self._direction < 0:
+                inner = bisect.bisect_left(self._sorted, (last + 1,)) - 1
+                if inner >= 0 and self._sorted[inner][0] >= first:
+                    return self._sorted[inner][1]
+            elif after is not None and after[0] <= last:
+                return after[1]
+            if before is None:
+                return after[1]
+            if after is None:
+                return before[1]
+            return after[1] if after[0] - last <= first - before[0] else before[1]
+
+        if self._background:
+            return next(iter(self._background))
+        return None
+
+    def _worker(self):
+        """ワーカースレッドの処理ループ"""
+        while True:
+            with self._cond:
+                while self._running and not self._jobs:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                key = self._next_key()
+                job = self._jobs.pop(key)
+                self._remove_position(key)
+                self._background.pop(key, None)
+
+            try:
+                self._results.put((key, job(), None))
+            except Exception as e:
+                self._results.put((key, None, e))
@@ -0,0 +1,164 @@
+# --- 見た目の類似検索 ---
+# 「この画像に似たもの」を、ファイルごとの小さな特徴量ベクトルの近傍探索で探す
+# - 特徴量はスキャン時に生成済みのサムネイルから計算する（元画像は読み直さない）
+#   - 色: RGB各4段階の色ヒストグラム（64次元）。割合の平方根を保存（内積がBhattacharyya係数になる）
+#   - 構図: 8x8に縮小したグレースケール（64次元）。検索時に平均を引いて正規化する（明るさの違いを無視）
+#   - 各値を0〜255に量子化した128バイトをレコード（JSONにはbase64）に保存する
+# - 検索時は全ファイルの特徴量を1つの連続した float32 行列にまとめ、行列とベクトルの積1回で類似度を求める
+#   （色と構図の類似度を VISUAL_COLOR_WEIGHT で重み付けした和、1に近いほど似ている）
+
+import io
+import numpy as np
+from PIL import Image
+import constants
+
+_COLOR_LEVELS = 4
+_GRAY_SIZE = (8, 8)
+_COLOR_DIM = _COLOR_LEVELS ** 3
+_GRAY_DIM = _GRAY_SIZE[0] * _GRAY_SIZE[1]
+DESCRIPTOR_BYTES = _COLOR_DIM + _GRAY_DIM
+
+
+def compute_descriptor(thumbnail_bytes):
+    """
+    エンコード済みサムネイルから特徴量を計算
+
+    Args:
+        thumbnail_bytes: サムネイル画像（JPEGなどのバイト列）
+
+    Returns:
+        bytes: DESCRIPTOR_BYTES バイトの特徴量（サムネイルがない・読めない場合は空のバイト列）
+    """
+    if not thumbnail_bytes:
+        return b""
+    try:
+        with Image.open(io.BytesIO(thumbnail_bytes)) as img:
+            rgb = img.convert("RGB")
+    except Exception as e:
+        print(f"特徴量の計算に失敗: {e}")
+        return b""
+
+    pixels = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3) // (256 // _COLOR_LEVELS)
+    bins = (pixels[:, 0].astype(np.int64) * _COLOR_LEVELS + pixels[:, 1]) * _COLOR_LEVELS + pixels[:, 2]
+    hist = np.bincount(bins, minlength=_COLOR_DIM) / len(bins)
+    color = np.rint(np.sqrt(hist) * 255).astype(np.uint8)
+
+    gray = np.asarray(rgb.convert("L").resize(_GRAY_SIZE, Image.Resampling.BILINEAR), dtype=np.uint8)
+    return color.tobytes() + gray.tobytes()
+
+
+def has_descriptor(record):
+    """レコードに現在の形式の特徴量があるか"""
+    return len(record.descriptor) == DESCRIPTOR_BYTES
+
+
+class VisualIndex:
+    """
+    MediaStore の全ファイルの特徴量を、通し番号を行とする連続した行列にまとめた検索インデックス
+    """
+
+    def __init__(self, store):
+        """
+        初期化（ストア全体から構築）
+
+        Args:
+            store: 対象の MediaStore
+        """
+        size = store.ordinal_count
+        raw = np.zeros((size, DESCRIPTOR_BYTES), dtype=np.uint8)
+        self.valid = np.zeros(size, dtype=bool)  # 通し番号: 特徴量があるか
+        records = [record for record in store.values() if has_descriptor(record)]
+        if records:
+            ordinals = np.array([record.ordinal for record in records], dtype=np.int64)
+            raw[ordinals] = np.frombuffer(
+                b"".join(record.descriptor for record in records), dtype=np.uint8
+            ).reshape(-1, DESCRIPTOR_BYTES)
+            self.valid[ordinals] = True
+
+        color = raw[:, :_COLOR_DIM].astype(np.float32) / 255
+        gray = raw[:, _COLOR_DIM:].astype(np.float32)
+        gray -= gray.mean(axis=1, keepdims=True)
+        _normalize_rows(color)
+        _normalize_rows(gray)
+        # 内積が「色の類似度 * 重み + 構図の類似度 * (1 - 重み)」になるよう、重みの平方根を掛けて連結
+        weight = constants.VISUAL_COLOR_WEIGHT
+        self.matrix = np.ascontiguousarray(
+            np.hstack([color * np.sqrt(weight), gray * np.sqrt(1 - weight)]), dtype=np.float32
+        )
+
+    # ===============================
+    # 公開メソッド（外部インターフェース）
+    # ===============================
+
+    def similar(self, ordinal, k=constants.VISUAL_SEARCH_LIMIT, candidates=None):
+        """
+        ファイルに似たファイルを類似度の高い順に取得（基準のファイル自身を先頭に含む）
+
+        Args:
+            ordinal: 基準のファイルの通し番号
+            k: 取得する最大件数
+            candidates: 検索対象の通し番号の配列（省略時は全ファイル）
+
+        Returns:
+            tuple: (通し番号の配列, 類似度の配列)。基準のファイルに特徴量がない場合は空の配列
+        """
+        if ordinal >= len(self.valid) or not self.valid[ordinal]:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if candidates is None:
+            candidates = np.flatnonzero(self.valid)
+        else:
+            candidates = candidates[self.valid[candidates]]
+
+        # 候補の行を取り出すと行列のコピーになるため、全行との内積を求めてから候補の分を取り出す
+        scores = (self.matrix @ self.matrix[ordinal])[candidates]
+        # 基準のファイルは常に先頭（同じ見た目の別ファイルと順番が入れ替わらないように）
+        scores[candidates == ordinal] = np.inf
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        result_scores = scores[top]
+        result_scores[np.isinf(result_scores)] = 1.0
+        return candidates[top], result_scores
+
+
+def _normalize_rows(matrix):
+    """行ごとにL2ノルムを1にする（ゼロの行はそのまま）"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+
+def _benchmark(count=100_000, queries=20):
+    """count 件の特徴量での構築時間と1回の検索時間を計測"""
+    import time
+    from media_store import MediaStore
+
+    rng = np.random.default_rng(0)
+    sample = Image.fromarray(rng.integers(0, 256, (96, 128, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    sample.save(buffer, format="JPEG")
+    start = time.perf_counter()
+    for _ in range(100):
+        compute_descriptor(buffer.getvalue())
+    print(f"特徴量の計算: {(time.perf_counter() - start) * 10:.2f} ms/件")
+
+    store = MediaStore()
+    descriptors = rng.integers(0, 256, (count, DESCRIPTOR_BYTES), dtype=np.uint8)
+    for i in range(count):
+        store.add(f"IMG_{i:07d}.jpg", 1_500_000_000 + i, descriptor=descriptors[i].tobytes())
+
+    start = time.perf_counter()
+    index = VisualIndex(store)
+    print(f"構築: {(time.perf_counter() - start) * 1000:.1f} ms ({count} 件, {index.matrix.nbytes / 2**20:.1f} MB)")
+
+    start = time.perf_counter()
+    for i in range(queries):
+        index.similar(int(rng.integers(count)))
+    print(f"検索: {(time.perf_counter() - start) * 1000 / queries:.2f} ms/回 (上位 {constants.VISUAL_SEARCH_LIMIT} 件)")
+
+
+if __name__ == "__main__":
+    # 使い方: python src/visual_index.py [件数]
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
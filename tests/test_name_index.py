@@ -0,0 +1,69 @@
+# --- ファイル名検索インデックスのテスト ---
+# 3-gramインデックスの検索結果を、全ファイル名の部分一致を調べる素朴な実装と比較する
+
+import random
+from media_store import MediaStore
+from name_index import FilenameIndex, normalize_name, normalize_text
+
+PREFIXES = ["IMG_", "DSC_", "PXL_2019", "旅行_", "Ｓｃｒｅｅｎ ", "sub/dir/IMG_", "C:\\photos\\DSC_"]
+QUERIES = ["", " ", "i", "IMG", "img_0", "12", "0123", "_2019", "旅行", "screen", "ＳＣＲ", "dir", "photos", "xyz"]
+
+
+def brute_search(store, text):
+    """ファイル名部分（フォルダを除く）に入力を含むファイルの通し番号"""
+    query = normalize_text(text.strip())
+    return [r.ordinal for r in store.values() if query in normalize_name(r.name)]
+
+
+def make_store(rng, count=500):
+    store = MediaStore()
+    for i in range(count):
+        store.add(f"{rng.choice(PREFIXES)}{rng.randrange(10**5):05d}.jpg", 0)
+    return store
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(1)
+    store = make_store(rng)
+    index = FilenameIndex(store)
+    for text in QUERIES:
+        result = index.search(text)
+        if not text.strip():
+            assert result is None
+        else:
+            assert result.tolist() == brute_search(store, text)
+
+
+def test_folder_part_is_not_searched():
+    store = MediaStore()
+    store.add("/photos/holiday/IMG_1.jpg", 0)
+    store.add("archive.zip/holiday/DSC_2.jpg", 0)
+    index = FilenameIndex(store)
+    assert index.search("holiday").tolist() == []
+    assert index.search("img_1").tolist() == [0]
+    assert index.search("dsc").tolist() == [1]
+
+
+def test_incremental_updates_match_rebuild():
+    """ストア経由の追加・削除を差分反映した結果が、作り直したインデックスと一致する"""
+    rng = random.Random(2)
+    store = make_store(rng)
+    store.name_index()
+    for _ in range(30):
+        for name in rng.sample(list(store), 10):
+            store.remove(name)
+        for _ in range(15):
+            store.add(f"{rng.choice(PREFIXES)}{rng.randrange(10**5):05d}.png", 0)
+        text = rng.choice(QUERIES[2:])
+        # 同じ入力でもキャッシュされた古い結果を返さない
+        assert store.name_index().search(text).tolist() == brute_search(store, text)
+        assert FilenameIndex(store).search(text).tolist() == brute_search(store, text)
+
+
+def test_readd_same_ordinal_updates_name():
+    store = MediaStore()
+    record = store.add("IMG_0001.jpg", 0)
+    index = FilenameIndex(store)
+    index.add(record.ordinal, "DSC_0001.jpg")
+    assert index.search("img_").tolist() == []
+    assert index.search("dsc_").tolist() == [record.ordinal]
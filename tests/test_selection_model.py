@@ -0,0 +1,88 @@
+# --- 選択範囲のモデルのテスト ---
+# RangeSelection の操作結果（選択状態・件数・変更範囲）を、位置の集合による素朴な実装と比較する
+
+import random
+import pytest
+from selection_model import RangeSelection, contains_position
+
+TOTAL = 60
+
+
+def positions_of(ranges):
+    """範囲のリストを位置の集合に展開"""
+    return {p for start, end in ranges for p in range(start, end)}
+
+
+def check_invariants(selection, model):
+    """選択状態がモデルと一致し、範囲が昇順で重なり・隣接がないこと"""
+    assert set(selection) == model
+    assert list(selection) == sorted(model)
+    assert len(selection) == len(model)
+    ranges = selection.ranges()
+    for start, end in ranges:
+        assert start < end
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end < start
+    for position in range(-1, TOTAL + 1):
+        assert (position in selection) == (position in model)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_operations_match_set_model(seed):
+    rng = random.Random(seed)
+    selection = RangeSelection()
+    model = set()
+    for _ in range(300):
+        op = rng.choice(["add", "remove", "toggle", "select_all", "invert", "clear"])
+        start = rng.randrange(TOTAL)
+        end = rng.randrange(start, TOTAL + 1)
+        if op == "add":
+            changed = selection.add_range(start, end)
+            expected = set(range(start, end)) - model
+            model |= set(range(start, end))
+        elif op == "remove":
+            changed = selection.remove_range(start, end)
+            expected = set(range(start, end)) & model
+            model -= set(range(start, end))
+        elif op == "toggle":
+            changed = selection.toggle(start)
+            expected = {start}
+            model ^= {start}
+        elif op == "select_all":
+            changed = selection.select_all(TOTAL)
+            expected = set(range(TOTAL)) - model
+            model = set(range(TOTAL))
+        elif op == "invert":
+            changed = selection.invert(TOTAL)
+            expected = set(range(TOTAL))
+            model = set(range(TOTAL)) - model
+        else:
+            changed = selection.clear()
+            expected = set(model)
+            model = set()
+        # 変更範囲は状態が変わった位置（反転は範囲全体）を昇順・重なりなしで返す
+        assert positions_of(changed) == expected
+        assert changed == sorted(changed)
+        for position in range(TOTAL):
+            assert contains_position(changed, position) == (position in expected)
+        check_invariants(selection, model)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_from_positions_and_constructor(seed):
+    rng = random.Random(seed)
+    positions = [rng.randrange(TOTAL) for _ in range(rng.randrange(TOTAL))]
+    check_invariants(RangeSelection.from_positions(positions), set(positions))
+    ranges = []
+    for _ in range(rng.randrange(10)):
+        start = rng.randrange(TOTAL)
+        ranges.append((start, rng.randrange(start, TOTAL + 1)))
+    check_invariants(RangeSelection(ranges), positions_of(ranges))
+
+
+def test_empty_ranges_are_ignored():
+    selection = RangeSelection([(5, 5), (7, 3)])
+    assert len(selection) == 0
+    assert selection.add_range(4, 4) == []
+    assert selection.remove_range(0, 10) == []
+    assert selection.invert(0) == []
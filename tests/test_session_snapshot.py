@@ -0,0 +1,88 @@
+# --- セッションのスナップショットのテスト ---
+# 保存・読み込みでメディア情報と表示状態が元に戻ること、pickleや壊れたファイルを解釈せずに捨てることを確認する
+
+import os
+import pickle
+import pytest
+import constants
+import media_fs
+import session_snapshot
+from media_store import MediaStore
+
+SESSION = {"query_text": "風景 OR 旅行", "name_text": "img", "selected_tags": ["風景"],
+           "date_range": ["2024-01-01", "2024-01-31"], "scroll": 0.25}
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    """ファイルを3件置いたフォルダ（キャッシュディレクトリも tmp_path の下に向ける）"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    path = tmp_path / "photos"
+    path.mkdir()
+    for i in range(3):
+        (path / f"IMG_{i}.jpg").write_bytes(b"x" * (i + 1))
+    return str(path)
+
+
+def make_store(folder):
+    store = MediaStore()
+    for i, name in enumerate(sorted(os.listdir(folder))):
+        signature = media_fs.stat_signature(*media_fs.stat_media(os.path.join(folder, name)))
+        store.add(name, 1700000000.5 + i, ["風景", "旅行"][:i], bytes([i]) * 8, b"\xff\xd8" * i,
+                  constants.DATE_SOURCE_CAPTURE,
+                  signature, b"\x00\x01" * (3 - i))
+    return store
+
+
+def test_roundtrip(folder):
+    store = make_store(folder)
+    session_snapshot.save(folder, store, SESSION)
+    loaded, session = session_snapshot.load(folder)
+    assert session == SESSION
+    assert [r.fields() for r in loaded.values()] == [r.fields() for r in store.values()]
+
+
+def test_changed_folder_keeps_only_session(folder):
+    session_snapshot.save(folder, make_store(folder), SESSION)
+    with open(os.path.join(folder, "IMG_9.jpg"), "wb") as f:
+        f.write(b"new")
+    os.utime(folder, ns=(0, 0))  # 更新時刻の分解能によらずシグネチャを変える
+    assert session_snapshot.load(folder) == (None, SESSION)
+
+
+class Exploit:
+    """読み込まれると印のディレクトリを作るpickle"""
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return (os.mkdir, (self.marker,))
+
+
+@pytest.mark.parametrize("content", [
+    None,  # 旧形式（pickle）: 中身はテスト内で作る
+    b"",
+    b"TKSESS03",
+    session_snapshot._HEADER.pack(session_snapshot._MAGIC, 1000) + b"{}",
+    session_snapshot._HEADER.pack(session_snapshot._MAGIC, 2) + b"[]",
+])
+def test_rejects_foreign_or_broken_files(folder, content):
+    marker = os.path.join(folder, "pwned")
+    if content is None:
+        content = pickle.dumps({"version": 2, "records": [Exploit(marker)]})
+    path = session_snapshot.snapshot_path(folder)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    assert session_snapshot.load(folder) == (None, None)
+    assert not os.path.exists(marker)
+
+
+def test_truncated_blobs_are_rejected(folder):
+    session_snapshot.save(folder, make_store(folder), SESSION)
+    path = session_snapshot.snapshot_path(folder)
+    with open(path, "rb") as f:
+        content = f.read()
+    with open(path, "wb") as f:
+        f.write(content[:-1])
+    assert session_snapshot.load(folder) == (None, SESSION)
@@ -0,0 +1,62 @@
+# --- タグ補完インデックスのテスト ---
+# 前方一致 → 部分一致の順の検索結果を、全タグを調べる素朴な実装と比較する
+
+import random
+import collections
+from tag_index import TagCompletionIndex, normalize_tag
+
+ALPHABET = "abcdeアイウ旅行ＡＢ"
+QUERIES = ["", "a", "ab", "abc", "abcd", "ア", "アイ", "旅行", "Ａ", "A", "b", "zz", " ab "]
+
+
+def brute_search(tags, text, limit=None):
+    """前方一致のタグ（キー順）→ 部分一致のタグ（キー順）"""
+    query = normalize_tag(text.strip())
+    ordered = sorted(tags, key=lambda t: (normalize_tag(t), t))
+    prefix = [t for t in ordered if normalize_tag(t).startswith(query)]
+    others = [t for t in ordered if query in normalize_tag(t) and t not in prefix]
+    result = prefix + others
+    return result if limit is None else result[:limit]
+
+
+def random_tag(rng):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 6)))
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(1)
+    tags = {random_tag(rng) for _ in range(400)}
+    index = TagCompletionIndex(tags)
+    for text in QUERIES:
+        for limit in (None, 1, 5, 50):
+            assert index.search(text, limit) == brute_search(tags, text, limit), (text, limit)
+
+
+def test_add_remove_match_rebuild():
+    rng = random.Random(2)
+    tags = {random_tag(rng) for _ in range(200)}
+    index = TagCompletionIndex(tags)
+    for _ in range(50):
+        for tag in rng.sample(sorted(tags), 5):
+            index.remove(tag)
+            tags.discard(tag)
+        for _ in range(5):
+            tag = random_tag(rng)
+            index.add(tag)
+            tags.add(tag)
+        assert len(index) == len(tags)
+        text = rng.choice(QUERIES)
+        assert index.search(text, 10) == brute_search(tags, text, 10)
+        assert index.search(text) == TagCompletionIndex(tags).search(text)
+
+
+def test_sync_counts():
+    index = TagCompletionIndex(["a", "b"])
+    counts = collections.Counter({"b": 2, "c": 1})
+    index.sync_counts(counts, ["a", "b", "c"])
+    assert "a" not in index
+    assert "b" in index and "c" in index
+    # 未登録のタグの削除・登録済みのタグの追加は何もしない
+    index.remove("zzz")
+    index.add("b")
+    assert index.search("") == ["b", "c"]
@@ -0,0 +1,196 @@
+# --- タグ検索式エンジンのテスト ---
+# 構文解析（優先順位・引用符・構文エラー）と、ビットセットでの評価結果を
+# レコードを1件ずつ調べる素朴な実装と比較する
+
+import random
+import datetime
+import pytest
+import constants
+from media_store import MediaStore
+from name_index import normalize_name, normalize_text
+from tag_query import TagQueryError, parse_query, selection_to_query, query
+
+TAGS = ["風景", "旅行", "家族", "仕事", "a b", "OR", "x"]
+BASE_TS = datetime.datetime(2024, 1, 1).timestamp()
+
+
+def make_store(rng, count=300):
+    """ランダムなタグ・日付のストア"""
+    store = MediaStore()
+    for i in range(count):
+        created = BASE_TS + rng.randrange(60 * 86400)
+        store.add(f"IMG_{i:04d}.jpg", created, rng.sample(TAGS, rng.randint(0, 3)))
+    return store
+
+
+def random_node(rng, depth=0):
+    """ランダムな構文木（タグ名には検索語・空白を含むものと「タグなし」も使う）"""
+    if depth >= 3 or rng.random() < 0.3:
+        return ("tag", rng.choice(TAGS + [constants.NONE_TAG_TEXT, "存在しない"]))
+    op = rng.choice(["and", "or", "not"])
+    if op == "not":
+        return ("not", random_node(rng, depth + 1))
+    return (op, random_node(rng, depth + 1), random_node(rng, depth + 1))
+
+
+def render(node):
+    """構文木を検索式の文字列に戻す（タグは引用符で囲み、演算は括弧で囲む）"""
+    op = node[0]
+    if op == "tag":
+        return f'"{node[1]}"'
+    if op == "not":
+        return f"NOT {render(node[1])}"
+    return f"({render(node[1])} {op.upper()} {render(node[2])})"
+
+
+def brute_match(node, tags):
+    """構文木をレコード1件のタグに対して直接評価"""
+    op = node[0]
+    if op == "tag":
+        return not tags if node[1] == constants.NONE_TAG_TEXT else node[1] in tags
+    if op == "untagged":
+        return not tags
+    if op == "not":
+        return not brute_match(node[1], tags)
+    if op == "and":
+        return brute_match(node[1], tags) and brute_match(node[2], tags)
+    return brute_match(node[1], tags) or brute_match(node[2], tags)
+
+
+def brute_filter(store, node, date_range=None, name_text=""):
+    """条件に合うファイル名を通し番号順に返す"""
+    result = []
+    for record in store.values():
+        if node is not None and not brute_match(node, record.tags):
+            continue
+        if date_range is not None and not date_range[0] <= record.created_datetime.date() <= date_range[1]:
+            continue
+        if name_text.strip() and normalize_text(name_text.strip()) not in normalize_name(record.name):
+            continue
+        result.append(record.name)
+    return result
+
+
+def random_date_range(rng):
+    start = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(60))
+    return start, start + datetime.timedelta(days=rng.randrange(20))
+
+
+# ===============================
+# 構文解析
+# ===============================
+
+@pytest.mark.parametrize("text, expected", [
+    ("a", ("tag", "a")),
+    ("a b", ("and", ("tag", "a"), ("tag", "b"))),
+    ("a AND b", ("and", ("tag", "a"), ("tag", "b"))),
+    ("a and b", ("and", ("tag", "a"), ("tag", "b"))),
+    ("a & b | c", ("or", ("and", ("tag", "a"), ("tag", "b")), ("tag", "c"))),
+    # AND は OR より強く結合する
+    ("a OR b c", ("or", ("tag", "a"), ("and", ("tag", "b"), ("tag", "c")))),
+    ("a OR b OR c", ("or", ("or", ("tag", "a"), ("tag", "b")), ("tag", "c"))),
+    # NOT は直後の1項だけにかかる
+    ("NOT a b", ("and", ("not", ("tag", "a")), ("tag", "b"))),
+    ("a NOT b", ("and", ("tag", "a"), ("not", ("tag", "b")))),
+    ("!!a", ("not", ("not", ("tag", "a")))),
+    ("(a OR b) c", ("and", ("or", ("tag", "a"), ("tag", "b")), ("tag", "c"))),
+    ("a (b OR c)", ("and", ("tag", "a"), ("or", ("tag", "b"), ("tag", "c")))),
+    # 引用符で空白・演算子・記号を含むタグ名を書ける
+    ('"a b" OR "OR"', ("or", ("tag", "a b"), ("tag", "OR"))),
+    ('"(x)"', ("tag", "(x)")),
+    ('""', ("tag", "")),
+    ("風景　旅行", ("and", ("tag", "風景"), ("tag", "旅行"))),
+])
+def test_parse_query(text, expected):
+    assert parse_query(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "   ", None])
+def test_parse_empty_query(text):
+    assert parse_query(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    '"a', "(a", "a)", "()", "a AND", "OR a", "a OR", "NOT", "a | | b", ")",
+])
+def test_parse_malformed_query(text):
+    with pytest.raises(TagQueryError):
+        parse_query(text)
+
+
+def test_selection_to_query():
+    assert selection_to_query([]) is None
+    assert selection_to_query([constants.NONE_TAG_TEXT]) == ("untagged",)
+    assert selection_to_query(["a", "b"]) == ("and", ("tag", "a"), ("tag", "b"))
+
+
+# ===============================
+# 評価
+# ===============================
+
+def test_evaluate_matches_brute_force():
+    rng = random.Random(1)
+    store = make_store(rng)
+    index = store.query_index()
+    for _ in range(300):
+        node = random_node(rng)
+        date_range = random_date_range(rng) if rng.random() < 0.5 else None
+        parsed = parse_query(render(node))
+        assert parsed == node
+        bits = index.evaluate(parsed, date_range)
+        assert [r.name for r in index.records(bits)] == brute_filter(store, node, date_range)
+
+
+def test_evaluate_with_name_filter():
+    rng = random.Random(2)
+    store = make_store(rng)
+    for name_text in ["img_00", "0012", "5.JPG", "ｉｍｇ", "zzz"]:
+        node = random_node(rng)
+        assert query(store, render(node), name_text=name_text) == brute_filter(store, node, name_text=name_text)
+
+
+def test_facet_counts_match_brute_force():
+    rng = random.Random(3)
+    store = make_store(rng)
+    index = store.query_index()
+    for _ in range(50):
+        node = random_node(rng)
+        date_range = random_date_range(rng)
+        bits = index.evaluate(node, date_range)
+        matched = [store[name] for name in brute_filter(store, node, date_range)]
+        counts = index.facet_counts(bits)
+        for tag in TAGS:
+            assert counts.get(tag, 0) == sum(tag in r.tags for r in matched)
+        assert counts[constants.NONE_TAG_TEXT] == sum(not r.tags for r in matched)
+
+
+def test_evaluate_after_store_changes():
+    """タグ変更（遅延反映）とレコードの追加・削除の差分反映後も、作り直した結果と一致する"""
+    rng = random.Random(4)
+    store = make_store(rng)
+    index = store.query_index()
+    for step in range(20):
+        for name in rng.sample(list(store), 10):
+            store.set_tags(name, rng.sample(TAGS, rng.randint(0, 3)))
+        removed = rng.sample(list(store), 5)
+        entries = [
+            (f"NEW_{step}_{i}.jpg", {
+                "createday": datetime.datetime.fromtimestamp(BASE_TS + rng.randrange(60 * 86400))
+                .strftime("%Y-%m-%d %H:%M:%S"),
+                "tags": rng.sample(TAGS, rng.randint(0, 3)),
+            })
+            for i in range(5)
+        ]
+        store.merge_json_entries(removed, entries)
+        assert store.query_index() is index
+        for _ in range(10):
+            node = random_node(rng)
+            date_range = random_date_range(rng) if rng.random() < 0.5 else None
+            bits = index.evaluate(node, date_range)
+            assert [r.name for r in index.records(bits)] == brute_filter(store, node, date_range)
+
+
+def test_unknown_tag_matches_nothing():
+    store = make_store(random.Random(5), count=20)
+    assert query(store, "存在しない") == []
+    assert query(store, "NOT 存在しない") == list(store)